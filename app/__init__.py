@@ -3,21 +3,37 @@ Flask Application Factory
 This file creates and configures your Flask web application
 """
 
+import time
+
+# Taken first so the startup report can include the time spent importing
+_IMPORT_STARTED = time.perf_counter()
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from config import config
 import os
-import logging
-from logging.handlers import RotatingFileHandler
+from app.startup import StartupTimer, record_startup
 
 # Create database instance (but don't initialize it yet)
 db = SQLAlchemy()
 
+# The import time only counts towards the first app created in a process
+_imports_timed = False
+
 def create_app(config_name=None):
     """
     Application factory function
     This creates a new Flask application instance with the specified configuration
     """
+    global _imports_timed
+    if _imports_timed:
+        timer = StartupTimer()
+    else:
+        timer = StartupTimer(started=_IMPORT_STARTED)
+        timer.mark('imports')
+        _imports_timed = True
+    
     # Create Flask app instance
     app = Flask(__name__, 
                 template_folder='../templates',
@@ -27,44 +43,86 @@ def create_app(config_name=None):
     if config_name is None:
         config_name = os.environ.get('FLASK_CONFIG', 'default')
     app.config.from_object(config[config_name])
+    timer.mark('config')
     
     # Initialize database with app
     db.init_app(app)
     
+    # Let several worker processes share one SQLite file
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            configure_sqlite(db.engine, app.config.get('SQLITE_BUSY_TIMEOUT_MS', 30000))
+        
+        # Slow query log and on-demand request profiling
+        from app.profiling import init_profiling
+        init_profiling(app)
+    timer.mark('database')
+    
     # Register blueprints (these organize your routes)
     from app.routes import main_bp
     app.register_blueprint(main_bp)
     
-    # Create database tables if they don't exist
-    with app.app_context():
-        db.create_all()
-        
-        # Initialize default shows if database is empty
-        from app.models import Show, ShowAlias
-        if Show.query.count() == 0:
-            initialize_default_shows()
+    # Register maintenance commands (flask retention ...)
+    from app.cli import register_commands
+    register_commands(app)
+    
+    # Web processes start their job workers with the first request
+    from app.scheduler import init_workers
+    init_workers(app)
+    timer.mark('blueprints')
+    
+    # Create database tables and default shows if they don't exist
+    # (with AUTO_INIT_DB off, run `flask init-db` once instead)
+    if app.config.get('AUTO_INIT_DB', True):
+        with app.app_context():
+            init_database()
+        timer.mark('init_db')
     
-    # Set up logging
+    # Set up logging - records are queued and written as JSON by a
+    # background thread, so logging never waits on the disk
     if not app.debug and not app.testing:
-        # Create logs directory if it doesn't exist
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-        
-        # Set up rotating file handler (creates new log file when size limit reached)
-        file_handler = RotatingFileHandler('logs/radio_automation.log',
-                                         maxBytes=10240000,  # 10MB
-                                         backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        
-        app.logger.setLevel(logging.INFO)
+        from app.log_pipeline import configure_logging
+        configure_logging(app)
         app.logger.info('Radio Automation System startup')
+    timer.mark('logging')
     
+    record_startup(app, timer)
     return app
 
+def init_database():
+    """
+    Create any missing tables, add columns that newer versions introduced
+    to existing ones, and add the default shows to an empty database
+    Needs an application context
+    
+    Returns:
+        True if the default shows were added
+    """
+    from app.models import Show
+    from app.schema import upgrade_schema
+    
+    db.create_all()
+    upgrade_schema(db)
+    if Show.query.count() == 0:
+        initialize_default_shows()
+        return True
+    return False
+
+def configure_sqlite(engine, busy_timeout_ms):
+    """
+    Set up every SQLite connection for use by more than one process
+    
+    WAL mode lets readers carry on while another process writes, and the
+    busy timeout makes a writer wait for the lock instead of failing
+    straight away with "database is locked".
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(connection, record):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+
 def initialize_default_shows():
     """
     Populate database with some default radio shows
@@ -0,0 +1,185 @@
+"""
+Admission Control Module for Radio Automation System
+Decides whether new work can be accepted right now, so a feed window that
+dumps hundreds of files slows the senders down instead of running the
+server out of CPU and disk
+
+Three things are checked:
+  1. Free space in UPLOAD_FOLDER and PROCESSED_FOLDER
+     (too little -> 503 Service Unavailable)
+  2. How many jobs are waiting, and how long the workers will take to get
+     through them (too many -> 429 Too Many Requests)
+  3. The size of the incoming request, against the free space
+
+Urgent files skip the queue limits (they go to the front of the queue
+anyway, so their wait stays short) and may use part of the disk reserve
+that normal files can't, so they are still accepted under overload.
+"""
+
+import os
+import math
+import time
+import shutil
+import threading
+import logging
+from app.models import ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+# Load figures are reused for this long so a flood of requests doesn't
+# turn into a flood of COUNT queries
+SNAPSHOT_SECONDS = 1.0
+
+_snapshot = {'taken': 0.0, 'config_id': None, 'value': None}
+_snapshot_lock = threading.Lock()
+
+def free_megabytes(path):
+    """Free space on the filesystem holding path, in MB (None if unknown)"""
+    try:
+        os.makedirs(path, exist_ok=True)
+        return shutil.disk_usage(path).free / (1024 * 1024)
+    except OSError as e:
+        logger.warning(f"Could not check free space for {path}: {str(e)}")
+        return None
+
+def get_load(config):
+    """
+    Current queue and disk figures (cached for SNAPSHOT_SECONDS)
+    
+    Returns:
+        Dictionary with queued, urgent_queued, running, workers,
+        seconds_per_job, backlog_seconds and free_mb per folder
+    """
+    now = time.monotonic()
+    with _snapshot_lock:
+        if _snapshot['config_id'] == id(config) and now - _snapshot['taken'] < SNAPSHOT_SECONDS:
+            return _snapshot['value']
+    
+    # Imported here to keep this module light for callers like the CLI
+    from app.scheduler import estimate_job_seconds
+    
+    workers = max(1, config.get('PROCESSING_WORKERS', 2))
+    queued = ProcessingJob.query.filter_by(status='queued').count()
+    urgent_queued = ProcessingJob.query.filter_by(status='queued', urgent=True).count()
+    running = ProcessingJob.query.filter_by(status='processing').count()
+    seconds_per_job = estimate_job_seconds()
+    
+    load = {
+        'queued': queued,
+        'urgent_queued': urgent_queued,
+        'running': running,
+        'workers': workers,
+        'seconds_per_job': round(seconds_per_job, 2),
+        'backlog_seconds': round(queued * seconds_per_job / workers),
+        'free_mb': {
+            'upload': free_megabytes(config.get('UPLOAD_FOLDER', 'uploads')),
+            'processed': free_megabytes(config.get('PROCESSED_FOLDER', 'processed'))
+        }
+    }
+    
+    with _snapshot_lock:
+        _snapshot.update(taken=now, config_id=id(config), value=load)
+    return load
+
+def check_admission(config, urgent=False, incoming_bytes=0, job_count=1):
+    """
+    Decide whether to accept new work
+    
+    Args:
+        config: Application config (ADMISSION_* settings)
+        urgent: The work is marked urgent
+        incoming_bytes: Size of what is about to be written to disk
+        job_count: Number of jobs the work adds to the queue - a batch is
+                   only accepted if all of it fits under the limits
+    
+    Returns:
+        Dictionary with:
+            - admitted: True if the work can go ahead
+            - status: HTTP status to answer with when it can't (429 or 503)
+            - retry_after: Seconds the client should wait before retrying
+            - reason: Why it was refused
+            - load: The figures the decision was based on
+    """
+    load = get_load(config)
+    decision = {'admitted': True, 'status': None, 'retry_after': None, 'reason': None, 'load': load}
+    
+    if not config.get('ADMISSION_ENABLED', True):
+        return decision
+    
+    # Disk first - running out of space breaks everything, urgent included
+    reserve_mb = config.get('ADMISSION_URGENT_RESERVE_MB' if urgent else 'ADMISSION_MIN_FREE_MB', 2048)
+    needed_mb = reserve_mb + incoming_bytes / (1024 * 1024)
+    for folder, free_mb in load['free_mb'].items():
+        if free_mb is not None and free_mb < needed_mb:
+            return dict(decision, admitted=False, status=503,
+                        retry_after=config.get('ADMISSION_DISK_RETRY_SECONDS', 300),
+                        reason=f"Not enough free space in the {folder} folder "
+                               f"({free_mb:.0f} MB free, {needed_mb:.0f} MB needed)")
+    
+    if urgent:
+        # Urgent jobs jump the queue, so only their own number matters
+        max_urgent = config.get('ADMISSION_MAX_URGENT_QUEUED', 50)
+        if load['urgent_queued'] + job_count > max_urgent:
+            excess = load['urgent_queued'] + job_count - max_urgent
+            return dict(decision, admitted=False, status=429,
+                        retry_after=_retry_after(load['seconds_per_job'], load['workers'], excess),
+                        reason="Too many urgent jobs waiting")
+        return decision
+    
+    max_queued = config.get('ADMISSION_MAX_QUEUED', 200)
+    if load['queued'] + job_count > max_queued:
+        excess = load['queued'] + job_count - max_queued
+        reason = f"Processing queue is full ({load['queued']} jobs waiting)"
+        if job_count > 1:
+            reason = (f"Processing queue is too full for {job_count} more jobs "
+                      f"({load['queued']} waiting, limit {max_queued})")
+        return dict(decision, admitted=False, status=429,
+                    retry_after=_retry_after(load['seconds_per_job'], load['workers'], excess),
+                    reason=reason)
+    
+    # The backlog this work would leave behind once queued
+    max_backlog = config.get('ADMISSION_MAX_BACKLOG_SECONDS', 3600)
+    backlog_seconds = load['backlog_seconds'] + \
+        round((job_count - 1) * load['seconds_per_job'] / load['workers'])
+    if backlog_seconds > max_backlog:
+        excess_seconds = backlog_seconds - max_backlog
+        return dict(decision, admitted=False, status=429,
+                    retry_after=max(1, min(excess_seconds, 600)),
+                    reason=f"Workers are saturated (about {load['backlog_seconds'] // 60} minutes of work queued)")
+    
+    return decision
+
+def _retry_after(seconds_per_job, workers, jobs):
+    """Roughly how long until the workers get through this many jobs (1s - 10min)"""
+    return max(1, min(600, math.ceil(jobs * seconds_per_job / workers)))
+
+def wait_for_capacity(config, incoming_bytes=0, stop=None, echo=None, max_sleep=30):
+    """
+    Block an internal producer (CLI ingest, scripts) until work is admitted
+    
+    Args:
+        config: Application config
+        incoming_bytes: Size of the next file
+        stop: Optional threading.Event that ends the wait early
+        echo: Optional function called with a message while waiting
+        max_sleep: Longest single pause in seconds
+    
+    Returns:
+        False if stop was set while waiting, otherwise True
+    """
+    warned = False
+    while True:
+        decision = check_admission(config, incoming_bytes=incoming_bytes)
+        if decision['admitted']:
+            return True
+        
+        if echo and not warned:
+            echo(f"Pausing: {decision['reason']}")
+            warned = True
+        
+        pause = min(decision['retry_after'] or max_sleep, max_sleep)
+        if stop is not None:
+            if stop.wait(pause):
+                return False
+        else:
+            time.sleep(pause)
@@ -0,0 +1,331 @@
+"""
+Audio Fingerprint Module for Radio Automation System
+Recognises which show a file belongs to from its opening jingle, for
+files whose names can't be parsed (track01.wav, vendor GUIDs)
+
+A fingerprint is a set of landmark hashes. The loudest points of the
+spectrogram (peaks) are paired up, and each pair becomes one hash of
+(frequency of the first peak, frequency of the second, time between them)
+together with the time of the first peak. The hashes don't depend on
+volume or EQ, and enough of them survive a lossy encode.
+
+Every show's jingle hashes are kept in one inverted index - a sorted
+array of hashes with the jingle and time each came from. An unknown file
+has only its first FINGERPRINT_SECONDS decoded. Its hashes are looked up
+in the index in one vectorised search, and the jingle with the most hits
+at a consistent time offset wins. Lookup cost grows with the number of
+hits, not with the number of shows.
+"""
+
+import os
+import hashlib
+import threading
+import logging
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import func, select
+from app import db
+from app.models import ShowJingle
+
+logger = logging.getLogger(__name__)
+
+# Analysis settings - changing any of these means re-adding every jingle
+SAMPLE_RATE = 8000     # Hz, plenty for the tones a jingle is recognised by
+FFT_SIZE = 1024        # 128ms window, 7.8Hz per bin
+HOP_SIZE = 256         # 32ms between spectrogram frames
+PEAK_FREQ_RANGE = 12   # A peak is the loudest point within this many bins...
+PEAK_TIME_RANGE = 6    # ...and this many frames either side
+PEAK_MIN_DB = 10.0     # ...and this far above the frame's median level
+FAN_OUT = 8            # Peaks each anchor peak is paired with
+MAX_PAIR_FRAMES = 63   # Longest gap between paired peaks (6 bits, ~2s)
+FREQ_BITS = 9          # Bins above 511 (~4kHz) are not used
+
+# Hashes found in more index entries than this (hum, tones every jingle
+# has) say nothing about which show it is and are skipped
+MAX_HASH_HITS = 200
+
+# Packed form stored in ShowJingle.hashes
+HASH_DTYPE = np.dtype([('hash', '<u4'), ('offset', '<u4')])
+
+_cache = {'key': None, 'index': None}
+_cache_lock = threading.Lock()
+
+def decode_opening(file_path, seconds):
+    """
+    Decode the first `seconds` of a file to mono float32 at SAMPLE_RATE
+    
+    Only the opening is read - FFmpeg stops once it has enough.
+    """
+    # Imported here to avoid a circular import with the audio processor
+    from app.audio_processor import run_ffmpeg
+    
+    cmd = ['ffmpeg', '-v', 'error', '-t', str(seconds), '-i', file_path,
+           '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 'f32le', 'pipe:1']
+    output = bytearray()
+    returncode, errors = run_ffmpeg(cmd, stdout_consumer=output.extend, step='fingerprint')
+    if returncode != 0:
+        raise RuntimeError(errors[-500:])
+    return np.frombuffer(bytes(output), dtype='<f4')
+
+def spectrogram_db(samples):
+    """Log-magnitude spectrogram, shaped (frames, bins)"""
+    if len(samples) < FFT_SIZE:
+        return np.empty((0, FFT_SIZE // 2 + 1), dtype=np.float32)
+    frames = sliding_window_view(samples, FFT_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FFT_SIZE).astype(np.float32), axis=1))
+    return (20 * np.log10(spectrum + 1e-9)).astype(np.float32)
+
+def find_peaks(spectrogram):
+    """
+    The spectrogram's local maxima
+    
+    Returns:
+        Arrays (frames, bins) of the peaks, sorted by time then frequency
+    """
+    if len(spectrogram) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    
+    # Separable maximum filter: over frequency, then over time
+    padded = np.pad(spectrogram, ((0, 0), (PEAK_FREQ_RANGE, PEAK_FREQ_RANGE)), mode='constant',
+                    constant_values=-np.inf)
+    local = sliding_window_view(padded, 2 * PEAK_FREQ_RANGE + 1, axis=1).max(axis=2)
+    padded = np.pad(local, ((PEAK_TIME_RANGE, PEAK_TIME_RANGE), (0, 0)), mode='constant',
+                    constant_values=-np.inf)
+    local = sliding_window_view(padded, 2 * PEAK_TIME_RANGE + 1, axis=0).max(axis=2)
+    
+    floor = np.median(spectrogram, axis=1, keepdims=True) + PEAK_MIN_DB
+    is_peak = (spectrogram == local) & (spectrogram > floor)
+    is_peak[:, 0] = False
+    is_peak[:, 1 << FREQ_BITS:] = False
+    frames, bins = np.nonzero(is_peak)
+    return frames, bins
+
+def landmark_hashes(samples):
+    """
+    Landmark hashes of some audio
+    
+    Args:
+        samples: Mono float32 samples at SAMPLE_RATE
+    
+    Returns:
+        Tuple of (hashes, frame offsets) as uint32 arrays
+    """
+    frames, bins = find_peaks(spectrogram_db(samples))
+    hashes = []
+    offsets = []
+    # Pair every peak with each of the next FAN_OUT peaks, one step at a time
+    for step in range(1, FAN_OUT + 1):
+        if len(frames) <= step:
+            break
+        gap = frames[step:] - frames[:-step]
+        usable = (gap > 0) & (gap <= MAX_PAIR_FRAMES)
+        anchor_bins = bins[:-step][usable]
+        partner_bins = bins[step:][usable]
+        hashes.append((anchor_bins << (FREQ_BITS + 6)) | (partner_bins << 6) | gap[usable])
+        offsets.append(frames[:-step][usable])
+    
+    if not hashes:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    return np.concatenate(hashes).astype(np.uint32), np.concatenate(offsets).astype(np.uint32)
+
+def fingerprint_file(file_path, seconds):
+    """
+    Fingerprint the opening of a file
+    
+    Returns:
+        Dictionary with success, hashes (packed bytes), hash_count,
+        duration and error
+    """
+    try:
+        samples = decode_opening(file_path, seconds)
+        hashes, offsets = landmark_hashes(samples)
+    except Exception as e:
+        logger.error(f"Could not fingerprint {file_path}: {str(e)}")
+        return {'success': False, 'error': f"Could not fingerprint audio: {str(e)}"}
+    
+    if len(hashes) == 0:
+        return {'success': False, 'error': 'No usable audio found to fingerprint'}
+    
+    packed = np.empty(len(hashes), dtype=HASH_DTYPE)
+    packed['hash'] = hashes
+    packed['offset'] = offsets
+    return {
+        'success': True,
+        'error': None,
+        'hashes': packed.tobytes(),
+        'hash_count': len(hashes),
+        'duration': round(len(samples) / SAMPLE_RATE, 2)
+    }
+
+class JingleIndex:
+    """
+    Inverted index of every stored jingle's hashes
+    
+    The hashes of all jingles are concatenated and sorted, so the entries
+    for any hash are one contiguous run found with a binary search.
+    """
+    
+    def __init__(self, jingles):
+        """
+        Args:
+            jingles: List of (jingle id, show id, packed hashes)
+        """
+        self.show_ids = np.array([show_id for _, show_id, _ in jingles], dtype=np.int64)
+        self.jingle_ids = [jingle_id for jingle_id, _, _ in jingles]
+        
+        parts = [np.frombuffer(packed, dtype=HASH_DTYPE) for _, _, packed in jingles]
+        owners = [np.full(len(part), number, dtype=np.int64) for number, part in enumerate(parts)]
+        entries = np.concatenate(parts) if parts else np.empty(0, dtype=HASH_DTYPE)
+        owner = np.concatenate(owners) if owners else np.empty(0, dtype=np.int64)
+        
+        order = np.argsort(entries['hash'], kind='stable')
+        self.hashes = entries['hash'][order]
+        self.offsets = entries['offset'][order].astype(np.int64)
+        self.owner = owner[order]
+    
+    def __len__(self):
+        return len(self.jingle_ids)
+    
+    def lookup(self, hashes, offsets):
+        """
+        Vote for the jingle and time offset each query hash agrees with
+        
+        Args:
+            hashes, offsets: Landmark hashes of the unknown audio
+        
+        Returns:
+            List of (show id, jingle id, votes, offset in seconds), best first,
+            one entry per jingle
+        """
+        if len(self.hashes) == 0 or len(hashes) == 0:
+            return []
+        
+        first = np.searchsorted(self.hashes, hashes, side='left')
+        last = np.searchsorted(self.hashes, hashes, side='right')
+        counts = last - first
+        counts[counts > MAX_HASH_HITS] = 0
+        if counts.sum() == 0:
+            return []
+        
+        # Expand each query hash into one row per index entry it hit
+        query_row = np.repeat(np.arange(len(hashes)), counts)
+        run_start = np.repeat(first - np.cumsum(counts) + counts, counts)
+        entry = run_start + np.arange(counts.sum())
+        
+        # A real match hits many hashes at the same time shift
+        shift = self.offsets[entry] - offsets[query_row].astype(np.int64)
+        owner = self.owner[entry]
+        span = 2 * (1 << 32)
+        keys, votes = np.unique(owner * span + shift + (1 << 32), return_counts=True)
+        
+        best = {}
+        for key, count in zip(keys, votes):
+            number = int(key // span)
+            if count > best.get(number, (0, 0))[0]:
+                best[number] = (int(count), int(key % span) - (1 << 32))
+        
+        ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)
+        return [(int(self.show_ids[number]), self.jingle_ids[number], count,
+                 round(-shift * HOP_SIZE / SAMPLE_RATE, 2))
+                for number, (count, shift) in ranked]
+
+def _index_key():
+    """One aggregate query that changes whenever a jingle is added or removed"""
+    summary = db.session.execute(select(
+        func.count(ShowJingle.id), func.max(ShowJingle.id), func.sum(ShowJingle.id)
+    )).one()
+    return hashlib.sha1(repr(tuple(summary)).encode('utf-8')).hexdigest()[:16]
+
+def get_jingle_index():
+    """The index of every stored jingle, rebuilt only when jingles change"""
+    key = _index_key()
+    with _cache_lock:
+        if _cache['index'] is not None and _cache['key'] == key:
+            return _cache['index']
+    
+    rows = db.session.query(ShowJingle.id, ShowJingle.show_id, ShowJingle.hashes) \
+        .order_by(ShowJingle.id).all()
+    index = JingleIndex([(row.id, row.show_id, row.hashes) for row in rows if row.hashes])
+    logger.debug(f"Built jingle index: {len(index)} jingles, {len(index.hashes)} hashes")
+    
+    with _cache_lock:
+        _cache.update(key=key, index=index)
+    return index
+
+def identify_show(file_path, config):
+    """
+    Work out which show a file is from its opening audio
+    
+    Args:
+        file_path: Audio file to identify
+        config: Application config (FINGERPRINT_* settings)
+    
+    Returns:
+        Dictionary with success, show_id, jingle_id, votes, offset (where
+        the jingle starts in the file, seconds) and error
+    """
+    result = {'success': False, 'show_id': None, 'jingle_id': None, 'votes': 0,
+              'offset': None, 'error': None}
+    
+    index = get_jingle_index()
+    if len(index) == 0:
+        result['error'] = 'No show jingles have been added'
+        return result
+    
+    try:
+        samples = decode_opening(file_path, config.get('FINGERPRINT_SECONDS', 45))
+        hashes, offsets = landmark_hashes(samples)
+    except Exception as e:
+        result['error'] = f"Could not fingerprint audio: {str(e)}"
+        logger.error(f"Could not fingerprint {file_path}: {str(e)}")
+        return result
+    
+    ranked = index.lookup(hashes, offsets)
+    min_votes = config.get('FINGERPRINT_MIN_MATCHES', 20)
+    if not ranked or ranked[0][2] < min_votes:
+        result['votes'] = ranked[0][2] if ranked else 0
+        result['error'] = 'No show jingle recognised'
+        return result
+    
+    show_id, jingle_id, votes, offset = ranked[0]
+    # Jingles of two different shows agreeing about as well is no answer
+    runner_up = next((entry[2] for entry in ranked[1:] if entry[0] != show_id), 0)
+    if runner_up * 2 > votes:
+        result['error'] = 'Audio matches more than one show'
+        return result
+    
+    result.update(success=True, show_id=show_id, jingle_id=jingle_id, votes=votes,
+                  offset=offset)
+    return result
+
+def add_jingle(show, file_path, label=None, seconds=None, config=None):
+    """
+    Fingerprint a jingle and store it for a show
+    
+    Args:
+        show: Show the jingle belongs to
+        file_path: Recording that starts with the jingle (a clip of just
+                   the jingle, or an episode)
+        label: Optional name for the jingle
+        seconds: How much of the recording to use (default FINGERPRINT_SECONDS)
+    
+    Returns:
+        Dictionary with success, jingle (the new ShowJingle) and error
+    """
+    seconds = seconds or (config or {}).get('FINGERPRINT_SECONDS', 45)
+    fingerprint = fingerprint_file(file_path, seconds)
+    if not fingerprint['success']:
+        return {'success': False, 'jingle': None, 'error': fingerprint['error']}
+    
+    jingle = ShowJingle(
+        show_id=show.id,
+        label=label,
+        source_filename=os.path.basename(file_path),
+        duration=fingerprint['duration'],
+        hash_count=fingerprint['hash_count'],
+        hashes=fingerprint['hashes']
+    )
+    db.session.add(jingle)
+    db.session.commit()
+    logger.info(f"Added jingle for {show.name}: {jingle.hash_count} hashes from {jingle.duration}s")
+    return {'success': True, 'jingle': jingle, 'error': None}
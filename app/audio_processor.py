@@ -8,17 +8,42 @@ import subprocess
 import json
 from datetime import datetime
 import time
+import threading
+from collections import deque
+from flask import current_app, has_app_context
 from app import db
-from app.models import ProcessedFile, Show
+from app.models import (ProcessedFile, ProcessedOutput, ProcessingTemplate, Show,
+                        LoudnessProfile)
 from app.pattern_matcher import parse_filename
 from app.utils import get_file_info
+from app.waveform import PeakBuilder, write_peaks_file, get_peaks_path
+from app.silence import find_trim_points
+from app.template_engine import get_compiled_template, TemplateError
+from app.loudness import measure_loudness, apply_gain, loudness_meter_filter, LoudnessTap
+from app.validation import sniff_audio_header, deep_check_audio
+from app.storage import (get_output_directory, claim_output_name, get_partial_path,
+                         commit_output, discard_output, MUXERS, get_codec_args)
+from app.scratch import get_scratch_space, estimate_scratch_bytes, move_to_storage
+from app.profiling import profile_job
+from app.log_pipeline import with_file_context, update_log_context
+from app.startup import StartupTimer
+from app.governor import (get_limits, governed_command, apply_process_limits, Watchdog,
+                          is_cancelled, is_detached)
+from app.rerender import render_settings_hash, resolve_render_settings
+from app.audio_fingerprint import identify_show
+from app.segments import plan_segments, may_segment, render_segmented
 import logging
 
 logger = logging.getLogger(__name__)
 
-def process_audio_file(input_path, output_format='wav', normalize=True, 
-                      normalize_level=-1.0, sample_rate=44100, 
-                      bit_depth=16, channels=2):
+@profile_job
+@with_file_context
+def process_audio_file(input_path, output_format=None, normalize=None,
+                      normalize_level=None, sample_rate=None,
+                      bit_depth=None, channels=None, trim_silence=None,
+                      trim_offsets=None, output_targets=None, template_id=None,
+                      output_name=None, source_info=None, source_loudness=None,
+                      source_name=None, show_id=None):
     """
     Process an audio file according to specified parameters
     
@@ -30,15 +55,37 @@ def process_audio_file(input_path, output_format='wav', normalize=True,
         sample_rate: Output sample rate in Hz
         bit_depth: Output bit depth (8, 16, 24, 32)
         channels: Output channels (1=mono, 2=stereo)
+                  (for each of these, None = use the show's setting)
+        trim_silence: Trim leading/trailing silence (None = use show setting)
+        trim_offsets: Known (start, end) trim points in seconds, e.g. from a
+                      previous render, so detection can be skipped
+        output_targets: List of target dictionaries (format, sample_rate,
+                        bit_depth, channels, bitrate, label) to render in one
+                        pass. Defaults to the show's targets, or a single
+                        target built from the arguments above.
+        template_id: ProcessingTemplate to apply (None = use show's template)
+        output_name: Base name for the outputs, replacing any existing files
+                     with that name (re-renders). Normally a new name is claimed.
+        source_info: get_file_info result for the input, if already known
+        source_loudness: measure_loudness result for the input (over the
+                         trimmed range), if already known
+        source_name: File name the show and air date are read from (defaults
+                     to the input's own name; jobs pass the name they were
+                     submitted under)
+        show_id: Show the file is already known to belong to (re-renders),
+                 instead of working it out from the name or the jingle
     
     Returns:
         Dictionary with success status and file information
     """
     start_time = time.time()
+    # Time spent in each stage, reported with the result in the log
+    stages = StartupTimer()
+    lease = None
     
     try:
         # Get input file information
-        file_info = get_file_info(input_path)
+        file_info = source_info or get_file_info(input_path)
         if not file_info['success']:
             return {
                 'success': False,
@@ -46,12 +93,17 @@ def process_audio_file(input_path, output_format='wav', normalize=True,
             }
         
         # Parse filename to extract show and date
-        filename = os.path.basename(input_path)
+        filename = source_name or os.path.basename(input_path)
         parse_result = parse_filename(filename)
         
         # Find matching show in database
         show = None
-        if parse_result['show_name']:
+        if show_id:
+            show = Show.query.get(show_id)
+        elif parse_result['show_id']:
+            # The show's own filename pattern matched
+            show = Show.query.get(parse_result['show_id'])
+        elif parse_result['show_name']:
             # Try to find show by alias
             from app.models import ShowAlias
             alias = ShowAlias.query.filter_by(
@@ -59,58 +111,298 @@ def process_audio_file(input_path, output_format='wav', normalize=True,
             ).first()
             if alias:
                 show = alias.show
-                # Use show's default settings if not overridden
-                if show:
-                    output_format = output_format or show.default_format
-                    sample_rate = sample_rate or show.sample_rate
-                    bit_depth = bit_depth or show.bit_depth
-                    channels = channels or show.channels
-                    if normalize is None:
-                        normalize = show.normalize
-                    normalize_level = normalize_level or show.normalize_level
         
-        # Create output filename
-        base_name = os.path.splitext(filename)[0]
-        if show and parse_result['date']:
-            # Use standardized naming
-            output_name = f"{show.name.replace(' ', '_')}_{parse_result['date'].strftime('%Y%m%d')}"
-        else:
-            output_name = base_name
+        # Names like track01.wav - try to recognise the show's jingle
+        config = current_app.config
+        if show is None and config.get('FINGERPRINT_ENABLED', True):
+            match = identify_show(input_path, config)
+            if match['success']:
+                show = Show.query.get(match['show_id'])
+                logger.info(f"Identified {filename} as {show.name} by its jingle "
+                            f"({match['votes']} matching hashes at {match['offset']}s)")
         
-        output_filename = f"{output_name}.{output_format}"
-        output_path = os.path.join('processed', output_filename)
+        # Processing template from the upload, or else the show's template
+        template = None
+        if template_id:
+            template = ProcessingTemplate.query.get(template_id)
+            if template is None:
+                return {
+                    'success': False,
+                    'error': f"Processing template {template_id} not found"
+                }
+        elif show and show.template:
+            template = show.template
         
-        # Ensure output directory exists
-        os.makedirs('processed', exist_ok=True)
+        update_log_context(show=show.name if show else None)
         
-        # Build FFmpeg command
-        ffmpeg_cmd = build_ffmpeg_command(
-            input_path=input_path,
-            output_path=output_path,
-            output_format=output_format,
-            sample_rate=sample_rate,
-            bit_depth=bit_depth,
-            channels=channels,
-            normalize=normalize,
-            normalize_level=normalize_level
+        compiled = None
+        if template:
+            try:
+                compiled = get_compiled_template(template)
+            except TemplateError as e:
+                return {
+                    'success': False,
+                    'error': str(e)
+                }
+        
+        # Each setting comes from the upload, the template, the show or the
+        # system defaults - the same way the show's settings hash is worked out
+        settings = resolve_render_settings(
+            show, compiled, config, output_targets=output_targets,
+            output_format=output_format, sample_rate=sample_rate, bit_depth=bit_depth,
+            channels=channels, normalize=normalize, normalize_level=normalize_level,
+            trim_silence=trim_silence
+        )
+        output_targets = settings['targets']
+        normalize = settings['normalize']
+        normalize_level = settings['normalize_level']
+        trim_silence = settings['trim_silence']
+        
+        stages.mark('analyze')
+        
+        # Find leading/trailing dead air (only the ends of the file are read)
+        trim_start = trim_end = None
+        if trim_offsets:
+            trim_start, trim_end = trim_offsets
+        elif trim_silence:
+            trim = find_trim_points(
+                input_path,
+                threshold_db=config.get('SILENCE_THRESHOLD_DB', -50.0),
+                window_ms=config.get('SILENCE_WINDOW_MS', 50),
+                max_scan_seconds=config.get('SILENCE_MAX_SCAN_SECONDS', 120),
+                pad_ms=config.get('SILENCE_PAD_MS', 250),
+                duration=file_info['duration']
+            )
+            if trim['success']:
+                trim_start, trim_end = trim['start'], trim['end']
+                logger.info(f"Trimming {filename}: {trim_start:.2f}s - {trim_end:.2f}s "
+                            f"of {trim['duration']:.2f}s")
+            else:
+                logger.warning(f"Could not detect silence in {filename}: {trim['error']}")
+        
+        stages.mark('trim')
+        
+        # Create output filename
+        replace_outputs = output_name is not None
+        if not replace_outputs:
+            base_name = os.path.splitext(filename)[0]
+            if show and parse_result['date']:
+                # Use standardized naming
+                output_name = f"{show.name.replace(' ', '_')}_{parse_result['date'].strftime('%Y%m%d')}"
+            else:
+                output_name = base_name
+        
+        # Recorded with the file so a change to the show's settings can be
+        # spotted later (see rerender.py)
+        settings_hash = render_settings_hash(
+            output_targets, normalize, normalize_level, trim_silence,
+            compiled.template_id if compiled else None,
+            compiled.version if compiled else None
         )
         
+        # Outputs are sharded by show and date, and the name is reserved
+        # up front so re-processing never overwrites an earlier render
+        output_dir = get_output_directory(config.get('PROCESSED_FOLDER', 'processed'),
+                                          show, parse_result['date'])
+        os.makedirs(output_dir, exist_ok=True)
+        if not replace_outputs:
+            # Any target may end up with its label (or number) on the name
+            suffixes = [target.get('label') or i for i, target in enumerate(output_targets)]
+            output_name = claim_output_name(output_dir, output_name, suffixes)
+        
+        targets = []
+        used_names = set()
+        for target in output_targets:
+            target = dict(target)
+            target_name = f"{output_name}.{target['format']}"
+            if target_name in used_names:
+                # Same format twice (e.g. 16 and 24-bit WAV) - tell them apart by label
+                suffix = target.get('label') or len(targets)
+                target_name = f"{output_name}_{suffix}.{target['format']}"
+            used_names.add(target_name)
+            target['output_filename'] = target_name
+            target['output_path'] = os.path.join(output_dir, target_name)
+            target['partial_path'] = get_partial_path(target['output_path'])
+            targets.append(target)
+        
+        # The first target is the primary output shown in the history
+        primary = targets[0]
+        output_format = primary['format']
+        output_filename = primary['output_filename']
+        output_path = primary['output_path']
+        
+        # Work on fast scratch storage when it's configured and the job fits
+        # in its budget - otherwise straight from uploads/ into processed/
+        source_path = input_path
+        scratch = get_scratch_space(config)
+        if scratch:
+            stage_input = config.get('SCRATCH_STAGE_INPUTS', True)
+            waveform_rate = config.get('WAVEFORM_SAMPLE_RATE', 8000) \
+                if config.get('WAVEFORM_ENABLED', True) else None
+            lease = scratch.reserve(estimate_scratch_bytes(
+                file_info, targets, stage_input,
+                segmented=may_segment(file_info['duration'], targets, config),
+                waveform_rate=waveform_rate
+            ))
+            if lease is None:
+                logger.info(f"Scratch space full, processing {filename} on disk")
+            else:
+                if stage_input:
+                    source_path = lease.stage_input(input_path)
+                for target in targets:
+                    target['partial_path'] = lease.path(target['output_filename'])
+        
+        stages.mark('prepare')
+        
+        # Waveform peaks are computed from a tap on the same FFmpeg run,
+        # so the preview costs no extra decode of the output
+        peak_builder = None
+        if config.get('WAVEFORM_ENABLED', True):
+            peak_builder = PeakBuilder(
+                sample_rate=config.get('WAVEFORM_SAMPLE_RATE', 8000),
+                bucket_size=config.get('WAVEFORM_BUCKET_SIZE', 80),
+                zoom_factor=config.get('WAVEFORM_ZOOM_FACTOR', 4),
+                levels=config.get('WAVEFORM_LEVELS', 6)
+            )
+        
+        # Shared filter chain - template filters (DC removal, fades) run in
+        # the same graph as normalization, so they cost no extra pass
+        # Measure the source loudness once - it feeds both normalization
+        # (a fixed gain to the target peak) and the stored loudness profile.
+        # When no gain depends on it, it is taken from a branch of the
+        # render itself instead of a separate decode.
+        loudness = None
+        measure_in_render = False
+        if source_loudness:
+            loudness = source_loudness
+        elif normalize:
+            loudness = measure_loudness(source_path, trim_start, trim_end)
+        elif config.get('LOUDNESS_ANALYSIS_ENABLED', True):
+            measure_in_render = True
+        
+        if loudness and not loudness['success']:
+            logger.warning(f"Could not measure loudness of {filename}: {loudness['error']}")
+            loudness = None
+        
+        gain_db = 0.0
+        normalize_filter = None
+        if normalize:
+            measured_peak = loudness['true_peak_db'] if loudness else None
+            normalize_filter = build_normalize_filter(normalize_level, measured_peak)
+            if measured_peak is not None:
+                gain_db = round(normalize_level - measured_peak, 2)
+            else:
+                # loudnorm's output level can't be predicted from the source
+                loudness = None
+        rendered_duration = file_info['duration']
+        if trim_end is not None:
+            rendered_duration = trim_end - (trim_start or 0)
+        if compiled:
+            filters = compiled.filter_chain(rendered_duration, normalize_filter)
+        else:
+            filters = [normalize_filter] if normalize_filter else []
+        
+        # Very long recordings are rendered in segments on several CPUs
+        # when that gives the same result as a single run
+        segment_plan = plan_segments(source_path, rendered_duration, filters, targets,
+                                     trim_start, trim_end, config)
+        if segment_plan and measure_in_render:
+            # Loudness can't be measured in pieces, so it gets its own pass
+            measure_in_render = False
+            loudness = measure_loudness(source_path, trim_start, trim_end)
+            if not loudness['success']:
+                logger.warning(f"Could not measure loudness of {filename}: {loudness['error']}")
+                loudness = None
+        
+        stages.mark('loudness')
+        
         # Execute FFmpeg
-        logger.info(f"Processing: {filename} -> {output_filename}")
-        logger.debug(f"FFmpeg command: {' '.join(ffmpeg_cmd)}")
+        logger.info(f"Processing: {filename} -> "
+                    f"{', '.join(target['output_filename'] for target in targets)}")
+        
+        loudness_tap = LoudnessTap() if measure_in_render else None
+        try:
+            if segment_plan:
+                logger.info(f"Rendering {filename} in {len(segment_plan['segments'])} "
+                            f"parallel segments")
+                returncode, stderr_tail = render_segmented(
+                    segment_plan,
+                    source_path,
+                    targets,
+                    filters,
+                    work_dir=lease.directory if lease else output_dir,
+                    trim_start=trim_start,
+                    waveform_rate=peak_builder.sample_rate if peak_builder else None,
+                    stdout_consumer=peak_builder.feed if peak_builder else None
+                )
+            else:
+                ffmpeg_cmd = build_fanout_command(
+                    input_path=source_path,
+                    targets=targets,
+                    filters=filters,
+                    waveform_rate=peak_builder.sample_rate if peak_builder else None,
+                    trim_start=trim_start,
+                    trim_end=trim_end,
+                    loudness_fd=loudness_tap.fd if loudness_tap else None
+                )
+                logger.debug(f"FFmpeg command: {' '.join(ffmpeg_cmd)}")
+                returncode, stderr_tail = run_ffmpeg(
+                    ffmpeg_cmd,
+                    stdout_consumer=peak_builder.feed if peak_builder else None,
+                    step='render',
+                    pass_fds=(loudness_tap.fd,) if loudness_tap else ()
+                )
+        except BaseException:
+            for target in targets:
+                discard_output(target['partial_path'])
+            raise
+        finally:
+            if loudness_tap:
+                loudness_tap.close()
+        
+        if loudness_tap and returncode == 0:
+            loudness = loudness_tap.result()
         
-        result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
+        if returncode == 0 and is_cancelled():
+            # The lease was lost as FFmpeg finished - another worker owns
+            # the job now, so these outputs must not be kept
+            returncode, stderr_tail = -1, "The job was cancelled"
         
-        if result.returncode != 0:
-            error_msg = result.stderr[-1000:] if result.stderr else "Unknown FFmpeg error"
+        if returncode != 0:
+            for target in targets:
+                discard_output(target['partial_path'])
+            error_msg = stderr_tail[-1000:] if stderr_tail else "Unknown FFmpeg error"
             logger.error(f"FFmpeg error: {error_msg}")
             return {
                 'success': False,
                 'error': f"FFmpeg processing failed: {error_msg}"
             }
         
+        stages.mark('render')
+        
+        # Every output was written under a temporary name (or in scratch) -
+        # move them all into place now that FFmpeg has finished
+        for target in targets:
+            if lease:
+                move_to_storage(target['partial_path'], target['output_path'])
+            else:
+                commit_output(target['partial_path'], target['output_path'])
+        
+        # Write the waveform peaks next to the output
+        peaks_path = None
+        if peak_builder:
+            try:
+                peaks_path = write_peaks_file(get_peaks_path(output_path), peak_builder)
+            except Exception as e:
+                # A missing preview shouldn't fail an otherwise good file
+                logger.warning(f"Could not write waveform peaks for {output_filename}: {str(e)}")
+        
         # Get output file information
-        output_info = get_file_info(output_path)
+        for target in targets:
+            target['info'] = get_file_info(target['output_path'])
+        output_info = primary['info']
+        
+        stages.mark('commit')
         
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -131,21 +423,64 @@ def process_audio_file(input_path, output_format='wav', normalize=True,
             output_filename=output_path,
             output_format=output_format,
             output_size=output_info['size'] if output_info['success'] else None,
+            peaks_filename=peaks_path,
             normalized=normalize,
-            normalize_level=normalize_level if normalize else None
+            normalize_level=normalize_level if normalize else None,
+            trim_start=trim_start,
+            trim_end=trim_end,
+            template_id=compiled.template_id if compiled else None,
+            template_version=compiled.version if compiled else None,
+            source_path=input_path,
+            settings_hash=settings_hash
         )
         
         db.session.add(processed_file)
+        db.session.flush()  # Get the file ID
+        
+        # Link every rendered output to the parent record
+        for target in targets:
+            db.session.add(ProcessedOutput(
+                processed_file_id=processed_file.id,
+                label=target.get('label'),
+                output_filename=target['output_path'],
+                output_format=target['format'],
+                sample_rate=target['sample_rate'],
+                bit_depth=target['bit_depth'],
+                channels=target['channels'],
+                bitrate=target.get('bitrate'),
+                output_size=target['info']['size'] if target['info']['success'] else None
+            ))
+        
+        # Store the loudness of the rendered audio for compliance reports
+        if loudness:
+            measurements = apply_gain(loudness, gain_db)
+            db.session.add(LoudnessProfile(
+                processed_file_id=processed_file.id,
+                integrated_lufs=measurements['integrated_lufs'],
+                loudness_range=measurements['loudness_range'],
+                lra_low=measurements['lra_low'],
+                lra_high=measurements['lra_high'],
+                momentary_max=measurements['momentary_max'],
+                short_term_max=measurements['short_term_max'],
+                true_peak_db=measurements['true_peak_db'],
+                gain_db=gain_db
+            ))
+        
         db.session.commit()
+        stages.mark('database')
         
-        logger.info(f"Successfully processed {filename} in {processing_time:.2f} seconds")
+        logger.info(f"Successfully processed {filename} in {processing_time:.2f} seconds",
+                    extra={'stages_ms': stages.phases, 'file_id': processed_file.id,
+                           'duration_ms': round(processing_time * 1000, 1)})
         
         return {
             'success': True,
             'output_path': output_path,
             'output_filename': output_filename,
+            'outputs': [target['output_path'] for target in targets],
             'processing_time': processing_time,
-            'file_id': processed_file.id
+            'file_id': processed_file.id,
+            'show_id': processed_file.show_id
         }
         
     except Exception as e:
@@ -154,7 +489,7 @@ def process_audio_file(input_path, output_format='wav', normalize=True,
         # Save failed attempt to database
         try:
             processed_file = ProcessedFile(
-                original_filename=os.path.basename(input_path),
+                original_filename=source_name or os.path.basename(input_path),
                 success=False,
                 error_message=str(e),
                 processing_time=time.time() - start_time
@@ -168,65 +503,242 @@ def process_audio_file(input_path, output_format='wav', normalize=True,
             'success': False,
             'error': str(e)
         }
+    
+    finally:
+        if lease:
+            lease.close()
 
 def build_ffmpeg_command(input_path, output_path, output_format='wav',
                         sample_rate=44100, bit_depth=16, channels=2,
-                        normalize=True, normalize_level=-1.0):
+                        normalize=True, normalize_level=-1.0, waveform_rate=None,
+                        trim_start=None, trim_end=None):
     """
     Build FFmpeg command for audio processing
+    
+    If waveform_rate is given, the processed audio is also split off to
+    stdout as mono float32 PCM at that rate for building waveform peaks.
+    
+    trim_start/trim_end (seconds) are applied as input options, so FFmpeg
+    seeks straight past the silence instead of decoding and discarding it.
     """
-    cmd = ['ffmpeg', '-y', '-i', input_path]
-    
-    # Audio codec based on format
-    if output_format == 'wav':
-        # PCM codec for WAV
-        if bit_depth == 8:
-            cmd.extend(['-acodec', 'pcm_u8'])
-        elif bit_depth == 16:
-            cmd.extend(['-acodec', 'pcm_s16le'])
-        elif bit_depth == 24:
-            cmd.extend(['-acodec', 'pcm_s24le'])
-        elif bit_depth == 32:
-            cmd.extend(['-acodec', 'pcm_s32le'])
-    elif output_format == 'mp3':
-        cmd.extend(['-acodec', 'libmp3lame', '-b:a', '320k'])
-    elif output_format == 'aiff':
-        cmd.extend(['-acodec', 'pcm_s16be'])
-    elif output_format == 'flac':
-        cmd.extend(['-acodec', 'flac'])
-    
-    # Sample rate
-    cmd.extend(['-ar', str(sample_rate)])
-    
-    # Channels
-    cmd.extend(['-ac', str(channels)])
-    
-    # Normalization
-    if normalize:
-        # Use loudnorm filter for better normalization
+    target = {
+        'format': output_format,
+        'sample_rate': sample_rate,
+        'bit_depth': bit_depth,
+        'channels': channels,
+        'output_path': output_path
+    }
+    return build_fanout_command(input_path, [target], normalize=normalize,
+                                normalize_level=normalize_level,
+                                waveform_rate=waveform_rate,
+                                trim_start=trim_start, trim_end=trim_end)
+
+def build_normalize_filter(normalize_level, measured_peak_db=None):
+    """
+    Build the normalization filter for a target peak level
+    
+    With a measured true peak this is a plain gain change, which keeps the
+    dynamics intact and means the output loudness is known without
+    measuring it again. Without a measurement, fall back to FFmpeg's
+    single-pass loudnorm using the target as its true-peak ceiling.
+    """
+    if measured_peak_db is not None:
+        return f'volume={normalize_level - measured_peak_db:.2f}dB'
+    
+    # loudnorm only accepts a true-peak ceiling between -9 and 0 dBTP
+    ceiling = min(0.0, max(-9.0, normalize_level))
+    return f'loudnorm=I=-16:TP={ceiling}:LRA=11'
+
+def build_fanout_command(input_path, targets, normalize=True, normalize_level=-1.0,
+                         waveform_rate=None, trim_start=None, trim_end=None,
+                         filters=None, input_args=None, loudness_fd=None):
+    """
+    Build one FFmpeg command that writes several outputs from a single decode
+    
+    The shared processing (normalization) runs once and is then split with
+    asplit, so each extra output only costs its own resample and encode.
+    
+    Args:
+        input_path: Input audio file
+        targets: List of dictionaries with format, sample_rate, bit_depth,
+                 channels, optional bitrate/codec_args, the output_path
+                 and optionally a partial_path to write to instead (in
+                 the target's container, or the muxer given)
+        normalize, normalize_level: Shared normalization settings
+        waveform_rate: If set, also tap the audio to stdout for waveform peaks
+        trim_start, trim_end: Silence trim points in seconds
+        filters: Prebuilt shared filter chain (e.g. from a compiled
+                 template); replaces the normalize arguments when given
+        input_args: Extra input options (e.g. the seek used for a segment)
+        loudness_fd: If set, also measure the (unprocessed) input's loudness
+                     on a branch of the graph, written to this file
+                     descriptor (see loudness.LoudnessTap)
+    """
+    cmd = ['ffmpeg', '-y']
+    
+    if trim_start:
+        cmd.extend(['-ss', f'{trim_start:.3f}'])
+    if trim_end is not None:
+        cmd.extend(['-t', f'{trim_end - (trim_start or 0):.3f}'])
+    if input_args:
+        cmd.extend(input_args)
+    
+    cmd.extend(['-i', input_path])
+    
+    if filters is None:
+        filters = [build_normalize_filter(normalize_level)] if normalize else []
+    else:
+        filters = list(filters)
+    
+    branches = [f'out{i}' for i in range(len(targets))]
+    if waveform_rate:
+        branches.append('tap')
+    
+    # A single output with no tap can use a simple filter chain
+    use_graph = len(branches) > 1 or loudness_fd is not None
+    if use_graph:
+        filters.append(f'asplit={len(branches)}' + ''.join(f'[{b}]' for b in branches))
+        graph = '[0:a:0]' + ','.join(filters)
+        if loudness_fd is not None:
+            # The meter sees the input as a separate measuring pass would.
+            # aresample lets its branch convert formats on its own, so the
+            # meter doesn't change the format the outputs are rendered from.
+            graph = (f'[0:a:0]asplit=2[main][meter];'
+                     f'[meter]aresample,{loudness_meter_filter(loudness_fd)},anullsink;'
+                     f'[main]' + ','.join(filters))
+        cmd.extend(['-filter_complex', graph])
+    
+    for i, target in enumerate(targets):
+        if use_graph:
+            cmd.extend(['-map', f'[out{i}]'])
+        
+        # Audio codec based on format
+        codec_args = target.get('codec_args')
+        if codec_args is None:
+            codec_args = get_codec_args(target['format'], target.get('bit_depth', 16),
+                                        target.get('bitrate'))
+        cmd.extend(codec_args)
+        
+        # Sample rate
+        cmd.extend(['-ar', str(target.get('sample_rate', 44100))])
+        
+        # Channels
+        cmd.extend(['-ac', str(target.get('channels', 2))])
+        
+        # Normalization
+        if filters and not use_graph:
+            cmd.extend(['-af', ','.join(filters)])
+        
+        # Output file - written to a temporary name if one is given, so
+        # the container has to be named since the extension won't say
+        if target.get('partial_path'):
+            muxer = target.get('muxer') or MUXERS[target['format']]
+            cmd.extend(['-f', muxer, target['partial_path']])
+        else:
+            cmd.append(target['output_path'])
+    
+    # Waveform tap output
+    if waveform_rate:
         cmd.extend([
-            '-af',
-            f'loudnorm=I={normalize_level}:TP=-1.5:LRA=11'
+            '-map', '[tap]',
+            '-ac', '1',
+            '-ar', str(waveform_rate),
+            '-acodec', 'pcm_f32le',
+            '-f', 'f32le',
+            'pipe:1'
         ])
     
-    # Output file
-    cmd.append(output_path)
-    
     return cmd
 
+def run_ffmpeg(cmd, stdout_consumer=None, chunk_size=65536, stderr_lines=50, step=None,
+               pass_fds=()):
+    """
+    Run an FFmpeg command without buffering its output in memory
+    
+    The process runs under the FFMPEG_* resource limits (see governor.py).
+    
+    Args:
+        cmd: FFmpeg command list
+        stdout_consumer: Optional callable that receives stdout in chunks
+        chunk_size: Bytes to read from stdout at a time
+        stderr_lines: Number of trailing stderr lines to keep for errors
+        step: Name of the processing step, recorded if a limit kills it
+        pass_fds: Extra file descriptors FFmpeg writes to (e.g. a LoudnessTap)
+    
+    Returns:
+        Tuple of (return_code, stderr_tail)
+    """
+    limits = get_limits(current_app.config if has_app_context() else {})
+    
+    # Nothing new is started for a job whose lease has been lost
+    if is_cancelled():
+        return -1, "FFmpeg not started: the job was cancelled"
+    
+    process = subprocess.Popen(
+        governed_command(cmd, limits),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if stdout_consumer else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        pass_fds=pass_fds,
+        start_new_session=is_detached()
+    )
+    apply_process_limits(process.pid, limits)
+    
+    # Drain stderr on a separate thread so a chatty FFmpeg can never
+    # block on a full pipe while we're reading stdout
+    tail = deque(maxlen=stderr_lines)
+    
+    def drain_stderr():
+        for line in process.stderr:
+            tail.append(line.decode('utf-8', errors='replace'))
+    
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+    
+    try:
+        with Watchdog(process, limits, name=step) as watchdog:
+            if stdout_consumer:
+                while True:
+                    chunk = process.stdout.read(chunk_size)
+                    if not chunk:
+                        break
+                    stdout_consumer(chunk)
+            process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        stderr_thread.join()
+        if process.stdout:
+            process.stdout.close()
+        process.stderr.close()
+    
+    if watchdog.event or watchdog.cancelled:
+        tail.append(watchdog.message())
+    
+    return process.returncode, ''.join(tail)
+
 def analyze_audio_levels(file_path):
     """
     Analyze audio levels using FFmpeg
     Returns peak and RMS levels
+    
+    Only FFmpeg's overall summary is needed, so per-channel stats are
+    turned off and stderr is streamed rather than held in memory.
+    For loudness (LUFS) use app.loudness.measure_loudness instead.
     """
     try:
         cmd = [
-            'ffmpeg', '-i', file_path,
-            '-af', 'astats=metadata=1:reset=1',
+            'ffmpeg', '-hide_banner', '-nostats', '-i', file_path,
+            '-af', 'astats=measure_perchannel=none',
             '-f', 'null', '-'
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, stderr_tail = run_ffmpeg(cmd)
+        if returncode != 0:
+            logger.error(f"Error analyzing levels for {file_path}: {stderr_tail[-500:]}")
+            return None
         
         # Parse output for levels
         levels = {
@@ -234,17 +746,17 @@ def analyze_audio_levels(file_path):
             'rms_db': None
         }
         
-        # Extract levels from stderr (FFmpeg outputs to stderr)
-        for line in result.stderr.split('\n'):
+        # Extract levels from the summary FFmpeg writes to stderr
+        for line in stderr_tail.split('\n'):
             if 'Peak level' in line:
                 try:
-                    levels['peak_db'] = float(line.split(':')[1].strip().split()[0])
-                except:
+                    levels['peak_db'] = float(line.rsplit(':', 1)[1].strip().split()[0])
+                except (IndexError, ValueError):
                     pass
             elif 'RMS level' in line:
                 try:
-                    levels['rms_db'] = float(line.split(':')[1].strip().split()[0])
-                except:
+                    levels['rms_db'] = float(line.rsplit(':', 1)[1].strip().split()[0])
+                except (IndexError, ValueError):
                     pass
         
         return levels
@@ -300,29 +812,28 @@ def convert_to_broadcast_wav(input_path, output_path, metadata=None):
         sample_rate=44100
     )
 
-def validate_audio_file(file_path):
+def validate_audio_file(file_path, deep=False):
     """
     Validate that a file is a valid audio file
     
+    The header is checked first, which only reads the start of the file.
+    The full FFmpeg decode only runs when asked for, or when the header
+    looks suspicious.
+    
     Returns:
         Tuple of (is_valid, error_message)
     """
     try:
-        # Use FFmpeg to probe the file
-        cmd = ['ffmpeg', '-i', file_path, '-f', 'null', '-']
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        sniff = sniff_audio_header(file_path)
+        if not sniff['valid']:
+            return False, sniff['error']
         
-        if result.returncode == 0:
-            return True, None
-        else:
-            # Check for common errors
-            stderr = result.stderr.lower()
-            if 'invalid data' in stderr:
-                return False, "Invalid or corrupted audio file"
-            elif 'no such file' in stderr:
-                return False, "File not found"
-            else:
-                return False, "Not a valid audio file"
+        if deep or sniff['suspicious']:
+            passed, message = deep_check_audio(file_path)
+            if not passed:
+                return False, f"Invalid or corrupted audio file: {message}"
+        
+        return True, None
                 
     except Exception as e:
-        return False, f"Validation error: {str(e)}"
\ No newline at end of file
+        return False, f"Validation error: {str(e)}"
@@ -0,0 +1,219 @@
+"""
+Bulk API Module for Radio Automation System
+Batch versions of the filename parser and job submission for automation
+clients (traffic systems, ingest scripts) that would otherwise make one
+HTTP request per file
+
+Both work as generators yielding one result per item, so a route can
+either collect them into a single JSON reply or stream them out as NDJSON
+(one JSON object per line) while the rest of the batch is still running.
+"""
+
+import os
+import logging
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from app.models import ShowAlias
+from app.pattern_matcher import parse_filename, get_filename_matcher
+from app.utils import allowed_file, validate_processing_options
+
+logger = logging.getLogger(__name__)
+
+# Per-item settings a client may pass, and the type each must have
+JOB_OPTION_TYPES = {
+    'output_format': str,
+    'normalize': bool,
+    'normalize_level': (int, float),
+    'sample_rate': int,
+    'bit_depth': int,
+    'channels': int,
+    'trim_silence': bool,
+    'template_id': int
+}
+
+def load_alias_map():
+    """All show aliases in one query: alias -> (show id, show name)"""
+    return {
+        alias.alias: (alias.show_id, alias.show.name)
+        for alias in ShowAlias.query.options(joinedload(ShowAlias.show)).all()
+    }
+
+def parse_filenames(filenames):
+    """
+    Parse many filenames and match them to shows
+    
+    The alias table is read once for the whole batch.
+    
+    Args:
+        filenames: Iterable of filenames
+    
+    Yields:
+        One result dictionary per filename, in order
+    """
+    aliases = load_alias_map()
+    matcher = get_filename_matcher()
+    
+    for index, filename in enumerate(filenames):
+        if not isinstance(filename, str):
+            yield {'index': index, 'filename': filename, 'success': False,
+                   'error': 'Filename must be a string'}
+            continue
+        
+        parsed = parse_filename(filename, matcher)
+        if parsed['show_id']:
+            show = (parsed['show_id'], parsed['show_name'])
+        else:
+            show = aliases.get(parsed['show_name'].lower()) if parsed['show_name'] else None
+        
+        yield {
+            'index': index,
+            'filename': filename,
+            'show_name': parsed['show_name'],
+            'show_id': show[0] if show else None,
+            'matched_show': show[1] if show else None,
+            'date': parsed['date'].isoformat() if parsed['date'] else None,
+            'year': parsed['year'],
+            'part': parsed['part'],
+            'success': parsed['success'],
+            'error': parsed['error']
+        }
+
+def clean_job_options(options):
+    """
+    Check a client's processing settings
+    
+    Args:
+        options: Dictionary from the request (may be None)
+    
+    Returns:
+        Tuple of (cleaned options, list of error messages)
+    """
+    options = options or {}
+    if not isinstance(options, dict):
+        return {}, ['Options must be an object']
+    
+    errors = []
+    cleaned = {}
+    for key, value in options.items():
+        expected = JOB_OPTION_TYPES.get(key)
+        if expected is None:
+            errors.append(f"Unknown option: {key}")
+        elif value is None:
+            continue
+        elif not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            errors.append(f"Option {key} has the wrong type")
+        else:
+            cleaned[key] = value
+    
+    if not errors:
+        checked = dict(cleaned, format=cleaned.get('output_format', 'wav'))
+        valid, problems = validate_processing_options(checked)
+        errors.extend(problems)
+    
+    return cleaned, errors
+
+def resolve_server_path(path, roots):
+    """
+    Make sure a server-side path is inside one of the allowed folders
+    
+    Args:
+        path: Path sent by the client
+        roots: BULK_IMPORT_ROOTS
+    
+    Returns:
+        Tuple of (real path or None, error message or None)
+    """
+    if not roots:
+        return None, 'Server-side paths are not enabled (BULK_IMPORT_ROOTS)'
+    
+    real_path = os.path.realpath(path)
+    for root in roots:
+        real_root = os.path.realpath(root)
+        if os.path.commonpath([real_path, real_root]) == real_root:
+            break
+    else:
+        return None, 'Path is outside the allowed import folders'
+    
+    if not os.path.isfile(real_path):
+        return None, 'File not found'
+    if not allowed_file(real_path):
+        return None, 'File type not allowed'
+    return real_path, None
+
+def submit_jobs(items, defaults=None, run_inline=False):
+    """
+    Queue many files as processing jobs
+    
+    Args:
+        items: Iterable of dictionaries, each with either
+                 - 'path': a file already on the server, or
+                 - 'upload_path': where an uploaded file was saved
+               plus optional 'filename', 'options' (merged over defaults)
+               and 'urgent'. An item with an 'error' is reported as failed.
+        defaults: Options applied to every item
+        run_inline: Process each job before moving on (no workers)
+    
+    Yields:
+        One result dictionary per item, in order
+    """
+    # Imported here because jobs loads the audio stack when a job runs
+    from app.jobs import create_job, run_job
+    
+    roots = current_app.config.get('BULK_IMPORT_ROOTS', [])
+    
+    for index, item in enumerate(items):
+        result = {'index': index, 'success': False}
+        if not isinstance(item, dict):
+            result['error'] = 'Item must be an object'
+            yield result
+            continue
+        if item.get('error'):
+            # Problem found while receiving the item (e.g. a bad upload)
+            result.update(filename=item.get('filename'), error=item['error'])
+            yield result
+            continue
+        
+        overrides = item.get('options') or {}
+        if not isinstance(overrides, dict):
+            result['error'] = 'Options must be an object'
+            yield result
+            continue
+        
+        options, errors = clean_job_options(dict(defaults or {}, **overrides))
+        if errors:
+            result['error'] = '; '.join(errors)
+            yield result
+            continue
+        
+        if item.get('upload_path'):
+            input_path = item['upload_path']
+            keep_input = False
+        else:
+            input_path, error = resolve_server_path(str(item.get('path', '')), roots)
+            if error:
+                result.update(path=item.get('path'), error=error)
+                yield result
+                continue
+            # Files already on the server belong to someone else - never delete them
+            keep_input = True
+        
+        filename = item.get('filename') or os.path.basename(input_path)
+        result['filename'] = filename
+        
+        job = create_job(filename, input_path, processing_options=options,
+                         urgent=bool(item.get('urgent')), remove_rejected=not keep_input)
+        result.update(job_id=job.id, status=job.status)
+        
+        if job.status == 'rejected':
+            result['error'] = job.validation_detail
+            yield result
+            continue
+        
+        if run_inline:
+            outcome = run_job(job)
+            result.update(status=job.status, processed_file_id=job.processed_file_id,
+                          error=outcome.get('error'))
+            result['success'] = outcome['success']
+        else:
+            result['success'] = True
+        yield result
@@ -0,0 +1,137 @@
+"""
+Show Catalog Module for Radio Automation System
+Loads the show list with aliases and file counts in a single query and
+caches it, along with the rendered show cards
+
+The cache is keyed by a fingerprint of the shows, aliases and processed
+files tables (row counts, newest ids and the latest show update), so any
+change to a show or alias - made by this process or another one - gives a
+new fingerprint. The fingerprint doubles as the ETag for the catalog page
+and API.
+"""
+
+import hashlib
+import threading
+from sqlalchemy import func, select
+from app import db
+from app.models import Show, ShowAlias, ProcessedFile
+
+_cache = {'fingerprint': None, 'entries': None, 'fragments': {}}
+_cache_lock = threading.Lock()
+
+def catalog_fingerprint():
+    """
+    Cheap summary of everything the catalog shows
+    
+    One aggregate query instead of loading any rows.
+    
+    Returns:
+        Short hex string that changes whenever the catalog would
+    """
+    summary = db.session.execute(select(
+        select(func.count(Show.id)).scalar_subquery(),
+        select(func.max(Show.updated_at)).scalar_subquery(),
+        select(func.count(ShowAlias.id)).scalar_subquery(),
+        select(func.max(ShowAlias.id)).scalar_subquery(),
+        select(func.count(ProcessedFile.id)).scalar_subquery(),
+        select(func.max(ProcessedFile.id)).scalar_subquery()
+    )).one()
+    return hashlib.sha1(repr(tuple(summary)).encode('utf-8')).hexdigest()[:16]
+
+def load_show_catalog():
+    """
+    Every show with its aliases and file count, from one query
+    
+    Shows are outer-joined to their aliases and to a grouped count of
+    processed files, so the number of queries doesn't grow with the
+    number of shows.
+    
+    Returns:
+        List of dictionaries sorted by show name
+    """
+    counts = select(
+        ProcessedFile.show_id,
+        func.count(ProcessedFile.id).label('file_count'),
+        func.max(ProcessedFile.processed_at).label('last_processed')
+    ).group_by(ProcessedFile.show_id).subquery()
+    
+    rows = db.session.query(Show, ShowAlias.alias, counts.c.file_count, counts.c.last_processed) \
+        .outerjoin(ShowAlias, ShowAlias.show_id == Show.id) \
+        .outerjoin(counts, counts.c.show_id == Show.id) \
+        .order_by(Show.name, ShowAlias.alias) \
+        .all()
+    
+    entries = []
+    by_id = {}
+    for show, alias, file_count, last_processed in rows:
+        entry = by_id.get(show.id)
+        if entry is None:
+            entry = {
+                'id': show.id,
+                'name': show.name,
+                'description': show.description,
+                'active': show.active,
+                'default_format': show.default_format,
+                'sample_rate': show.sample_rate,
+                'normalize': show.normalize,
+                'created_at': show.created_at,
+                'file_count': file_count or 0,
+                'last_processed': last_processed,
+                'aliases': []
+            }
+            by_id[show.id] = entry
+            entries.append(entry)
+        if alias:
+            entry['aliases'].append(alias)
+    
+    return entries
+
+def get_show_catalog():
+    """
+    The show catalog, loaded again only when its fingerprint changes
+    
+    Returns:
+        Tuple of (fingerprint, list of show dictionaries)
+    """
+    fingerprint = catalog_fingerprint()
+    with _cache_lock:
+        if _cache['fingerprint'] == fingerprint:
+            return fingerprint, _cache['entries']
+    
+    entries = load_show_catalog()
+    with _cache_lock:
+        _cache['fingerprint'] = fingerprint
+        _cache['entries'] = entries
+        _cache['fragments'] = {}
+    return fingerprint, entries
+
+def get_catalog_fragment(name, fingerprint, render):
+    """
+    Cached rendering of the catalog (e.g. the HTML show cards)
+    
+    Args:
+        name: Which rendering this is
+        fingerprint: Catalog fingerprint the rendering was made from
+        render: Function that produces the rendering on a cache miss
+    
+    Returns:
+        The cached or freshly rendered value
+    """
+    with _cache_lock:
+        if _cache['fingerprint'] == fingerprint and name in _cache['fragments']:
+            return _cache['fragments'][name]
+    
+    value = render()
+    with _cache_lock:
+        if _cache['fingerprint'] == fingerprint:
+            _cache['fragments'][name] = value
+    return value
+
+def catalog_to_json(entries):
+    """Catalog entries with dates turned into strings for the API"""
+    return [
+        dict(entry,
+             created_at=entry['created_at'].isoformat() if entry['created_at'] else None,
+             last_processed=entry['last_processed'].isoformat() if entry['last_processed'] else None)
+        for entry in entries
+    ]
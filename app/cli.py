@@ -0,0 +1,169 @@
+"""
+Command Line Tools for Radio Automation System
+Maintenance commands run with `flask <command>` (or `python run.py <command>`)
+
+Each command imports what it needs when it runs, so starting the CLI (and
+the web app, which registers these) stays quick.
+"""
+
+import click
+
+def register_commands(app):
+    """Attach the maintenance commands to the application"""
+    
+    @app.cli.command('retention')
+    @click.option('--dry-run', is_flag=True, help='Report what would be removed without deleting.')
+    def retention_command(dry_run):
+        """Delete processed files that are past their retention period."""
+        from app.retention import run_retention
+        
+        report = run_retention(dry_run=dry_run)
+        if not report['success']:
+            raise click.ClickException(report['error'])
+        
+        action = 'Would remove' if dry_run else 'Removed'
+        click.echo(f"{action} {report['files']} files "
+                   f"({report['bytes'] / (1024 * 1024):.1f} MB) in {report['duration']}s")
+        for folder, summary in sorted(report['folders'].items()):
+            click.echo(f"  {folder}: {summary['files']} files, "
+                       f"{summary['bytes'] / (1024 * 1024):.1f} MB")
+        if report['orphaned_peaks']:
+            click.echo(f"  (including {report['orphaned_peaks']} peaks files "
+                       f"whose audio was already gone)")
+        if not dry_run:
+            click.echo(f"Marked {report['records_expired']} database records as expired")
+        for error in report['errors']:
+            click.echo(f"  Error: {error}", err=True)
+    
+    @app.cli.command('rerender')
+    @click.option('--show', 'show_id', type=int, default=None, help='Only this show.')
+    @click.option('--limit', type=int, default=None, help='Stop after this many files.')
+    @click.option('--dry-run', is_flag=True, help='Report how many files are out of date.')
+    def rerender_command(show_id, limit, dry_run):
+        """Re-render outputs made with settings their show no longer uses."""
+        from app.rerender import run_rerender
+        
+        report = run_rerender(show_id=show_id, dry_run=dry_run, limit=limit, echo=click.echo)
+        if not report['success']:
+            raise click.ClickException(report['error'])
+        
+        if dry_run:
+            click.echo(f"{report['stale']} file(s) would be re-rendered")
+            return
+        click.echo(f"Re-rendered {report['rendered']} of {report['stale']} stale file(s) "
+                   f"in {report['duration']}s ({report['reused_loudness']} reused their "
+                   f"loudness measurement, {report['skipped']} had no source file)")
+        for error in report['errors']:
+            click.echo(f"  Error: {error}", err=True)
+    
+    @app.cli.command('add-jingle')
+    @click.argument('show_id', type=int)
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--label', default=None, help='Name for the jingle, e.g. "weekend intro".')
+    @click.option('--seconds', type=float, default=None,
+                  help='How much of the recording to use (default FINGERPRINT_SECONDS).')
+    def add_jingle_command(show_id, path, label, seconds):
+        """Fingerprint a show's opening jingle from a recording that starts with it."""
+        from app.models import Show
+        from app.audio_fingerprint import add_jingle
+        
+        show = Show.query.get(show_id)
+        if show is None:
+            raise click.ClickException(f"No show with id {show_id}")
+        
+        result = add_jingle(show, path, label=label, seconds=seconds, config=app.config)
+        if not result['success']:
+            raise click.ClickException(result['error'])
+        click.echo(f"Added jingle to {show.name}: {result['jingle'].hash_count} hashes "
+                   f"from {result['jingle'].duration}s of audio")
+    
+    @app.cli.command('identify')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    def identify_command(path):
+        """Say which show a file is from, by its opening jingle."""
+        from app.models import Show
+        from app.audio_fingerprint import identify_show
+        
+        result = identify_show(path, app.config)
+        if not result['success']:
+            raise click.ClickException(f"{result['error']} ({result['votes']} matching hashes)")
+        show = Show.query.get(result['show_id'])
+        click.echo(f"{show.name}: {result['votes']} matching hashes, "
+                   f"jingle starts at {result['offset']}s")
+    
+    @app.cli.command('worker')
+    @click.option('--threads', type=int, default=None,
+                  help='Jobs to run at once (default PROCESSING_WORKERS).')
+    def worker_command(threads):
+        """Process queued jobs until stopped (run on as many machines as needed)."""
+        from app.scheduler import start_workers
+        
+        threads = threads or max(1, app.config.get('PROCESSING_WORKERS', 2))
+        click.echo(f"Starting {threads} worker thread(s), Ctrl+C to stop")
+        pool = start_workers(app, count=threads)
+        
+        # Jobs still running when the worker is stopped are picked up by
+        # another worker once their lease runs out
+        pool.join()
+    
+    @app.cli.command('ingest')
+    @click.argument('directory', type=click.Path(exists=True, file_okay=False))
+    @click.option('--workers', type=int, default=2, show_default=True,
+                  help='Files processed at once.')
+    @click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+                  help='Checkpoint file (default: one per folder in instance/).')
+    @click.option('--format', 'output_format', default=None,
+                  help='Output format (default: each show\'s settings).')
+    @click.option('--normalize/--no-normalize', default=None,
+                  help='Override normalization.')
+    @click.option('--template-id', type=int, default=None, help='Processing template to apply.')
+    def ingest_command(directory, workers, checkpoint, output_format, normalize, template_id):
+        """Process every audio file under DIRECTORY, resuming where the last run stopped."""
+        from app.ingest import run_ingest
+        
+        options = {'output_format': output_format, 'normalize': normalize,
+                   'template_id': template_id}
+        options = {key: value for key, value in options.items() if value is not None}
+        
+        summary = run_ingest(app, directory, workers=workers, checkpoint_path=checkpoint,
+                             processing_options=options, echo=click.echo)
+        
+        for error in summary['errors']:
+            click.echo(f"  Error: {error}", err=True)
+        click.echo(f"Processed {summary['processed']}, failed {summary['failed']}, "
+                   f"skipped {summary['skipped']} already done, in {summary['duration']}s")
+        if summary['interrupted']:
+            click.echo("Interrupted - run the same command again to carry on")
+    
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing database tables and the default shows."""
+        from app import init_database
+        
+        seeded = init_database()
+        click.echo("Database tables are up to date")
+        if seeded:
+            click.echo("Added the default shows")
+    
+    @app.cli.command('startup-report')
+    @click.option('--last', type=int, default=20, show_default=True,
+                  help='Number of past startups to summarise.')
+    def startup_report_command(last):
+        """Show how long startup took, now and over time (STARTUP_TIMING_FILE)."""
+        from app.startup import read_startup_history, summarize_startups
+        
+        report = app.extensions.get('startup_timing', {})
+        click.echo(f"This startup: {report.get('total_ms', 0):.0f}ms")
+        for phase, ms in report.get('phases', {}).items():
+            click.echo(f"  {phase:<12} {ms:8.1f}ms")
+        
+        path = app.config.get('STARTUP_TIMING_FILE')
+        if not path:
+            click.echo("Set STARTUP_TIMING_FILE to keep a history of startup times")
+            return
+        
+        summary = summarize_startups(read_startup_history(path, limit=last))
+        if summary['count']:
+            click.echo(f"Last {summary['count']} startups: median {summary['median_ms']:.0f}ms, "
+                       f"p90 {summary['p90_ms']:.0f}ms, fastest {summary['fastest_ms']:.0f}ms, "
+                       f"slowest {summary['slowest_ms']:.0f}ms")
@@ -0,0 +1,120 @@
+"""
+File Delivery Module for Radio Automation System
+Sends processed files to the browser with Range and conditional request
+support, or hands them off to the front-end web server
+"""
+
+import os
+import mimetypes
+import logging
+from flask import current_app, request, send_file, make_response
+from werkzeug.http import http_date, quote_etag, unquote_etag, parse_date
+
+logger = logging.getLogger(__name__)
+
+# Offload modes for DOWNLOAD_OFFLOAD
+OFFLOAD_X_SENDFILE = 'x-sendfile'              # Apache mod_xsendfile, lighttpd
+OFFLOAD_X_ACCEL_REDIRECT = 'x-accel-redirect'  # nginx
+
+def file_etag(stat_result):
+    """
+    Build an ETag from a file's size and modification time
+    
+    Cheap to compute (no hashing of multi-GB files) and changes whenever a
+    file is re-rendered in place.
+    """
+    return f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+
+def send_processed_file(path, download_name=None):
+    """
+    Send a processed file as a download
+    
+    Resumed downloads and seeking players get just the bytes they ask for
+    (HTTP Range), and repeat requests are answered with 304 Not Modified
+    when the file hasn't changed. If DOWNLOAD_OFFLOAD is set, the transfer
+    itself is handed to the front-end server so no worker is tied up.
+    
+    Args:
+        path: Path to the file (relative paths are relative to the working directory)
+        download_name: Filename offered to the browser (default: the file's name)
+    
+    Returns:
+        Flask response
+    """
+    path = os.path.abspath(path)
+    stat_result = os.stat(path)
+    download_name = download_name or os.path.basename(path)
+    etag = file_etag(stat_result)
+    
+    offload = (current_app.config.get('DOWNLOAD_OFFLOAD') or '').lower()
+    if offload in (OFFLOAD_X_SENDFILE, OFFLOAD_X_ACCEL_REDIRECT):
+        return _offload_response(path, stat_result, download_name, etag, offload)
+    
+    response = send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+        last_modified=stat_result.st_mtime,
+        max_age=current_app.config.get('DOWNLOAD_MAX_AGE', 0)
+    )
+    
+    # Tell players up front that they can seek with Range requests
+    response.accept_ranges = 'bytes'
+    return response
+
+def _offload_response(path, stat_result, download_name, etag, offload):
+    """
+    Build an empty response telling the front-end server which file to send
+    
+    The front-end server handles Range requests itself; conditional
+    requests are answered here so unchanged files never leave Flask.
+    """
+    if _not_modified(etag, stat_result.st_mtime):
+        response = make_response('', 304)
+    else:
+        response = make_response('')
+        mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+        response.headers['Content-Type'] = mimetype
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        
+        if offload == OFFLOAD_X_SENDFILE:
+            response.headers['X-Sendfile'] = path
+        else:
+            response.headers['X-Accel-Redirect'] = _accel_location(path)
+    
+    response.headers['ETag'] = quote_etag(etag)
+    response.headers['Last-Modified'] = http_date(stat_result.st_mtime)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+def _not_modified(etag, mtime):
+    """Check If-None-Match / If-Modified-Since against the current file"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = [unquote_etag(tag.strip())[0] for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    
+    if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+    if if_modified_since:
+        return int(mtime) <= int(if_modified_since.timestamp())
+    
+    return False
+
+def _accel_location(path):
+    """
+    Map a file path to nginx's internal location
+    
+    Files under PROCESSED_FOLDER are served from DOWNLOAD_ACCEL_PREFIX, e.g.
+    processed/2024/show.wav -> /protected/processed/2024/show.wav
+    """
+    config = current_app.config
+    root = os.path.abspath(config.get('PROCESSED_FOLDER', 'processed'))
+    prefix = config.get('DOWNLOAD_ACCEL_PREFIX', '/protected/processed/')
+    
+    relative = os.path.relpath(path, root)
+    if relative.startswith('..'):
+        raise ValueError(f"{path} is outside the processed folder")
+    
+    return prefix.rstrip('/') + '/' + relative.replace(os.sep, '/')
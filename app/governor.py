@@ -0,0 +1,301 @@
+"""
+Resource Governor Module for Radio Automation System
+Keeps FFmpeg from starving the playout machine when processing shares a
+host with on-air systems
+
+Every FFmpeg process started through run_ffmpeg gets:
+  - a lower CPU priority (FFMPEG_NICE) and I/O priority (FFMPEG_IONICE_CLASS)
+  - a set of CPUs it may use (FFMPEG_CPU_SETS, one set per worker)
+  - a cap on its decoder and filter threads (FFMPEG_THREADS)
+  - a watchdog that kills it when it runs longer than FFMPEG_TIMEOUT_SECONDS
+    or uses more memory than FFMPEG_MEMORY_LIMIT_MB
+
+When a limit kills a process, the event is collected by resource_scope()
+so run_job can store it on the job. A scope can also carry a cancel event
+(set when a worker loses its job's lease): FFmpeg runs in the scope are
+then killed, and new ones aren't started. A detached scope starts its
+FFmpeg runs in their own session, so a Ctrl+C at the terminal stops the
+Python side without killing the files already being rendered.
+"""
+
+import os
+import time
+import shutil
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# I/O scheduling classes understood by ionice
+IONICE_CLASSES = {'realtime': '1', 'best-effort': '2', 'idle': '3'}
+
+# How often the watchdog looks at a running process (seconds)
+WATCHDOG_INTERVAL = 0.5
+
+_local = threading.local()
+
+def parse_cpu_sets(spec):
+    """
+    Read FFMPEG_CPU_SETS
+    
+    Args:
+        spec: Sets separated by ";", each a list of CPUs and ranges,
+              e.g. "2-3;4-5" (worker 0 on CPUs 2 and 3, worker 1 on 4 and 5)
+    
+    Returns:
+        List of sets of CPU numbers (empty when spec is empty)
+    """
+    cpu_sets = []
+    for part in (spec or '').split(';'):
+        cpus = set()
+        for item in part.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if '-' in item:
+                first, last = item.split('-', 1)
+                cpus.update(range(int(first), int(last) + 1))
+            else:
+                cpus.add(int(item))
+        if cpus:
+            cpu_sets.append(cpus)
+    return cpu_sets
+
+def get_limits(config):
+    """The FFMPEG_* settings, with the CPU sets parsed"""
+    return {
+        'nice': config.get('FFMPEG_NICE', 0),
+        'ionice_class': config.get('FFMPEG_IONICE_CLASS'),
+        'ionice_level': config.get('FFMPEG_IONICE_LEVEL', 7),
+        'cpu_sets': parse_cpu_sets(config.get('FFMPEG_CPU_SETS')),
+        'threads': config.get('FFMPEG_THREADS', 0),
+        'timeout': config.get('FFMPEG_TIMEOUT_SECONDS', 0),
+        'memory_mb': config.get('FFMPEG_MEMORY_LIMIT_MB', 0)
+    }
+
+class resource_scope:
+    """
+    Mark the work this thread does as belonging to one worker, and collect
+    any limits that had to be enforced
+    
+    Usage:
+        with resource_scope(slot=2, cancel=heartbeat.lost) as scope:
+            process_audio_file(...)
+        scope.events  # e.g. [{'limit': 'timeout', ...}]
+    """
+    
+    def __init__(self, slot=None, cancel=None, detach=False):
+        self.slot = slot
+        self.cancel = cancel  # threading.Event set when the work should stop
+        self.detach = detach  # Keep FFmpeg out of the terminal's Ctrl+C
+        self.events = []
+    
+    def cancelled(self):
+        """True once the scope's cancel event has been set"""
+        return self.cancel is not None and self.cancel.is_set()
+    
+    def __enter__(self):
+        self._previous = getattr(_local, 'scope', None)
+        _local.scope = self
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.scope = self._previous
+        return False
+
+def current_scope():
+    """The resource_scope this thread is working in (None outside one)"""
+    return getattr(_local, 'scope', None)
+
+def is_detached():
+    """True if FFmpeg started by this thread should run in its own session"""
+    scope = getattr(_local, 'scope', None)
+    return scope is not None and scope.detach
+
+def is_cancelled():
+    """True if the work this thread is doing has been cancelled"""
+    scope = getattr(_local, 'scope', None)
+    return scope is not None and scope.cancelled()
+
+def run_in_scope(scope, func, *args, **kwargs):
+    """
+    Call func on this thread as part of another thread's resource_scope
+    
+    Helper threads (such as parallel segment renders) use this so their
+    FFmpeg runs get the worker's CPUs and report limits to its job.
+    """
+    previous = getattr(_local, 'scope', None)
+    _local.scope = scope
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _local.scope = previous
+
+def available_cpus(limits):
+    """
+    Number of CPUs this worker's FFmpeg runs may use: its FFMPEG_CPU_SETS
+    entry, or every CPU the app may run on when no sets are configured
+    """
+    cpus = _cpus_for_this_worker(limits['cpu_sets'])
+    if cpus:
+        return len(cpus)
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def worker_slot_from_id(worker_id):
+    """Worker number from a host:pid:number worker ID (None if there isn't one)"""
+    if not worker_id:
+        return None
+    number = worker_id.rsplit(':', 1)[-1]
+    return int(number) if number.isdigit() else None
+
+def governed_command(cmd, limits):
+    """
+    Add the thread caps to an FFmpeg command and wrap it in ionice
+    
+    Args:
+        cmd: FFmpeg command list (starting with 'ffmpeg')
+        limits: Dictionary from get_limits
+    
+    Returns:
+        New command list
+    """
+    cmd = list(cmd)
+    if limits['threads'] and cmd and os.path.basename(cmd[0]) == 'ffmpeg':
+        threads = str(limits['threads'])
+        cmd[1:1] = ['-filter_threads', threads, '-threads', threads]
+    
+    ionice_class = IONICE_CLASSES.get(limits['ionice_class'] or '')
+    if ionice_class and _ionice_path():
+        prefix = [_ionice_path(), '-c', ionice_class]
+        if ionice_class == '2':
+            prefix.extend(['-n', str(limits['ionice_level'])])
+        cmd = prefix + cmd
+    return cmd
+
+def _ionice_path():
+    """Path of the ionice tool (util-linux), looked up once"""
+    if not hasattr(_ionice_path, 'path'):
+        _ionice_path.path = shutil.which('ionice')
+        if _ionice_path.path is None:
+            logger.warning("ionice not found - FFmpeg I/O priority is not lowered")
+    return _ionice_path.path
+
+def apply_process_limits(pid, limits):
+    """
+    Lower the CPU priority of a started process and pin it to its CPUs
+    
+    Errors are logged, not raised - a missing limit shouldn't fail a job.
+    """
+    if limits['nice']:
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, limits['nice'])
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Could not renice FFmpeg process {pid}: {str(e)}")
+    
+    cpus = _cpus_for_this_worker(limits['cpu_sets'])
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(pid, cpus)
+        except OSError as e:
+            logger.warning(f"Could not set CPU affinity {sorted(cpus)} for FFmpeg: {str(e)}")
+
+def _cpus_for_this_worker(cpu_sets):
+    """This worker's CPU set, or all listed CPUs when the worker isn't known"""
+    if not cpu_sets:
+        return None
+    scope = getattr(_local, 'scope', None)
+    if scope is None or scope.slot is None:
+        return set().union(*cpu_sets)
+    return cpu_sets[scope.slot % len(cpu_sets)]
+
+class Watchdog:
+    """
+    Kills a process that runs too long, uses too much memory, or whose
+    work was cancelled
+    
+    Usage:
+        with Watchdog(process, limits, name='render') as watchdog:
+            ... wait for the process ...
+        watchdog.event  # None, or what was enforced
+        watchdog.cancelled  # True if it was stopped because of a cancel
+    """
+    
+    def __init__(self, process, limits, name=None):
+        self.process = process
+        self.timeout = limits['timeout']
+        self.memory_bytes = limits['memory_mb'] * 1024 * 1024
+        self.name = name
+        self.event = None
+        self.cancelled = False
+        scope = getattr(_local, 'scope', None)
+        self._cancel = scope.cancel if scope is not None else None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def __enter__(self):
+        if self.timeout or self.memory_bytes or self._cancel is not None:
+            self._started = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name='ffmpeg-watchdog', daemon=True)
+            self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self.event:
+            scope = getattr(_local, 'scope', None)
+            if scope is not None:
+                scope.events.append(self.event)
+        return False
+    
+    def _run(self):
+        while not self._stop.wait(WATCHDOG_INTERVAL):
+            if self.process.poll() is not None:
+                return
+            
+            if self._cancel is not None and self._cancel.is_set():
+                # Not a resource limit, so no event is recorded
+                self.cancelled = True
+                logger.warning(f"Stopping FFmpeg ({self.name or 'unnamed'}): the job was cancelled")
+                self.process.kill()
+                return
+            
+            elapsed = time.monotonic() - self._started
+            if self.timeout and elapsed > self.timeout:
+                self._kill('timeout', f"ran longer than {self.timeout}s", elapsed)
+                return
+            
+            if self.memory_bytes:
+                rss = _resident_bytes(self.process.pid)
+                if rss and rss > self.memory_bytes:
+                    self._kill('memory', f"used {rss // (1024 * 1024)}MB, limit "
+                               f"{self.memory_bytes // (1024 * 1024)}MB", elapsed)
+                    return
+    
+    def _kill(self, limit, detail, elapsed):
+        self.event = {
+            'limit': limit,
+            'detail': detail,
+            'step': self.name,
+            'elapsed_seconds': round(elapsed, 1),
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        logger.warning(f"Killing FFmpeg ({self.name or 'unnamed'}): {detail}")
+        self.process.kill()
+    
+    def message(self):
+        """Error text for a killed process"""
+        if self.cancelled:
+            return "FFmpeg stopped: the job was cancelled"
+        return f"FFmpeg stopped by the resource governor: {self.event['detail']}" if self.event else None
+
+def _resident_bytes(pid):
+    """Resident memory of a process from /proc (None where that isn't available)"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,266 @@
+"""
+Bulk Ingest Module for Radio Automation System
+Processes a whole folder tree of audio files from the command line
+(`python run.py ingest DIR --workers N`), without going through the web
+upload form
+
+Every finished file is written to a checkpoint file straight away, so a
+long backfill can be stopped at any point and started again with the same
+command - files that are already done are skipped.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import threading
+import logging
+from datetime import datetime
+from app import db
+from app.audio_processor import process_audio_file
+from app.admission import wait_for_capacity
+from app.governor import resource_scope
+
+logger = logging.getLogger(__name__)
+
+# How often the progress line is refreshed (seconds)
+PROGRESS_INTERVAL = 1.0
+
+# Progress is printed as separate lines this often when not on a terminal
+PROGRESS_LOG_INTERVAL = 30.0
+
+def find_audio_files(root, extensions):
+    """
+    Walk a folder tree and list the audio files in it
+    
+    Args:
+        root: Folder to scan
+        extensions: Allowed extensions (without the dot)
+    
+    Returns:
+        List of (path, size, key) tuples sorted by path. The key identifies
+        this version of the file for the checkpoint.
+    """
+    files = []
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            logger.warning(f"Could not scan {directory}: {str(e)}")
+            continue
+        
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                
+                extension = os.path.splitext(entry.name)[1].lower().lstrip('.')
+                if extension not in extensions or not entry.is_file():
+                    continue
+                
+                stat_result = entry.stat()
+                files.append((entry.path, stat_result.st_size,
+                              checkpoint_key(root, entry.path, stat_result)))
+    
+    files.sort()
+    return files
+
+def checkpoint_key(root, path, stat_result):
+    """A file counts as done only while its size and modification time are unchanged"""
+    relative = os.path.relpath(path, root)
+    return f"{relative}|{stat_result.st_size}|{stat_result.st_mtime_ns}"
+
+def default_checkpoint_path(instance_path, root):
+    """Checkpoint file for a folder, kept in the instance folder"""
+    digest = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(instance_path, f"ingest-{digest}.jsonl")
+
+class Checkpoint:
+    """
+    Append-only record of the files that have been processed
+    
+    One JSON line per file, flushed to disk as soon as the file is done.
+    A line cut short by a crash is ignored when the checkpoint is loaded.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)['key'])
+                    except (ValueError, KeyError):
+                        continue
+        
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+    
+    def record(self, key, file_id):
+        """Mark a file as done"""
+        line = json.dumps({'key': key, 'file_id': file_id,
+                           'at': datetime.utcnow().isoformat()})
+        with self._lock:
+            self.done.add(key)
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+    
+    def close(self):
+        self._file.close()
+
+class Progress:
+    """Counters shared by the ingest workers, and the live status line"""
+    
+    def __init__(self, total_files, total_bytes):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def add(self, size, success):
+        with self._lock:
+            self.done += 1
+            self.bytes_done += size
+            if not success:
+                self.failed += 1
+    
+    def line(self):
+        """One-line summary such as: 120/40000 files  2.4 files/s  31.0 MB/s  ETA 4h36m"""
+        elapsed = max(time.monotonic() - self.started, 0.001)
+        rate = self.done / elapsed
+        megabytes = self.bytes_done / elapsed / (1024 * 1024)
+        
+        eta = '--'
+        if self.bytes_done:
+            remaining = (self.total_bytes - self.bytes_done) / (self.bytes_done / elapsed)
+            minutes = int(remaining // 60)
+            if minutes >= 60:
+                eta = f"{minutes // 60}h{minutes % 60:02d}m"
+            else:
+                eta = f"{minutes}m{int(remaining % 60):02d}s"
+        
+        return (f"{self.done}/{self.total_files} files  {rate:.1f} files/s  "
+                f"{megabytes:.1f} MB/s  ETA {eta}  failed {self.failed}")
+
+def run_ingest(app, root, workers=2, checkpoint_path=None, processing_options=None,
+               echo=print):
+    """
+    Process every audio file under a folder
+    
+    Args:
+        app: Flask application (each worker thread needs an app context)
+        root: Folder to ingest
+        workers: Number of files processed at once
+        checkpoint_path: Checkpoint file (default: one per folder in instance/)
+        processing_options: Passed on to process_audio_file
+        echo: Where progress and errors are written
+    
+    Returns:
+        Summary dictionary (found, skipped, processed, failed, errors,
+        duration, interrupted)
+    """
+    processing_options = processing_options or {}
+    extensions = app.config.get('ALLOWED_EXTENSIONS', {'wav', 'mp3', 'aiff', 'flac', 'm4a'})
+    checkpoint_path = checkpoint_path or default_checkpoint_path(app.instance_path, root)
+    
+    files = find_audio_files(root, extensions)
+    checkpoint = Checkpoint(checkpoint_path)
+    pending = [item for item in files if item[2] not in checkpoint.done]
+    
+    echo(f"Found {len(files)} audio files, {len(files) - len(pending)} already done "
+         f"(checkpoint {checkpoint_path})")
+    
+    progress = Progress(len(pending), sum(size for _, size, _ in pending))
+    errors = []
+    work = queue.Queue()
+    for item in pending:
+        work.put(item)
+    stop = threading.Event()
+    
+    def worker(slot):
+        # The slot picks this thread's FFMPEG_CPU_SETS entry
+        # Detached, so Ctrl+C lets the files in progress finish
+        with app.app_context(), resource_scope(slot=slot, detach=True):
+            while not stop.is_set():
+                try:
+                    path, size, key = work.get_nowait()
+                except queue.Empty:
+                    break
+                
+                # Back off while the web queue is full or the disk is low,
+                # so a backfill doesn't starve uploads from the feeds
+                if not wait_for_capacity(app.config, incoming_bytes=size, stop=stop,
+                                         echo=echo):
+                    break
+                
+                try:
+                    result = process_audio_file(path, **processing_options)
+                except Exception as e:
+                    db.session.rollback()
+                    result = {'success': False, 'error': str(e)}
+                
+                # A file cut short by Ctrl+C isn't a real failure - it runs next time
+                if stop.is_set() and not result['success']:
+                    break
+                
+                if result['success']:
+                    checkpoint.record(key, result.get('file_id'))
+                else:
+                    errors.append(f"{path}: {result['error']}")
+                progress.add(size, result['success'])
+            db.session.remove()
+    
+    threads = [threading.Thread(target=worker, args=(slot,), daemon=True)
+               for slot in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    
+    interrupted = False
+    interactive = sys.stdout.isatty()
+    last_log = time.monotonic()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(PROGRESS_INTERVAL)
+            if interactive:
+                sys.stdout.write('\r' + progress.line() + '   ')
+                sys.stdout.flush()
+            elif time.monotonic() - last_log >= PROGRESS_LOG_INTERVAL:
+                echo(progress.line())
+                last_log = time.monotonic()
+    except KeyboardInterrupt:
+        interrupted = True
+        stop.set()
+        echo("\nStopping after the files in progress "
+             "(any that don't finish are redone next run)...")
+        for thread in threads:
+            thread.join()
+    finally:
+        checkpoint.close()
+    
+    if interactive:
+        sys.stdout.write('\n')
+    echo(progress.line())
+    
+    return {
+        'found': len(files),
+        'skipped': len(files) - len(pending),
+        'processed': progress.done - progress.failed,
+        'failed': progress.failed,
+        'errors': errors,
+        'duration': round(time.monotonic() - progress.started, 2),
+        'interrupted': interrupted
+    }
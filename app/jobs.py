@@ -0,0 +1,181 @@
+"""
+Processing Jobs Module for Radio Automation System
+Creates a job for each uploaded file, validates it and runs it through
+the audio processor, recording the outcome on the job
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import ProcessingJob, ProcessedFile
+from app.validation import sniff_audio_header, should_deep_check, start_integrity_check
+from app.scheduler import find_show_for_filename, compute_deadline
+from app.profiling import activity
+from app.log_pipeline import log_context
+from app.governor import resource_scope, worker_slot_from_id
+
+logger = logging.getLogger(__name__)
+
+def create_job(filename, input_path, processing_options=None, urgent=False,
+               remove_rejected=True):
+    """
+    Register an uploaded file as a job, checking its header first
+    
+    Files that fail the header check are rejected straight away and
+    removed from the upload folder. Files that pass may also get a full
+    decode check in the background (see VALIDATION_DEEP_CHECK), and are
+    given a deadline from the show and air date in their filename.
+    
+    Args:
+        filename: Name of the uploaded file
+        input_path: Where the upload was saved
+        processing_options: Arguments for process_audio_file, kept on the
+                            job so a worker can run it later
+        urgent: Put the job ahead of everything else in the queue
+        remove_rejected: Delete the file if it fails the header check (off
+                         for files that were already on the server)
+    
+    Returns:
+        The new ProcessingJob (status 'queued' or 'rejected')
+    """
+    sniff = sniff_audio_header(input_path)
+    
+    job = ProcessingJob(
+        filename=filename,
+        input_path=input_path,
+        detected_format=sniff['format']
+    )
+    
+    if not sniff['valid']:
+        job.status = 'rejected'
+        job.validation_status = 'rejected'
+        job.validation_detail = sniff['error']
+        job.finished_at = datetime.utcnow()
+        db.session.add(job)
+        db.session.commit()
+        
+        if remove_rejected:
+            try:
+                os.remove(input_path)
+            except OSError:
+                pass
+        logger.warning(f"Rejected upload {filename}: {sniff['error']}")
+        return job
+    
+    show, air_date = find_show_for_filename(filename)
+    job.show_id = show.id if show else None
+    job.air_date = air_date
+    job.deadline = compute_deadline(show, air_date, current_app.config)
+    job.urgent = urgent
+    job.processing_options = json.dumps(processing_options or {})
+    
+    job.validation_status = 'suspicious' if sniff['suspicious'] else 'passed'
+    job.validation_detail = '; '.join(sniff['reasons']) or None
+    
+    mode = current_app.config.get('VALIDATION_DEEP_CHECK', 'suspicious')
+    if should_deep_check(sniff, mode):
+        job.integrity_status = 'pending'
+    
+    db.session.add(job)
+    db.session.commit()
+    
+    if job.integrity_status == 'pending':
+        start_integrity_check(current_app._get_current_object(), job.id)
+    
+    return job
+
+def run_job(job, worker_id=None, cancel=None, **processing_options):
+    """
+    Process a queued job and record the result on it
+    
+    Args:
+        job: ProcessingJob to run
+        worker_id: Worker holding the job's lease - the result is only
+                   recorded if it still holds it
+        cancel: Optional threading.Event (the Heartbeat's `lost`) - once
+                set, the job's FFmpeg runs are stopped and its partial
+                outputs discarded
+        **processing_options: Passed on to process_audio_file (defaults to
+                              the options stored when the job was created)
+    
+    Returns:
+        Result dictionary from process_audio_file
+    """
+    # Imported here so the web app can start without loading the audio stack
+    from app.audio_processor import process_audio_file
+    
+    if not processing_options and job.processing_options:
+        processing_options = json.loads(job.processing_options)
+    
+    # Jobs run by a worker were already marked when they were claimed
+    if worker_id is None:
+        job.status = 'processing'
+        job.started_at = job.started_at or datetime.utcnow()
+        db.session.commit()
+    
+    scope = resource_scope(slot=worker_slot_from_id(worker_id), cancel=cancel)
+    try:
+        with activity(f"job {job.id}"), log_context(job_id=job.id), scope:
+            # The job's name (e.g. a bulk filename override) decides the
+            # show and date, so the render agrees with the job's deadline
+            result = process_audio_file(job.input_path, source_name=job.filename,
+                                        **processing_options)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    
+    outcome = {'finished_at': datetime.utcnow(), 'lease_expires_at': None}
+    if scope.events:
+        # Which FFmpeg limits had to be enforced (timeout, memory)
+        outcome['resource_events'] = json.dumps(scope.events)
+    if result['success']:
+        outcome.update(status='completed', processed_file_id=result['file_id'])
+        if job.show_id is None and result.get('show_id'):
+            # The show was recognised from the audio rather than the name
+            outcome['show_id'] = result['show_id']
+    else:
+        outcome.update(status='failed', error_message=result['error'])
+    
+    # Conditional update so a worker that lost its lease can't overwrite
+    # the job after another worker has taken it over
+    query = ProcessingJob.query.filter_by(id=job.id)
+    if worker_id is not None:
+        query = query.filter_by(worker_id=worker_id, status='processing')
+    if not query.update(outcome, synchronize_session=False):
+        logger.warning(f"Job {job.id} was taken over by another worker, result of {worker_id} discarded")
+        if result.get('file_id'):
+            # Finished just as the lease ran out - the new owner renders
+            # the file again, so this copy would only be an orphan
+            discard_render(result['file_id'])
+    db.session.commit()
+    db.session.refresh(job)
+    
+    return result
+
+def discard_render(processed_file_id):
+    """
+    Remove a render nothing refers to: its output files, peaks files and
+    database records
+    """
+    # Imported here because the waveform module loads numpy
+    from app.waveform import get_peaks_path
+    
+    processed_file = ProcessedFile.query.get(processed_file_id)
+    if processed_file is None:
+        return
+    
+    paths = [output.output_filename for output in processed_file.outputs] or \
+        [processed_file.output_filename]
+    for path in filter(None, paths):
+        for obsolete in (path, get_peaks_path(path)):
+            try:
+                os.remove(obsolete)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove orphaned output {obsolete}: {str(e)}")
+    
+    db.session.delete(processed_file)
+    logger.info(f"Discarded orphaned render {processed_file_id} ({processed_file.original_filename})")
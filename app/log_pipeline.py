@@ -0,0 +1,210 @@
+"""
+Logging Pipeline Module for Radio Automation System
+Writes the application log as structured JSON without blocking the code
+that logs
+
+Log calls only put the record on an in-memory queue (QueueHandler); a
+single listener thread per process formats it and writes it to the log
+file. The file can be shared by several worker processes - rotation is
+done under a lock file, and a process that finds the file was rotated by
+another one reopens it.
+
+Each record carries whatever is known about the work in progress: the
+request, the job ID, the show and the file, added by log_context(), and
+for finished files the time spent in each stage of processing.
+"""
+
+import os
+import sys
+import queue
+import atexit
+import functools
+import threading
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import request, has_request_context
+from flask.logging import default_handler
+
+try:
+    import fcntl
+except ImportError:  # Windows - rotation is left to a single process
+    fcntl = None
+
+try:
+    from pythonjsonlogger import jsonlogger
+except ImportError:
+    jsonlogger = None
+
+# Fields written to every JSON record (extra fields are added after these)
+JSON_FIELDS = '%(asctime)s %(levelname)s %(name)s %(message)s %(process)d %(threadName)s'
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# Context of the work the current thread is doing
+_local = threading.local()
+
+# One listener per process, however many apps are created
+_listener = None
+_listener_lock = threading.Lock()
+
+class log_context:
+    """
+    Add fields to every log record written by this thread
+    
+    Usage:
+        with log_context(job_id=job.id):
+            ... every logger call in here carries job_id ...
+    """
+    
+    def __init__(self, **fields):
+        self.fields = fields
+    
+    def __enter__(self):
+        self._previous = getattr(_local, 'fields', None)
+        _local.fields = dict(self._previous or {}, **self.fields)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.fields = self._previous
+        return False
+
+def update_log_context(**fields):
+    """Add fields to the innermost log_context (ignored outside one)"""
+    current = getattr(_local, 'fields', None)
+    if current is not None:
+        current.update({key: value for key, value in fields.items() if value is not None})
+
+def with_file_context(func):
+    """Log everything a processing function does with the file it's working on"""
+    @functools.wraps(func)
+    def wrapper(input_path, *args, **kwargs):
+        with log_context(file=kwargs.get('source_name') or os.path.basename(input_path)):
+            return func(input_path, *args, **kwargs)
+    return wrapper
+
+class ContextFilter(logging.Filter):
+    """
+    Copy the request and log_context fields onto each record
+    
+    Runs in the thread that logs, before the record is queued, since the
+    listener thread can't see the request or the thread's context.
+    """
+    
+    def filter(self, record):
+        for key, value in (getattr(_local, 'fields', None) or {}).items():
+            setattr(record, key, value)
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.remote_addr = request.remote_addr
+        return True
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that several processes can write to
+    
+    Each record is written with a single append while holding a lock file,
+    so lines from different processes never interleave, and only one
+    process rotates the file at a time.
+    """
+    
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._lock_file = open(self.baseFilename + '.lock', 'a') if fcntl else None
+    
+    def emit(self, record):
+        if self._lock_file is None:
+            return super().emit(record)
+        
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+    
+    def _reopen_if_rotated(self):
+        """Another process may have renamed the file we have open"""
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = self._open()
+    
+    def close(self):
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+def build_formatter(log_format):
+    """JSON formatter (python-json-logger), or plain text if it's missing or not wanted"""
+    if log_format == 'json' and jsonlogger is not None:
+        return jsonlogger.JsonFormatter(JSON_FIELDS)
+    return logging.Formatter(TEXT_FORMAT)
+
+def configure_logging(app):
+    """
+    Send the app's log records through a queue to a listener thread
+    
+    The listener and its handlers are set up once per process, and later
+    apps reuse them.
+    """
+    global _listener
+    
+    level = getattr(logging, str(app.config.get('LOG_LEVEL', 'INFO')).upper(), logging.INFO)
+    
+    with _listener_lock:
+        if _listener is None:
+            formatter = build_formatter(app.config.get('LOG_FORMAT', 'json'))
+            handlers = []
+            
+            log_file = app.config.get('LOG_FILE', 'logs/radio_automation.log')
+            if log_file:
+                os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+                file_handler = SharedRotatingFileHandler(
+                    log_file,
+                    maxBytes=app.config.get('LOG_MAX_BYTES', 10240000),
+                    backupCount=app.config.get('LOG_BACKUP_COUNT', 10)
+                )
+                file_handler.setFormatter(formatter)
+                handlers.append(file_handler)
+            
+            if app.config.get('LOG_TO_STDOUT'):
+                stream_handler = logging.StreamHandler(sys.stdout)
+                stream_handler.setFormatter(formatter)
+                handlers.append(stream_handler)
+            
+            _listener = QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+            _listener.start()
+            # Write out whatever is still queued when the process exits
+            atexit.register(stop_logging)
+        
+    app.logger.setLevel(level)
+    
+    # Every app in a process shares the same "app" logger
+    if any(isinstance(handler, QueueHandler) for handler in app.logger.handlers):
+        return
+    
+    queue_handler = QueueHandler(_listener.queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.setLevel(level)
+    app.logger.addHandler(queue_handler)
+    
+    # Flask's own stderr handler writes synchronously - LOG_TO_STDOUT
+    # replaces it when console output is wanted
+    app.logger.removeHandler(default_handler)
+
+def stop_logging():
+    """Flush the queue and stop the listener thread"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
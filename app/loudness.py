@@ -0,0 +1,259 @@
+"""
+Loudness Analysis Module for Radio Automation System
+Measures EBU R128 loudness (integrated, range, momentary/short-term maxima)
+and true peak in one streaming pass, and checks stored measurements
+against a delivery spec
+"""
+
+import os
+import math
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# FFmpeg filter that measures loudness and prints one metadata block per
+# 100ms frame to a pipe (stdout, or the file descriptor given). The summary
+# FFmpeg logs at the end is kept out of stderr by logging frames at
+# verbose level.
+EBUR128_FILTER = 'ebur128=metadata=1:peak=true:framelog=verbose'
+PRINT_FILTER = r'ametadata=mode=print:file=pipe\\:{fd}'
+
+# Anything quieter than this is treated as digital silence
+SILENCE_FLOOR_LUFS = -70.0
+
+class LoudnessMeter:
+    """
+    Collects loudness readings from FFmpeg's per-frame metadata
+    
+    FFmpeg reports running values for every 100ms frame. Only the maxima
+    and the latest integrated/range values are kept, so memory use is the
+    same for a two minute promo and a three hour show.
+    """
+    
+    def __init__(self):
+        self.frames = 0
+        self.integrated = None
+        self.loudness_range = None
+        self.lra_low = None
+        self.lra_high = None
+        self.momentary_max = None
+        self.short_term_max = None
+        self.true_peak = 0.0  # linear amplitude
+        
+        self._carry = b''
+    
+    def feed(self, data):
+        """Add a chunk of FFmpeg's metadata output"""
+        data = self._carry + data
+        lines = data.split(b'\n')
+        
+        # Keep a partial last line for the next chunk
+        self._carry = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+    
+    def _parse_line(self, line):
+        """Pick the loudness values out of one 'key=value' line"""
+        if not line.startswith(b'lavfi.r128.'):
+            if line.startswith(b'frame:'):
+                self.frames += 1
+            return
+        
+        key, _, value = line[len(b'lavfi.r128.'):].partition(b'=')
+        try:
+            value = float(value)
+        except ValueError:
+            return
+        
+        if key == b'M':
+            self.momentary_max = _max(self.momentary_max, value)
+        elif key == b'S':
+            self.short_term_max = _max(self.short_term_max, value)
+        elif key == b'I':
+            self.integrated = value
+        elif key == b'LRA':
+            self.loudness_range = value
+        elif key == b'LRA.low':
+            self.lra_low = value
+        elif key == b'LRA.high':
+            self.lra_high = value
+        elif key.startswith(b'true_peaks_ch'):
+            self.true_peak = max(self.true_peak, value)
+    
+    def result(self):
+        """
+        Return the measurements
+        
+        Returns:
+            Dictionary of loudness values (LUFS / LU / dBTP); values that
+            can't be expressed (e.g. true peak of pure silence) are None
+        """
+        if self._carry:
+            self._parse_line(self._carry)
+            self._carry = b''
+        
+        return {
+            'integrated_lufs': _loudness(self.integrated),
+            'loudness_range': _finite(self.loudness_range),
+            'lra_low': _loudness(self.lra_low),
+            'lra_high': _loudness(self.lra_high),
+            'momentary_max': _loudness(self.momentary_max),
+            'short_term_max': _loudness(self.short_term_max),
+            'true_peak_db': round(20 * math.log10(self.true_peak), 2) if self.true_peak > 0 else None
+        }
+
+class LoudnessTap:
+    """
+    A pipe a render writes loudness metadata into, read into a
+    LoudnessMeter on a background thread as FFmpeg goes
+    
+    Used when nothing in the render depends on the loudness, so it can be
+    measured on a branch of the render's own graph rather than in a
+    separate decode. stdout is already taken by the waveform tap, so the
+    metadata gets a pipe of its own.
+    
+    Usage:
+        tap = LoudnessTap()
+        try:
+            run_ffmpeg(build_fanout_command(..., loudness_fd=tap.fd), pass_fds=(tap.fd,))
+        finally:
+            tap.close()
+        tap.result()
+    """
+    
+    def __init__(self):
+        self.meter = LoudnessMeter()
+        read_fd, self.fd = os.pipe()
+        self._reader = os.fdopen(read_fd, 'rb')
+        self._thread = threading.Thread(target=self._run, name='loudness-tap', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        for chunk in iter(lambda: self._reader.read1(65536), b''):
+            self.meter.feed(chunk)
+    
+    def close(self):
+        """Close our end of the pipe once FFmpeg has finished, and wait for the reader"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self._thread.join()
+            self._reader.close()
+    
+    def result(self):
+        """Measurements in the same form as measure_loudness returns"""
+        result = self.meter.result()
+        result['success'] = self.meter.frames > 0
+        result['error'] = None if result['success'] else "No loudness readings from the render"
+        return result
+
+def loudness_meter_filter(fd):
+    """Filters that measure the audio and print the readings to a file descriptor"""
+    return f"{EBUR128_FILTER},{PRINT_FILTER.format(fd=fd)}"
+
+def _max(current, value):
+    """max() that treats None as 'nothing yet'"""
+    return value if current is None or value > current else current
+
+def _finite(value):
+    """Round a reading, turning -inf/nan into None so it can be stored"""
+    if value is None or not math.isfinite(value):
+        return None
+    return round(value, 2)
+
+def _loudness(value):
+    """A LUFS reading, or None when the audio is effectively silent"""
+    value = _finite(value)
+    if value is None or value <= SILENCE_FLOOR_LUFS:
+        return None
+    return value
+
+def measure_loudness(file_path, trim_start=None, trim_end=None):
+    """
+    Measure the loudness of a file in a single streaming pass
+    
+    Args:
+        file_path: Path to the audio file
+        trim_start, trim_end: Only measure this part of the file (seconds)
+    
+    Returns:
+        Dictionary with success, error and the values from LoudnessMeter.result()
+    """
+    # Imported here to avoid a circular import with the audio processor
+    from app.audio_processor import run_ffmpeg
+    
+    cmd = ['ffmpeg', '-hide_banner', '-nostats']
+    if trim_start:
+        cmd.extend(['-ss', f'{trim_start:.3f}'])
+    if trim_end is not None:
+        cmd.extend(['-t', f'{trim_end - (trim_start or 0):.3f}'])
+    cmd.extend([
+        '-i', file_path,
+        '-map', '0:a:0',
+        '-af', loudness_meter_filter(1),
+        '-f', 'null', '-'
+    ])
+    
+    meter = LoudnessMeter()
+    
+    try:
+        returncode, stderr_tail = run_ffmpeg(cmd, stdout_consumer=meter.feed, step='loudness')
+    except Exception as e:
+        logger.error(f"Error measuring loudness of {file_path}: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    
+    if returncode != 0:
+        error = stderr_tail[-500:] if stderr_tail else "Unknown FFmpeg error"
+        logger.error(f"Loudness measurement failed for {file_path}: {error}")
+        return {'success': False, 'error': f"Loudness measurement failed: {error}"}
+    
+    result = meter.result()
+    result['success'] = True
+    result['error'] = None
+    return result
+
+def apply_gain(measurements, gain_db):
+    """
+    Shift measurements by a gain applied during processing
+    
+    A fixed gain moves every absolute level by the same amount and leaves
+    the loudness range unchanged, so the rendered file doesn't need to be
+    measured again.
+    """
+    shifted = dict(measurements)
+    if gain_db:
+        for key in ('integrated_lufs', 'lra_low', 'lra_high', 'momentary_max',
+                    'short_term_max', 'true_peak_db'):
+            if shifted.get(key) is not None:
+                shifted[key] = round(shifted[key] + gain_db, 2)
+    return shifted
+
+def check_compliance(profile, target_lufs=-23.0, tolerance_lu=1.0, max_true_peak=-1.0):
+    """
+    Check a LoudnessProfile against a delivery spec
+    
+    Args:
+        profile: LoudnessProfile model instance
+        target_lufs: Required integrated loudness
+        tolerance_lu: Allowed deviation from the target
+        max_true_peak: True peak ceiling in dBTP
+    
+    Returns:
+        Dictionary with compliant flag and a list of problems
+    """
+    problems = []
+    
+    if profile.integrated_lufs is None:
+        problems.append("No measurable programme loudness (silent file?)")
+    elif abs(profile.integrated_lufs - target_lufs) > tolerance_lu:
+        problems.append(f"Integrated loudness {profile.integrated_lufs:.1f} LUFS is outside "
+                        f"{target_lufs:.1f} ± {tolerance_lu:.1f} LU")
+    
+    if profile.true_peak_db is not None and profile.true_peak_db > max_true_peak:
+        problems.append(f"True peak {profile.true_peak_db:.1f} dBTP exceeds {max_true_peak:.1f} dBTP")
+    
+    return {
+        'compliant': not problems,
+        'problems': problems
+    }
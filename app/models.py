@@ -5,6 +5,7 @@ These classes define the structure of data we store in the database
 
 from app import db
 from datetime import datetime
+import json
 
 class Show(db.Model):
     """
@@ -27,6 +28,13 @@ class Show(db.Model):
     channels = db.Column(db.Integer, default=2)  # 1=mono, 2=stereo
     normalize = db.Column(db.Boolean, default=True)
     normalize_level = db.Column(db.Float, default=-1.0)  # dB
+    trim_silence = db.Column(db.Boolean, default=False)  # Trim leading/trailing dead air
+    retention_days = db.Column(db.Integer)  # Days to keep outputs (None = system default)
+    air_time = db.Column(db.Time)  # Time of day the show airs (None = system default)
+    
+    # Processing template applied to this show's files (optional)
+    template_id = db.Column(db.Integer, db.ForeignKey('processing_templates.id'))
+    template = db.relationship('ProcessingTemplate')
     
     # Output settings
     output_folder = db.Column(db.String(500))  # Custom output folder for this show
@@ -36,6 +44,11 @@ class Show(db.Model):
     aliases = db.relationship('ShowAlias', backref='show', lazy='dynamic', 
                             cascade='all, delete-orphan')
     processed_files = db.relationship('ProcessedFile', backref='show', lazy='dynamic')
+    output_targets = db.relationship('ShowOutputTarget', backref='show', lazy='dynamic',
+                                   cascade='all, delete-orphan',
+                                   order_by='ShowOutputTarget.id')
+    jingles = db.relationship('ShowJingle', backref='show', lazy='dynamic',
+                            cascade='all, delete-orphan', order_by='ShowJingle.id')
     
     def __repr__(self):
         return f'<Show {self.name}>'
@@ -70,6 +83,57 @@ class ShowAlias(db.Model):
     def __repr__(self):
         return f'<ShowAlias {self.alias} -> {self.show.name}>'
 
+class ShowJingle(db.Model):
+    """
+    Acoustic fingerprint of a show's opening jingle
+    Files whose names don't say which show they are can be recognised by
+    their opening audio (see audio_fingerprint.py)
+    """
+    __tablename__ = 'show_jingles'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    show_id = db.Column(db.Integer, db.ForeignKey('shows.id'), nullable=False, index=True)
+    label = db.Column(db.String(100))  # e.g. 'opening', 'weekend intro'
+    source_filename = db.Column(db.String(500))  # File the jingle was taken from
+    duration = db.Column(db.Float)  # Seconds of audio fingerprinted
+    hash_count = db.Column(db.Integer)
+    hashes = db.Column(db.LargeBinary)  # Packed (hash, frame offset) pairs
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ShowJingle {self.label or self.id} for show {self.show_id}>'
+
+class ShowOutputTarget(db.Model):
+    """
+    One deliverable rendered for every episode of a show
+    (e.g. 16-bit WAV for air, MP3 for the website, FLAC for archive)
+    All of a show's targets are written from a single decode
+    """
+    __tablename__ = 'show_output_targets'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    show_id = db.Column(db.Integer, db.ForeignKey('shows.id'), nullable=False)
+    label = db.Column(db.String(50))  # e.g. 'air', 'web', 'archive'
+    output_format = db.Column(db.String(10), default='wav')
+    sample_rate = db.Column(db.Integer, default=44100)
+    bit_depth = db.Column(db.Integer, default=16)
+    channels = db.Column(db.Integer, default=2)
+    bitrate = db.Column(db.Integer)  # kbps, compressed formats only
+    
+    def __repr__(self):
+        return f'<ShowOutputTarget {self.label or self.output_format} for show {self.show_id}>'
+    
+    def to_dict(self):
+        """Return the target settings in the form the audio processor expects"""
+        return {
+            'label': self.label,
+            'format': self.output_format,
+            'sample_rate': self.sample_rate,
+            'bit_depth': self.bit_depth,
+            'channels': self.channels,
+            'bitrate': self.bitrate
+        }
+
 class ProcessedFile(db.Model):
     """
     Record of every file processed by the system
@@ -102,12 +166,34 @@ class ProcessedFile(db.Model):
     output_filename = db.Column(db.String(500))
     output_format = db.Column(db.String(10))
     output_size = db.Column(db.Integer)  # bytes
+    peaks_filename = db.Column(db.String(500))  # Waveform peaks file for previews
     normalized = db.Column(db.Boolean, default=False)
     normalize_level = db.Column(db.Float)  # dB
+    trim_start = db.Column(db.Float)  # seconds of silence skipped at the start
+    trim_end = db.Column(db.Float)  # position in seconds where output stops
+    template_id = db.Column(db.Integer, db.ForeignKey('processing_templates.id'))
+    template_version = db.Column(db.Integer)  # Template version the file was rendered with
+    expired_at = db.Column(db.DateTime, index=True)  # Set when retention removed the output
+    
+    # What the file was rendered from and with, so outputs can be brought up
+    # to date when their show's settings change (see rerender.py)
+    source_path = db.Column(db.String(500))  # Input file the outputs were rendered from
+    settings_hash = db.Column(db.String(16), index=True)  # Hash of the render settings
+    replaced_by_id = db.Column(db.Integer, db.ForeignKey('processed_files.id'))  # Newer render of this file
     
     # User who processed the file (for future multi-user support)
     processed_by = db.Column(db.String(100), default='system')
     
+    # Every output rendered from this file (the primary one is also
+    # stored in the output_* columns above)
+    outputs = db.relationship('ProcessedOutput', backref='processed_file', lazy='dynamic',
+                            cascade='all, delete-orphan',
+                            order_by='ProcessedOutput.id')
+    
+    # Loudness measurements, stored so reports never have to decode audio
+    loudness = db.relationship('LoudnessProfile', backref='processed_file', uselist=False,
+                             cascade='all, delete-orphan')
+    
     def __repr__(self):
         return f'<ProcessedFile {self.original_filename}>'
     
@@ -131,6 +217,168 @@ class ProcessedFile(db.Model):
             return round(self.original_size / (1024 * 1024), 2)
         return 0
 
+class ProcessedOutput(db.Model):
+    """
+    One rendered output of a processed file
+    A file rendered to several targets has one of these per target
+    """
+    __tablename__ = 'processed_outputs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    processed_file_id = db.Column(db.Integer, db.ForeignKey('processed_files.id'),
+                                  nullable=False, index=True)
+    label = db.Column(db.String(50))
+    output_filename = db.Column(db.String(500))
+    output_format = db.Column(db.String(10))
+    sample_rate = db.Column(db.Integer)
+    bit_depth = db.Column(db.Integer)
+    channels = db.Column(db.Integer)
+    bitrate = db.Column(db.Integer)  # kbps
+    output_size = db.Column(db.Integer)  # bytes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expired_at = db.Column(db.DateTime, index=True)  # Set when retention removed the file
+    
+    def __repr__(self):
+        return f'<ProcessedOutput {self.output_filename}>'
+    
+    def get_file_size_mb(self):
+        """Return output size in MB"""
+        if self.output_size:
+            return round(self.output_size / (1024 * 1024), 2)
+        return 0
+
+class LoudnessProfile(db.Model):
+    """
+    EBU R128 loudness measurements for a processed file
+    Values describe the rendered audio (source measurement plus any gain applied)
+    """
+    __tablename__ = 'loudness_profiles'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    processed_file_id = db.Column(db.Integer, db.ForeignKey('processed_files.id'),
+                                  nullable=False, unique=True)
+    integrated_lufs = db.Column(db.Float)  # Integrated (programme) loudness
+    loudness_range = db.Column(db.Float)  # LRA in LU
+    lra_low = db.Column(db.Float)  # LUFS
+    lra_high = db.Column(db.Float)  # LUFS
+    momentary_max = db.Column(db.Float)  # Loudest 400ms window, LUFS
+    short_term_max = db.Column(db.Float)  # Loudest 3s window, LUFS
+    true_peak_db = db.Column(db.Float)  # dBTP
+    gain_db = db.Column(db.Float, default=0.0)  # Gain applied during processing
+    measured_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LoudnessProfile {self.processed_file_id}: {self.integrated_lufs} LUFS>'
+    
+    def to_dict(self):
+        """Return the measurements as a dictionary"""
+        return {
+            'integrated_lufs': self.integrated_lufs,
+            'loudness_range': self.loudness_range,
+            'lra_low': self.lra_low,
+            'lra_high': self.lra_high,
+            'momentary_max': self.momentary_max,
+            'short_term_max': self.short_term_max,
+            'true_peak_db': self.true_peak_db,
+            'gain_db': self.gain_db
+        }
+
+class ProcessingJob(db.Model):
+    """
+    One uploaded file on its way through the system
+    Records the validation outcome and links to the result once processed
+    """
+    __tablename__ = 'processing_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(500), nullable=False)
+    input_path = db.Column(db.String(500), nullable=False)
+    
+    # queued, processing, completed, failed or rejected
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)
+    error_message = db.Column(db.Text)
+    
+    # Upload-time header check: passed, suspicious or rejected
+    detected_format = db.Column(db.String(10))
+    validation_status = db.Column(db.String(20))
+    validation_detail = db.Column(db.Text)
+    
+    # Full decode check: pending, passed or failed (None = not needed)
+    integrity_status = db.Column(db.String(20))
+    integrity_detail = db.Column(db.Text)
+    integrity_checked_at = db.Column(db.DateTime)
+    
+    # Scheduling - urgent jobs first, then the closest deadline
+    show_id = db.Column(db.Integer, db.ForeignKey('shows.id'))
+    show = db.relationship('Show')
+    air_date = db.Column(db.Date)  # Date parsed from the filename
+    deadline = db.Column(db.DateTime, index=True)  # When the output must be ready
+    urgent = db.Column(db.Boolean, default=False, nullable=False)
+    processing_options = db.Column(db.Text)  # JSON arguments for process_audio_file
+    
+    # Worker lease - the worker holding a job renews lease_expires_at while it
+    # runs; a job whose lease runs out is handed to another worker
+    worker_id = db.Column(db.String(100))  # host:pid:thread of the worker running it
+    lease_expires_at = db.Column(db.DateTime, index=True)
+    heartbeat_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Resource limits that stopped an FFmpeg run (JSON list, see governor.py)
+    resource_events = db.Column(db.Text)
+    
+    processed_file_id = db.Column(db.Integer, db.ForeignKey('processed_files.id'))
+    processed_file = db.relationship('ProcessedFile')
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<ProcessingJob {self.id} {self.filename} ({self.status})>'
+    
+    def to_dict(self):
+        """Return the job as a dictionary for the API"""
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'error_message': self.error_message,
+            'detected_format': self.detected_format,
+            'validation_status': self.validation_status,
+            'validation_detail': self.validation_detail,
+            'integrity_status': self.integrity_status,
+            'integrity_detail': self.integrity_detail,
+            'show_name': self.show.name if self.show else None,
+            'air_date': self.air_date.isoformat() if self.air_date else None,
+            'deadline': self.deadline.isoformat() if self.deadline else None,
+            'urgent': self.urgent,
+            'worker_id': self.worker_id,
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.lease_expires_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'attempts': self.attempts,
+            'resource_events': json.loads(self.resource_events) if self.resource_events else [],
+            'processed_file_id': self.processed_file_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class OutputSequence(db.Model):
+    """
+    Next free sequence number for an output name in a storage folder
+    Lets unique filenames be handed out without checking the disk
+    """
+    __tablename__ = 'output_sequences'
+    __table_args__ = (db.UniqueConstraint('directory', 'base_name'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    directory = db.Column(db.String(500), nullable=False)
+    base_name = db.Column(db.String(300), nullable=False)
+    next_value = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<OutputSequence {self.directory}/{self.base_name}: {self.next_value}>'
+
 class ProcessingTemplate(db.Model):
     """
     Reusable processing templates for common tasks
@@ -156,6 +404,11 @@ class ProcessingTemplate(db.Model):
     fade_out_ms = db.Column(db.Integer, default=0)  # milliseconds
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Bumped automatically on every update; compiled templates are cached by it
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
     
     def __repr__(self):
         return f'<ProcessingTemplate {self.name}>'
\ No newline at end of file
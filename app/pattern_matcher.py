@@ -1,39 +1,297 @@
 """
 Pattern Matching Module for Radio Automation System
 Extracts show names and dates from filenames
+
+Filenames are matched against grammars - templates such as
+`{alias}-{yyyy}{mm}{dd}-{part}` - made up of literal text and fields:
+
+    {alias}  one of the show's aliases (or its name)
+    {show}   any show name, looked up by alias afterwards
+    {yyyy}   four-digit year
+    {yy}     two-digit year (YEAR_CUTOFF decides the century)
+    {mm}     month, {dd} day
+    {part}   part or segment number/letter, e.g. 1, 02 or B
+    {any}    text that is ignored
+
+Each show can have its own grammar (Show.filename_pattern); the built-in
+ShowName_MMDDYY layouts are tried after those. Every grammar is compiled
+into one combined regular expression, so a filename is tested against all
+of them in a single pass, and the named group that matched says which
+grammar (and so which show) it was.
 """
 
 import re
+import threading
+import hashlib
 from datetime import datetime, date
+from flask import current_app, has_app_context
+from sqlalchemy import func, select
 import logging
 
 logger = logging.getLogger(__name__)
 
-def parse_filename(filename):
+class PatternError(ValueError):
+    """Raised when a filename grammar can't be compiled"""
+
+# What each field of a grammar matches
+FIELD_PATTERNS = {
+    'show': r'[A-Za-z][A-Za-z_\s\-]*?',
+    'yyyy': r'\d{4}',
+    'yy': r'\d{2}',
+    'mm': r'\d{2}',
+    'dd': r'\d{2}',
+    'part': r'\d{1,3}|[A-Za-z]',
+    'any': r'.*?'
+}
+
+# Layouts every filename is tried against after the shows' own grammars
+BUILTIN_GRAMMARS = [
+    '{show}_{mm}{dd}{yy}',   # AnswersInGenesis_100424, Answers_In_Genesis_100424
+    '{show}-{mm}{dd}{yy}'    # AIG-100424
+]
+
+FIELD_RE = re.compile(r'\{(\w+)\}')
+
+# The combined matcher, rebuilt when the shows or aliases change
+_cache = {'fingerprint': None, 'matcher': None}
+_cache_lock = threading.Lock()
+
+class FilenameMatcher:
+    """
+    Every filename grammar compiled into one regular expression
+    
+    Grammar number i becomes the alternative `(?P<g{i}>...)` and its fields
+    `g{i}_{field}`. The alternatives are anchored and tried in order, so
+    the first grammar that matches the whole name wins, and lastgroup (the
+    wrapper group, which closes last) says which one it was.
+    
+    Each alternative starts with a lookahead on its leading text. The
+    regex engine skips a branch that starts with a group only after
+    entering it, which made matching slow down with every grammar added;
+    with the lookahead a grammar that can't match is passed over after its
+    first character or two.
+    """
+    
+    def __init__(self, grammars):
+        """
+        Args:
+            grammars: List of (template, show id, show name, aliases);
+                      show id is None for the built-in layouts
+        """
+        self.grammars = {}
+        alternatives = []
+        for index, (template, show_id, show_name, aliases) in enumerate(grammars):
+            name = f'g{index}'
+            guard = leading_text_guard(template, aliases)
+            alternatives.append(f'{guard}(?P<{name}>{compile_grammar(template, name, aliases)})')
+            fields = [field.group(1) for field in FIELD_RE.finditer(template)]
+            self.grammars[name] = (template, show_id, show_name, fields)
+        self.regex = re.compile('^(?:' + '|'.join(alternatives) + ')$', re.IGNORECASE)
+    
+    def match(self, base_name):
+        """
+        Match a filename (without its extension)
+        
+        Returns:
+            Tuple of (template, show id, show name, fields), or None
+        """
+        match = self.regex.match(base_name)
+        if match is None:
+            return None
+        
+        name = match.lastgroup
+        template, show_id, show_name, fields = self.grammars[name]
+        # Only this grammar's groups - groupdict() would copy every grammar's
+        values = {field: match.group(f'{name}_{field}') for field in fields}
+        return template, show_id, show_name, values
+
+def compile_grammar(template, prefix='g', aliases=None):
+    """
+    Turn a grammar template into a regular expression
+    
+    Args:
+        template: e.g. '{alias}-{yyyy}{mm}{dd}-{part}'
+        prefix: Prefix for the group names, to keep grammars apart
+        aliases: What {alias} may match (required if the template uses it)
+    
+    Returns:
+        Regular expression source
+    
+    Raises:
+        PatternError: If the template uses an unknown or repeated field
+    """
+    pieces = []
+    seen = set()
+    position = 0
+    for field in FIELD_RE.finditer(template):
+        pieces.append(re.escape(template[position:field.start()]))
+        position = field.end()
+        
+        key = field.group(1)
+        if key in seen:
+            raise PatternError(f"{{{key}}} appears more than once in {template}")
+        seen.add(key)
+        
+        if key == 'alias':
+            if not aliases:
+                raise PatternError("{alias} needs a show with at least one alias")
+            # Longest first, so "aig2" isn't matched as "aig"
+            choices = sorted(set(aliases), key=len, reverse=True)
+            pattern = '|'.join(re.escape(alias) for alias in choices)
+        elif key in FIELD_PATTERNS:
+            pattern = FIELD_PATTERNS[key]
+        else:
+            raise PatternError(f"Unknown field {{{key}}} in {template} "
+                               f"(use alias, {', '.join(FIELD_PATTERNS)})")
+        pieces.append(f'(?P<{prefix}_{key}>{pattern})')
+    pieces.append(re.escape(template[position:]))
+    
+    if not seen:
+        raise PatternError(f"{template} has no fields")
+    # A date needs all of its parts, with exactly one kind of year
+    one_year = ('yyyy' in seen) != ('yy' in seen)
+    if seen & {'yyyy', 'yy', 'mm', 'dd'} and not (one_year and {'mm', 'dd'} <= seen):
+        raise PatternError(f"{template} needs one year field plus {{mm}} and {{dd}}")
+    return ''.join(pieces)
+
+def leading_text_guard(template, aliases=None):
+    """
+    Lookahead for how a grammar's match can start: its leading literal
+    text, or the characters its first field can start with
+    
+    Returns:
+        Regular expression source, or '' when anything can come first
+    """
+    field = FIELD_RE.search(template)
+    if field is None or field.start() > 0:
+        leading = template[:field.start()] if field else template
+        return f'(?={re.escape(leading)})'
+    
+    key = field.group(1)
+    if key == 'alias':
+        first = sorted({alias[0] for alias in aliases or [] if alias})
+        return f"(?=[{''.join(re.escape(char) for char in first)}])" if first else ''
+    return {
+        'show': '(?=[A-Za-z])',
+        'yyyy': r'(?=\d)',
+        'yy': r'(?=\d)',
+        'mm': r'(?=\d)',
+        'dd': r'(?=\d)',
+        'part': '(?=[A-Za-z0-9])'
+    }.get(key, '')
+
+def show_alias_names(show):
+    """What {alias} matches for a show: its aliases and forms of its name"""
+    names = [alias.alias for alias in show.aliases]
+    names.extend([show.name, show.name.replace(' ', '_'), show.name.replace(' ', '')])
+    return names
+
+def _grammar_fingerprint():
+    """One aggregate query that changes whenever a show or alias does"""
+    # Imported here so the matcher can be used without the models loaded
+    from app import db
+    from app.models import Show, ShowAlias
+    
+    summary = db.session.execute(select(
+        select(func.count(Show.id)).scalar_subquery(),
+        select(func.max(Show.updated_at)).scalar_subquery(),
+        select(func.count(ShowAlias.id)).scalar_subquery(),
+        select(func.max(ShowAlias.id)).scalar_subquery()
+    )).one()
+    return hashlib.sha1(repr(tuple(summary)).encode('utf-8')).hexdigest()[:16]
+
+def _load_grammars():
+    """The active shows' grammars, followed by the built-in layouts"""
+    from app.models import Show
+    
+    grammars = []
+    shows = Show.query.filter(Show.filename_pattern.isnot(None), Show.filename_pattern != '',
+                              Show.active.is_(True)).order_by(Show.id).all()
+    for show in shows:
+        try:
+            compile_grammar(show.filename_pattern, aliases=show_alias_names(show))
+        except PatternError as e:
+            logger.warning(f"Ignoring filename pattern of {show.name}: {str(e)}")
+            continue
+        grammars.append((show.filename_pattern, show.id, show.name, show_alias_names(show)))
+    
+    grammars.extend((template, None, None, None) for template in BUILTIN_GRAMMARS)
+    return grammars
+
+def get_filename_matcher():
+    """
+    The combined matcher for every show's grammar
+    
+    Rebuilt only when the shows or aliases have changed - in this process
+    or another one. Outside an application context only the built-in
+    layouts are used.
+    """
+    if not has_app_context():
+        fingerprint = None
+    else:
+        fingerprint = _grammar_fingerprint()
+    
+    with _cache_lock:
+        if _cache['matcher'] is not None and _cache['fingerprint'] == fingerprint:
+            return _cache['matcher']
+    
+    if fingerprint is None:
+        grammars = [(template, None, None, None) for template in BUILTIN_GRAMMARS]
+    else:
+        grammars = _load_grammars()
+    matcher = FilenameMatcher(grammars)
+    logger.debug(f"Compiled {len(grammars)} filename grammars")
+    
+    with _cache_lock:
+        _cache.update(fingerprint=fingerprint, matcher=matcher)
+    return matcher
+
+def expand_year(year_short, cutoff=None):
+    """
+    Turn a two-digit year into four digits
+    
+    Years up to the cutoff (YEAR_CUTOFF, 30 by default) are 20xx, later
+    ones 19xx.
+    """
+    if cutoff is None:
+        cutoff = current_app.config.get('YEAR_CUTOFF', 30) if has_app_context() else 30
+    return 2000 + year_short if year_short <= cutoff else 1900 + year_short
+
+def parse_filename(filename, matcher=None):
     """
     Parse a filename to extract show name and broadcast date
     
-    Expected format: ShowName_MMDDYY.ext
+    Expected format: a show's own filename pattern, or ShowName_MMDDYY.ext
     Examples:
         - AnswersInGenesis_100424.wav -> Answers In Genesis, Oct 4, 2024
         - FOF_123199.mp3 -> FOF (alias), Dec 31, 1999
         - AIG_010125.wav -> AIG (alias), Jan 1, 2025
+        - aig-20250101-2.wav -> Answers In Genesis, Jan 1, 2025, part 2
+          (with the pattern {alias}-{yyyy}{mm}{dd}-{part})
     
     Args:
         filename: The filename to parse
+        matcher: FilenameMatcher to use (defaults to get_filename_matcher(),
+                 pass one in when parsing many names)
         
     Returns:
         Dictionary with:
             - show_name: Extracted show name (may be an alias)
+            - show_id: Show whose own pattern matched, or None
             - date: datetime.date object or None
             - year: Interpreted year (4 digits)
+            - part: Part number/letter, if the pattern has one
+            - pattern: The grammar that matched
             - success: Boolean indicating if parsing was successful
             - error: Error message if parsing failed
     """
     result = {
         'show_name': None,
+        'show_id': None,
         'date': None,
         'year': None,
+        'part': None,
+        'pattern': None,
         'success': False,
         'error': None
     }
@@ -42,61 +300,43 @@ def parse_filename(filename):
         # Remove file extension
         base_name = filename.rsplit('.', 1)[0]
         
-        # Try different patterns
-        patterns = [
-            # Standard pattern: ShowName_MMDDYY
-            r'^([A-Za-z]+(?:[A-Z][a-z]+)*)_(\d{6})$',
-            # With spaces or underscores in show name
-            r'^([A-Za-z_\s]+)_(\d{6})$',
-            # With hyphens
-            r'^([A-Za-z\-]+)_(\d{6})$',
-            # Date with different separator
-            r'^([A-Za-z]+(?:[A-Z][a-z]+)*)-(\d{6})$',
-        ]
-        
-        match = None
-        for pattern in patterns:
-            match = re.match(pattern, base_name)
-            if match:
-                break
-        
-        if not match:
+        matched = (matcher or get_filename_matcher()).match(base_name)
+        if not matched:
             result['error'] = "Filename doesn't match expected pattern (ShowName_MMDDYY)"
             return result
         
-        # Extract show name and date string
-        show_name_raw = match.group(1)
-        date_str = match.group(2)
+        template, show_id, show_name, fields = matched
+        result['pattern'] = template
+        result['part'] = fields.get('part')
         
-        # Process show name
-        show_name = process_show_name(show_name_raw)
-        result['show_name'] = show_name
+        # A show's own pattern says which show it is; otherwise the name
+        # is looked up by alias
+        if show_id is not None:
+            result['show_id'] = show_id
+            result['show_name'] = show_name
+        elif 'show' in fields:
+            result['show_name'] = process_show_name(fields['show'])
         
-        # Parse date (MMDDYY format)
-        if len(date_str) == 6:
-            month = int(date_str[0:2])
-            day = int(date_str[2:4])
-            year_short = int(date_str[4:6])
-            
-            # Interpret 2-digit year
-            # 00-30 = 2000-2030, 31-99 = 1931-1999
-            if year_short <= 30:
-                year = 2000 + year_short
-            else:
-                year = 1900 + year_short
-            
-            result['year'] = year
-            
-            # Validate date
-            try:
-                parsed_date = date(year, month, day)
-                result['date'] = parsed_date
-                result['success'] = True
-            except ValueError as e:
-                result['error'] = f"Invalid date: {month}/{day}/{year}"
-                result['success'] = False
+        if 'mm' not in fields:
+            # Patterns without a date only identify the show
+            result['success'] = True
+            return result
+        
+        month = int(fields['mm'])
+        day = int(fields['dd'])
+        if 'yyyy' in fields:
+            year = int(fields['yyyy'])
         else:
-            result['error'] = "Date must be 6 digits (MMDDYY)"
+            year = expand_year(int(fields['yy']))
+        
+        result['year'] = year
+        
+        # Validate date
+        try:
+            result['date'] = date(year, month, day)
+            result['success'] = True
+        except ValueError:
+            result['error'] = f"Invalid date: {month}/{day}/{year}"
     
     except Exception as e:
         result['error'] = f"Error parsing filename: {str(e)}"
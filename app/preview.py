@@ -0,0 +1,230 @@
+"""
+Preview Streaming Module for Radio Automation System
+Serves a low-bitrate, segmented rendition of processed files so they can
+be spot-checked in the browser without downloading the broadcast WAV
+
+Segments are transcoded the first time they're requested and kept in a
+size-limited disk cache shared by every web process, least recently used
+segments being removed first.
+"""
+
+import os
+import math
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Defaults used when the application config does not override them
+DEFAULT_SEGMENT_SECONDS = 10
+DEFAULT_BITRATE = 64         # kbps
+DEFAULT_SAMPLE_RATE = 22050  # Hz
+DEFAULT_CACHE_MB = 500
+
+class SegmentCache:
+    """
+    Size-bounded LRU cache of preview segments on disk
+    
+    Several web processes share the cache folder, so the files themselves
+    are the index: a segment is cached if its file exists, a hit refreshes
+    the file's modification time, and eviction scans the folder and
+    removes the least recently modified segments.
+    """
+    
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0  # As of the last scan
+        
+        self._lock = threading.Lock()
+        self._building = {}  # relative path -> lock held while transcoding
+        
+        os.makedirs(root, exist_ok=True)
+    
+    def get(self, key, producer):
+        """
+        Return the path of a cached segment, creating it if needed
+        
+        Args:
+            key: Path of the segment relative to the cache root
+            producer: Callable that writes the segment to the path it's given
+        
+        Returns:
+            Absolute path of the segment
+        """
+        path = os.path.join(self.root, key)
+        
+        # Segments are renamed into place whole, so one that exists is complete
+        if _touch(path):
+            return path
+        
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        
+        # Only one request in this process transcodes a given segment;
+        # others wait for it
+        with build_lock:
+            if os.path.exists(path):
+                return path
+            
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Named for this process, as another may be building it too
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                producer(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                # Nothing was added - let the next request try again
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            finally:
+                # The file is in place before the build lock is retired, so
+                # a request arriving in between finds it
+                with self._lock:
+                    self._building.pop(key, None)
+        
+        self._evict(keep=path)
+        return path
+    
+    def _scan(self):
+        """Every finished segment on disk as (modification time, path, size)"""
+        found = []
+        for folder in os.scandir(self.root):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        # Removed by another process since the folder was read
+                        continue
+                    found.append((stat_result.st_mtime, entry.path, stat_result.st_size))
+        return found
+    
+    def _evict(self, keep=None):
+        """Delete least recently used segments until under the size limit"""
+        found = self._scan()
+        self.total_bytes = sum(size for _, _, size in found)
+        
+        for _, path, size in sorted(found):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another process evicted it first
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove cached preview segment {path}: {str(e)}")
+                continue
+            self.total_bytes -= size
+            
+            # Drop the file's folder once its last segment is gone
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+def _touch(path):
+    """Mark a segment as recently used (False if it isn't there)"""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_segment_cache(config):
+    """Return the shared segment cache, creating it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SegmentCache(
+                config.get('PREVIEW_CACHE_FOLDER', os.path.join('cache', 'previews')),
+                config.get('PREVIEW_CACHE_MB', DEFAULT_CACHE_MB) * 1024 * 1024
+            )
+        return _cache
+
+def get_segment_count(duration, segment_seconds):
+    """Number of segments needed to cover a duration"""
+    if not duration:
+        return 0
+    return max(1, math.ceil(duration / segment_seconds))
+
+def build_playlist(duration, segment_seconds, segment_url):
+    """
+    Build an HLS playlist for a preview
+    
+    Args:
+        duration: Duration of the processed file in seconds
+        segment_seconds: Length of each segment
+        segment_url: Callable returning the URL of segment n
+    
+    Returns:
+        Playlist text (application/vnd.apple.mpegurl)
+    """
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{math.ceil(segment_seconds)}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD'
+    ]
+    for index in range(get_segment_count(duration, segment_seconds)):
+        length = min(segment_seconds, duration - index * segment_seconds)
+        lines.append(f'#EXTINF:{length:.3f},')
+        lines.append(segment_url(index))
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+def get_preview_segment(source_path, index, config):
+    """
+    Return the path of one preview segment, transcoding it if needed
+    
+    Only the segment's own few seconds of the source are decoded, so
+    seeking deep into a long show costs the same as starting at the top.
+    
+    Args:
+        source_path: Processed audio file to preview
+        index: Segment number (0-based)
+        config: Application config
+    
+    Returns:
+        Path of the MP3 segment
+    """
+    segment_seconds = config.get('PREVIEW_SEGMENT_SECONDS', DEFAULT_SEGMENT_SECONDS)
+    bitrate = config.get('PREVIEW_BITRATE', DEFAULT_BITRATE)
+    sample_rate = config.get('PREVIEW_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+    
+    # Key the cache on the file's size and mtime so a re-rendered file
+    # never serves stale segments
+    stat_result = os.stat(source_path)
+    folder = f"{os.path.basename(source_path)}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+    key = f"{folder}/{index:05d}-{segment_seconds}s-{bitrate}k.mp3"
+    
+    def transcode(output_path):
+        # Imported here so the web app can start without loading the audio stack
+        from app.audio_processor import run_ffmpeg
+        
+        cmd = [
+            'ffmpeg', '-v', 'error', '-y',
+            '-ss', f'{index * segment_seconds:.3f}',
+            '-t', f'{segment_seconds:.3f}',
+            '-i', source_path,
+            '-vn', '-ac', '1', '-ar', str(sample_rate),
+            '-acodec', 'libmp3lame', '-b:a', f'{bitrate}k',
+            # Bare MP3 frames so segments play back to back
+            '-write_xing', '0', '-id3v2_version', '0',
+            '-f', 'mp3', output_path
+        ]
+        returncode, errors = run_ffmpeg(cmd, step='preview')
+        if returncode != 0:
+            raise RuntimeError(errors[-500:])
+    
+    return get_segment_cache(config).get(key, transcode)
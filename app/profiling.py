@@ -0,0 +1,294 @@
+"""
+Profiling Module for Radio Automation System
+On-demand sampling profiles of web requests and processing jobs, and a log
+of slow database queries
+
+A request is profiled when PROFILING_ENABLED is on, or when it carries an
+`X-Profile: <PROFILING_TOKEN>` header or `?profile=<PROFILING_TOKEN>`
+(any value works in debug mode). Jobs are profiled when PROFILING_ENABLED
+or PROFILE_JOBS is on.
+
+The profiler is a small sampler: a background thread looks at the
+profiled thread's stack every PROFILE_SAMPLE_INTERVAL_MS and counts what
+it sees, so the code being measured runs at full speed. Each profile is
+written to PROFILE_FOLDER as
+  - <name>.folded  collapsed stacks, for flamegraph.pl or speedscope
+  - <name>.txt     the hottest functions and any slow queries
+
+Queries slower than SLOW_QUERY_MS are always logged, with the route or
+job that ran them.
+"""
+
+import os
+import re
+import sys
+import time
+import functools
+import threading
+import logging
+from collections import Counter
+from datetime import datetime
+from flask import current_app, g, request, has_request_context, has_app_context
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Longest stack kept per sample
+MAX_STACK_DEPTH = 64
+
+# Longest query text written to the log
+MAX_QUERY_LENGTH = 500
+
+# What the current thread is working on, for slow query messages
+_local = threading.local()
+
+class SamplingProfiler:
+    """
+    Counts the stacks seen in one thread at a fixed interval
+    
+    Usage:
+        profiler = SamplingProfiler()
+        profiler.start()
+        ... slow code ...
+        profiler.stop()
+        profiler.write('logs/profiles', 'request', 'GET /shows')
+    """
+    
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self.slow_queries = []
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            # Stored outermost call first, as the folded format expects
+            self.samples[tuple(reversed(stack))] += 1
+    
+    def hottest(self, limit=20):
+        """
+        Functions by share of samples
+        
+        Returns:
+            List of (function, self samples, total samples), busiest first.
+            Self counts the samples where the function itself was running,
+            total also counts the ones spent in functions it called.
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self.samples.items():
+            functions = [frame.rsplit(':', 1)[0] for frame in stack]
+            own[functions[-1]] += count
+            for function in set(functions):
+                total[function] += count
+        
+        return [(function, own[function], count)
+                for function, count in total.most_common()
+                if own[function]][:limit]
+    
+    def write(self, folder, kind, label):
+        """
+        Save the collapsed stacks and a summary
+        
+        Returns:
+            Path of the .folded file
+        """
+        os.makedirs(folder, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:60] or 'unnamed'
+        base = os.path.join(folder, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{kind}-{slug}")
+        
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        
+        sample_count = sum(self.samples.values())
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(f"{kind}: {label}\n")
+            f.write(f"Duration: {self.duration * 1000:.0f}ms, {sample_count} samples "
+                    f"every {self.interval * 1000:.0f}ms\n\n")
+            f.write(f"{'self %':>7} {'total %':>8}  function\n")
+            for function, own, total in self.hottest():
+                f.write(f"{own * 100 / sample_count:7.1f} {total * 100 / sample_count:8.1f}  {function}\n")
+            if self.slow_queries:
+                f.write("\nSlow queries:\n")
+                for elapsed_ms, statement in self.slow_queries:
+                    f.write(f"{elapsed_ms:8.0f}ms  {statement}\n")
+        
+        return base + '.folded'
+
+def current_activity():
+    """The route or job the current thread is working on"""
+    if has_request_context():
+        return f"{request.method} {request.path} ({request.endpoint})"
+    return getattr(_local, 'activity', None) or threading.current_thread().name
+
+class activity:
+    """
+    Name what the current thread is doing, for slow query messages
+    
+    Usage:
+        with activity(f"job {job.id}"):
+            run_job(job)
+    """
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def __enter__(self):
+        self._previous = getattr(_local, 'activity', None)
+        _local.activity = self.name
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.activity = self._previous
+        return False
+
+def _start_profiler(config):
+    interval = config.get('PROFILE_SAMPLE_INTERVAL_MS', 5) / 1000
+    profiler = SamplingProfiler(interval=interval)
+    _local.profiler = profiler
+    profiler.start()
+    return profiler
+
+def _finish_profiler(profiler, config, kind, label, forced):
+    """Stop a profiler and write it out if it's worth keeping"""
+    profiler.stop()
+    _local.profiler = None
+    
+    if not forced and profiler.duration * 1000 < config.get('PROFILE_MIN_MS', 500):
+        return None
+    
+    try:
+        path = profiler.write(config.get('PROFILE_FOLDER', 'logs/profiles'), kind, label)
+    except OSError as e:
+        logger.warning(f"Could not write profile for {label}: {str(e)}")
+        return None
+    
+    logger.info(f"Profiled {kind} {label} ({profiler.duration * 1000:.0f}ms): {path}")
+    return path
+
+def profile_job(func):
+    """
+    Profile a processing function whose first argument is the input path
+    (process_audio_file) when PROFILING_ENABLED or PROFILE_JOBS is on
+    """
+    @functools.wraps(func)
+    def wrapper(input_path, *args, **kwargs):
+        config = current_app.config if has_app_context() else {}
+        enabled = config.get('PROFILING_ENABLED') or config.get('PROFILE_JOBS')
+        # Inline jobs run inside a request that may already be profiled
+        if not enabled or getattr(_local, 'profiler', None):
+            return func(input_path, *args, **kwargs)
+        
+        profiler = _start_profiler(config)
+        try:
+            return func(input_path, *args, **kwargs)
+        finally:
+            _finish_profiler(profiler, config, 'job',
+                             kwargs.get('source_name') or os.path.basename(input_path),
+                             forced=bool(config.get('PROFILE_JOBS')))
+    return wrapper
+
+def _profile_requested(app):
+    """Whether this request asked to be profiled"""
+    value = request.headers.get('X-Profile') or request.args.get('profile')
+    if not value:
+        return False
+    token = app.config.get('PROFILING_TOKEN')
+    if token:
+        return value == token
+    return app.debug
+
+def init_profiling(app):
+    """
+    Add the request profiling hooks and the slow query log to an app
+    Needs an application context (for the database engine)
+    """
+    slow_ms = app.config.get('SLOW_QUERY_MS', 250)
+    if slow_ms:
+        log_slow_queries(app.extensions['sqlalchemy'].engine, slow_ms)
+    
+    @app.before_request
+    def start_request_profile():
+        if request.endpoint == 'static':
+            return
+        forced = _profile_requested(app)
+        if forced or app.config.get('PROFILING_ENABLED'):
+            g.profile_forced = forced
+            g.profiler = _start_profiler(app.config)
+    
+    # Streamed responses are measured up to the point the body starts
+    @app.after_request
+    def finish_request_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            path = _finish_profiler(profiler, app.config, 'request',
+                                    f"{request.method} {request.path}",
+                                    forced=g.pop('profile_forced', False))
+            if path:
+                response.headers['X-Profile-File'] = os.path.basename(path)
+        return response
+    
+    # after_request is skipped when an exception propagates (debug and
+    # testing), so a profiler still running here is stopped and saved
+    @app.teardown_request
+    def stop_request_profile(exception):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            _finish_profiler(profiler, app.config, 'request',
+                             f"{request.method} {request.path}",
+                             forced=g.pop('profile_forced', False))
+
+def log_slow_queries(engine, threshold_ms):
+    """
+    Log every query on this engine slower than threshold_ms, with the
+    route or job that ran it
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+    
+    @event.listens_for(engine, 'handle_error')
+    def failed_execute(exception_context):
+        # after_cursor_execute doesn't run for a failed query
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_started'):
+            connection.info['query_started'].pop()
+    
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < threshold_ms:
+            return
+        
+        statement = ' '.join(statement.split())[:MAX_QUERY_LENGTH]
+        logger.warning(f"Slow query ({elapsed_ms:.0f}ms) in {current_activity()}: {statement}")
+        
+        profiler = getattr(_local, 'profiler', None)
+        if profiler is not None:
+            profiler.slow_queries.append((elapsed_ms, statement))
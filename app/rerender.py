@@ -0,0 +1,544 @@
+"""
+Re-render Module for Radio Automation System
+Brings processed files up to date after their show's settings change
+
+Every processed file stores a hash of the settings it was rendered with
+(targets, normalization, trimming, template version). A show's current
+settings hash the same way, so a file whose hash differs from its show's
+is stale - and only those files are processed again.
+
+A re-render reuses what is already known about the source: the probe
+results stored on the file record, and its loudness measurement when the
+trim points haven't changed, so usually only the FFmpeg render itself
+runs. Outputs keep their names and are replaced in place. The sweep waits
+for the job queue to be idle before each file, so it never competes with
+new uploads.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from app.models import Show, ProcessedFile, ProcessedOutput, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+# Formats whose size is set by a bitrate rather than a bit depth
+COMPRESSED_FORMATS = ('mp3', 'm4a')
+
+# Only one sweep runs at a time
+_sweep_lock = threading.Lock()
+
+# Settings used when neither the upload nor the show sets them
+DEFAULT_RENDER_SETTINGS = {
+    'output_format': 'wav',
+    'sample_rate': 44100,
+    'bit_depth': 16,
+    'channels': 2,
+    'normalize': True,
+    'normalize_level': -1.0
+}
+
+def render_settings_hash(targets, normalize, normalize_level, trim_silence,
+                         template_id=None, template_version=None):
+    """
+    Short hash of everything that decides what a render sounds like
+    
+    Args:
+        targets: Output target dictionaries (format, sample_rate, bit_depth,
+                 channels, bitrate, label), primary first
+        normalize, normalize_level: Normalization settings
+        trim_silence: Whether leading/trailing silence is trimmed
+        template_id, template_version: Processing template used, if any
+    
+    Returns:
+        16 character hex string
+    """
+    settings = {
+        'targets': [_canonical_target(target) for target in targets],
+        'normalize': bool(normalize),
+        'normalize_level': float(normalize_level) if normalize and normalize_level is not None else None,
+        'trim_silence': bool(trim_silence),
+        'template': [template_id, template_version] if template_id else None
+    }
+    encoded = json.dumps(settings, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+def _canonical_target(target):
+    """A target with defaults filled in and settings that don't apply dropped"""
+    canonical = {
+        'format': target['format'],
+        'sample_rate': target.get('sample_rate') or 44100,
+        'channels': target.get('channels') or 2,
+        'label': target.get('label') or None
+    }
+    if target['format'] in COMPRESSED_FORMATS:
+        canonical['bitrate'] = target.get('bitrate') or 320
+    else:
+        canonical['bit_depth'] = target.get('bit_depth') or 16
+    return canonical
+
+def resolve_render_settings(show, compiled, config, output_targets=None,
+                            trim_silence=None, **overrides):
+    """
+    Work out the settings a render uses
+    
+    Each setting comes from the first of: the upload (overrides that
+    aren't None), the processing template, the show, DEFAULT_RENDER_SETTINGS.
+    process_audio_file and show_settings_hash both go through here, so a
+    file rendered with its show's settings hashes the same as the show.
+    
+    Args:
+        show: Show the file belongs to (None if unknown)
+        compiled: CompiledTemplate being applied, if any
+        config: Application config (TRIM_SILENCE)
+        output_targets: Targets given by the caller, if any
+        trim_silence: Trim setting given by the caller, if any
+        **overrides: output_format, sample_rate, bit_depth, channels,
+                     normalize and normalize_level given by the caller
+    
+    Returns:
+        Dictionary with targets, normalize, normalize_level and trim_silence
+    """
+    def setting(name, show_attribute=None):
+        if overrides.get(name) is not None:
+            return overrides[name]
+        if show is not None and getattr(show, show_attribute or name) is not None:
+            return getattr(show, show_attribute or name)
+        return DEFAULT_RENDER_SETTINGS[name]
+    
+    if compiled:
+        normalize = compiled.normalize
+        normalize_level = compiled.normalize_level
+    else:
+        normalize = setting('normalize')
+        normalize_level = setting('normalize_level')
+    
+    if trim_silence is None and show is not None:
+        trim_silence = show.trim_silence
+    if trim_silence is None:
+        trim_silence = config.get('TRIM_SILENCE', False)
+    
+    # Every deliverable for the file - they are all written by the same
+    # FFmpeg run from a single decode
+    targets = output_targets
+    if targets is None and show is not None and show.output_targets.count() > 0:
+        targets = [target.to_dict() for target in show.output_targets]
+    if not targets and compiled:
+        targets = [compiled.to_target()]
+    if not targets:
+        targets = [{
+            'label': None,
+            'format': setting('output_format', 'default_format'),
+            'sample_rate': setting('sample_rate'),
+            'bit_depth': setting('bit_depth'),
+            'channels': setting('channels'),
+            'bitrate': None
+        }]
+    
+    return {
+        'targets': targets,
+        'normalize': normalize,
+        'normalize_level': normalize_level,
+        'trim_silence': trim_silence
+    }
+
+def show_settings_hash(show, config):
+    """
+    Hash of the settings a file of this show would be rendered with now,
+    when nothing is overridden by the upload
+    
+    Returns:
+        Hash string, or None if the show's template can't be compiled
+    """
+    # Imported here because the template engine is only needed for sweeps
+    from app.template_engine import get_compiled_template, TemplateError
+    
+    compiled = None
+    if show.template:
+        try:
+            compiled = get_compiled_template(show.template)
+        except TemplateError as e:
+            logger.warning(f"Skipping {show.name}: template does not compile: {str(e)}")
+            return None
+    
+    settings = resolve_render_settings(show, compiled, config)
+    return render_settings_hash(settings['targets'], settings['normalize'],
+                                settings['normalize_level'], settings['trim_silence'],
+                                compiled.template_id if compiled else None,
+                                compiled.version if compiled else None)
+
+def recorded_settings_hash(processed_file):
+    """
+    Work out the settings hash of a file rendered before hashes were stored,
+    from the output records it left behind - or, for files from before
+    output records existed, from the primary output's format and a probe
+    of the file itself
+    
+    Returns:
+        Hash string, or None if there is nothing to go by (such files are
+        treated as stale)
+    """
+    targets = [{
+        'format': output.output_format,
+        'sample_rate': output.sample_rate,
+        'bit_depth': output.bit_depth,
+        'channels': output.channels,
+        'bitrate': output.bitrate,
+        'label': output.label
+    } for output in processed_file.outputs]
+    if not targets:
+        target = probed_target(processed_file)
+        if target is None:
+            return None
+        targets = [target]
+    
+    trimmed = processed_file.trim_start is not None or processed_file.trim_end is not None
+    return render_settings_hash(targets, processed_file.normalized, processed_file.normalize_level,
+                                trimmed, processed_file.template_id, processed_file.template_version)
+
+def probed_target(processed_file):
+    """The primary output's target settings, read from the file on disk"""
+    # Imported here because utils is only needed for old records
+    from app.utils import get_file_info
+    
+    path = processed_file.output_filename
+    if not processed_file.output_format or not path or not os.path.isfile(path):
+        return None
+    info = get_file_info(path)
+    if not info['success']:
+        return None
+    return {
+        'format': processed_file.output_format,
+        'sample_rate': info.get('sample_rate'),
+        'bit_depth': info.get('bit_depth'),
+        'channels': info.get('channels'),
+        'bitrate': info['bitrate'] // 1000 if info.get('bitrate') else None,
+        'label': None
+    }
+
+def live_files_query(show_id=None):
+    """Successful renders that are still on disk and haven't been replaced"""
+    query = ProcessedFile.query.filter(
+        ProcessedFile.success.is_(True),
+        ProcessedFile.show_id.isnot(None),
+        ProcessedFile.expired_at.is_(None),
+        ProcessedFile.replaced_by_id.is_(None)
+    )
+    if show_id is not None:
+        query = query.filter(ProcessedFile.show_id == show_id)
+    return query
+
+def backfill_settings_hashes(batch_size=500):
+    """
+    Store settings hashes for files rendered before they were recorded
+    
+    Returns:
+        Number of files updated
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        files = live_files_query().filter(ProcessedFile.settings_hash.is_(None),
+                                          ProcessedFile.id > last_id) \
+            .order_by(ProcessedFile.id).limit(batch_size).all()
+        if not files:
+            return updated
+        for processed_file in files:
+            # Left empty when there's nothing to go by (counted as stale)
+            processed_file.settings_hash = recorded_settings_hash(processed_file)
+            updated += processed_file.settings_hash is not None
+        last_id = files[-1].id
+        db.session.commit()
+
+def find_stale_files(show_id=None, config=None):
+    """
+    Files whose settings hash no longer matches their show
+    (run backfill_settings_hashes first, so older files that already
+    match aren't rendered again)
+    
+    Args:
+        show_id: Only look at this show
+        config: Application config (defaults to the current app's)
+    
+    Returns:
+        Dictionary of show id -> (wanted hash, list of stale ProcessedFiles)
+    """
+    config = config or current_app.config
+    shows = [Show.query.get(show_id)] if show_id is not None else Show.query.all()
+    
+    stale = {}
+    for show in shows:
+        if show is None:
+            continue
+        wanted = show_settings_hash(show, config)
+        if wanted is None:
+            continue
+        files = live_files_query(show.id).filter(settings_differ(wanted)) \
+            .order_by(ProcessedFile.id).all()
+        if files:
+            stale[show.id] = (wanted, files)
+    return stale
+
+def count_stale_files(show, config=None):
+    """
+    Number of this show's files rendered with other settings (one query)
+    
+    Files rendered before settings hashes were stored count as stale until
+    a sweep has filled their hashes in.
+    """
+    wanted = show_settings_hash(show, config or current_app.config)
+    if wanted is None:
+        return 0
+    return live_files_query(show.id).filter(settings_differ(wanted)).count()
+
+def settings_differ(wanted):
+    """
+    Filter for files not rendered with the wanted settings hash
+    
+    A file with no hash (nothing recorded to work it out from) is included,
+    since "!=" never matches NULL.
+    """
+    return or_(ProcessedFile.settings_hash.is_(None), ProcessedFile.settings_hash != wanted)
+
+def find_source(processed_file):
+    """The input a file was rendered from, if it is still on disk"""
+    candidates = [processed_file.source_path]
+    job = ProcessingJob.query.filter_by(processed_file_id=processed_file.id).first()
+    if job:
+        candidates.append(job.input_path)
+    # Files processed before source paths were stored were uploaded
+    # under their own name
+    candidates.append(os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'),
+                                   processed_file.original_filename))
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+def cached_source_info(processed_file, source_path):
+    """Probe results stored on the record, if the source hasn't changed since"""
+    if not processed_file.original_duration or processed_file.original_size is None:
+        return None
+    try:
+        if os.path.getsize(source_path) != processed_file.original_size:
+            return None
+    except OSError:
+        return None
+    return {
+        'success': True,
+        'format': processed_file.original_format,
+        'size': processed_file.original_size,
+        'duration': processed_file.original_duration,
+        'sample_rate': processed_file.original_sample_rate,
+        'bit_depth': processed_file.original_bit_depth,
+        'channels': processed_file.original_channels
+    }
+
+def cached_source_loudness(processed_file):
+    """
+    Loudness of the source as measured at the last render
+    
+    The stored profile describes the rendered audio, so the gain applied
+    then is taken off again.
+    """
+    # Imported here to keep this module light for the web app
+    from app.loudness import apply_gain
+    
+    profile = processed_file.loudness
+    if profile is None or profile.true_peak_db is None:
+        return None
+    measurements = apply_gain({
+        'integrated_lufs': profile.integrated_lufs,
+        'loudness_range': profile.loudness_range,
+        'lra_low': profile.lra_low,
+        'lra_high': profile.lra_high,
+        'momentary_max': profile.momentary_max,
+        'short_term_max': profile.short_term_max,
+        'true_peak_db': profile.true_peak_db
+    }, -(profile.gain_db or 0.0))
+    measurements.update(success=True, error=None)
+    return measurements
+
+def rerender_file(processed_file, config=None):
+    """
+    Render a file again with its show's current settings
+    
+    Returns:
+        Dictionary with success, error, file_id (the new record) and
+        whether cached probe/loudness data was reused
+    """
+    # Imported here because the audio processor loads the audio stack
+    from app.audio_processor import process_audio_file
+    
+    config = config or current_app.config
+    source_path = find_source(processed_file)
+    if source_path is None:
+        return {'success': False, 'error': 'Source file is no longer available',
+                'missing_source': True}
+    
+    show = processed_file.show
+    trim_silence = show.trim_silence if show and show.trim_silence is not None \
+        else config.get('TRIM_SILENCE', False)
+    was_trimmed = processed_file.trim_start is not None or processed_file.trim_end is not None
+    
+    # Earlier trim points and loudness only hold if trimming is unchanged
+    trim_offsets = None
+    source_loudness = None
+    if trim_silence == was_trimmed:
+        if was_trimmed:
+            trim_offsets = (processed_file.trim_start, processed_file.trim_end)
+        source_loudness = cached_source_loudness(processed_file)
+    source_info = cached_source_info(processed_file, source_path)
+    
+    old_paths = [output.output_filename for output in processed_file.outputs] or \
+        [processed_file.output_filename]
+    base_name = os.path.splitext(os.path.basename(processed_file.output_filename))[0]
+    
+    # Everything left as None so the show's settings are used
+    result = process_audio_file(
+        source_path, output_format=None, normalize=None, normalize_level=None,
+        sample_rate=None, bit_depth=None, channels=None, trim_silence=None,
+        trim_offsets=trim_offsets, output_name=base_name,
+        source_info=source_info, source_loudness=source_loudness,
+        source_name=processed_file.original_filename, show_id=processed_file.show_id
+    )
+    if not result['success']:
+        return {'success': False, 'error': result['error']}
+    
+    retire_render(processed_file, result['file_id'], old_paths, result['outputs'])
+    return {
+        'success': True,
+        'error': None,
+        'file_id': result['file_id'],
+        'reused_probe': source_info is not None,
+        'reused_loudness': source_loudness is not None
+    }
+
+def retire_render(processed_file, new_file_id, old_paths, new_paths):
+    """
+    Remove the outputs a re-render made obsolete and point the old record
+    at the new one
+    """
+    # Imported here because the waveform module loads numpy
+    from app.waveform import get_peaks_path
+    
+    for path in set(old_paths) - set(new_paths):
+        for obsolete in (path, get_peaks_path(path)):
+            try:
+                os.remove(obsolete)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove old output {obsolete}: {str(e)}")
+    
+    now = datetime.utcnow()
+    processed_file.replaced_by_id = new_file_id
+    processed_file.expired_at = now
+    ProcessedOutput.query.filter_by(processed_file_id=processed_file.id, expired_at=None) \
+        .update({'expired_at': now}, synchronize_session=False)
+    db.session.commit()
+
+def wait_until_idle(config, stop=None):
+    """
+    Block while the workers have queued or running jobs
+    
+    Returns:
+        False if stop was set while waiting, otherwise True
+    """
+    # Imported here to avoid loading the admission module for the web app
+    from app.admission import get_load
+    
+    poll = config.get('RERENDER_IDLE_POLL_SECONDS', 10)
+    while True:
+        load = get_load(config)
+        if load['queued'] == 0 and load['running'] == 0:
+            return True
+        if stop is not None:
+            if stop.wait(poll):
+                return False
+        else:
+            time.sleep(poll)
+
+def run_rerender(show_id=None, dry_run=False, limit=None, stop=None, echo=None):
+    """
+    Re-render every stale file (one at a time, whenever the workers are idle)
+    
+    Args:
+        show_id: Only this show
+        dry_run: Just report what would be re-rendered
+        limit: Stop after this many files
+        stop: Optional threading.Event that ends the sweep early
+        echo: Optional function called with a line per file
+    
+    Returns:
+        Summary dictionary (stale, rendered, failed, skipped, errors, duration)
+    """
+    if not _sweep_lock.acquire(blocking=False):
+        return {'success': False, 'error': 'A re-render sweep is already running'}
+    
+    try:
+        config = current_app.config
+        started = time.time()
+        backfill_settings_hashes()
+        stale = find_stale_files(show_id, config)
+        
+        report = {
+            'success': True,
+            'dry_run': dry_run,
+            'stale': sum(len(files) for _, files in stale.values()),
+            'rendered': 0,
+            'failed': 0,
+            'skipped': 0,
+            'reused_loudness': 0,
+            'errors': []
+        }
+        
+        queue = [processed_file for _, files in stale.values() for processed_file in files]
+        if dry_run:
+            queue = []
+        elif limit is not None:
+            queue = queue[:limit]
+        
+        for processed_file in queue:
+            # Only use capacity the workers aren't using
+            if not wait_until_idle(config, stop):
+                break
+            
+            outcome = rerender_file(processed_file, config)
+            name = processed_file.original_filename
+            if outcome['success']:
+                report['rendered'] += 1
+                report['reused_loudness'] += int(outcome['reused_loudness'])
+            elif outcome.get('missing_source'):
+                report['skipped'] += 1
+            else:
+                report['failed'] += 1
+                report['errors'].append(f"{name}: {outcome['error']}")
+            if echo:
+                echo(f"{name}: {'re-rendered' if outcome['success'] else outcome['error']}")
+        
+        report['duration'] = round(time.time() - started, 2)
+        logger.info(f"Re-render sweep{' (dry run)' if dry_run else ''}: {report['stale']} stale, "
+                    f"{report['rendered']} re-rendered, {report['failed']} failed, "
+                    f"{report['skipped']} without source")
+        return report
+    finally:
+        _sweep_lock.release()
+
+def start_rerender_sweep(app, show_id=None):
+    """Run a re-render sweep on a background thread"""
+    def run():
+        with app.app_context():
+            run_rerender(show_id=show_id)
+            db.session.remove()
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,278 @@
+"""
+Retention Module for Radio Automation System
+Removes processed files once they pass their show's retention period and
+marks the matching database records as expired
+
+Designed for very large archives on busy disks: the folder tree is walked
+with os.scandir, database updates are made in batches, and deletes are
+rate limited so a sweep never starves the air chain of disk I/O.
+"""
+
+import os
+import time
+import threading
+import logging
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import Show, ProcessedFile, ProcessedOutput
+from app.storage import slugify, PARTIAL_SUFFIX, UNSORTED_FOLDER
+
+logger = logging.getLogger(__name__)
+
+# Partial files older than this are leftovers from a crashed render
+STALE_PARTIAL_SECONDS = 24 * 60 * 60
+
+# Ending of the waveform peaks file kept next to each output
+# (see waveform.get_peaks_path)
+PEAKS_SUFFIX = '.peaks'
+
+# Only one sweep runs at a time
+_sweep_lock = threading.Lock()
+
+class RateLimiter:
+    """Spaces out operations so no more than `rate` happen per second"""
+    
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+    
+    def wait(self):
+        """Block until the next operation is allowed"""
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+def get_retention_policies(default_days, root=None):
+    """
+    Retention period for each show's storage folder
+    
+    A show's folder is named after the show, so a show that has been
+    renamed has an older folder too. Folders under root that don't match
+    a current name are looked up through the files recorded in them.
+    
+    Returns:
+        Dictionary of folder name -> days to keep (None = keep forever)
+    """
+    shows = Show.query.all()
+    days_by_show = {show.id: show.retention_days or default_days for show in shows}
+    policies = {UNSORTED_FOLDER: default_days}
+    for show in shows:
+        policies[slugify(show.name)] = days_by_show[show.id]
+    
+    if root and os.path.isdir(root):
+        for entry in os.scandir(root):
+            if not entry.is_dir(follow_symlinks=False) or entry.name in policies:
+                continue
+            show_id = _folder_show_id(entry.path)
+            if show_id in days_by_show:
+                policies[entry.name] = days_by_show[show_id]
+    return policies
+
+def _folder_show_id(folder):
+    """Show of any file recorded as stored in a folder (None if there are none)"""
+    # Every output of a file sits beside its primary one, so the primary
+    # output's path is enough to go by
+    row = db.session.query(ProcessedFile.show_id).filter(
+        ProcessedFile.output_filename.startswith(folder + os.sep, autoescape=True),
+        ProcessedFile.show_id.isnot(None)
+    ).first()
+    return row[0] if row else None
+
+def scan_expired(root, policies, default_days, now=None):
+    """
+    Walk the processed folder and yield files past their retention period
+    
+    Each directory is read once with os.scandir; files under a show's
+    folder use that show's policy, anything else the default. Peaks files
+    go with their audio, so they are only yielded once the audio they
+    describe is gone (e.g. deleted by hand or by an interrupted sweep).
+    
+    Yields:
+        Tuples of (path, folder, size, kind) where kind is 'output',
+        'partial' (a stale leftover render) or 'orphan' (a peaks file)
+    """
+    now = now or time.time()
+    if not os.path.isdir(root):
+        return
+    
+    stack = [(root, None)]
+    while stack:
+        directory, folder = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            logger.warning(f"Could not scan {directory}: {str(e)}")
+            continue
+        
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    # The first level below the root is the show folder
+                    stack.append((entry.path, folder or entry.name))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                
+                is_peaks = entry.name.endswith(PEAKS_SUFFIX)
+                if is_peaks and os.path.exists(entry.path[:-len(PEAKS_SUFFIX)]):
+                    continue
+                
+                try:
+                    stat_result = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                age = now - stat_result.st_mtime
+                
+                if is_peaks:
+                    yield entry.path, folder, stat_result.st_size, 'orphan'
+                    continue
+                
+                if entry.name.endswith(PARTIAL_SUFFIX):
+                    if age > STALE_PARTIAL_SECONDS:
+                        yield entry.path, folder, stat_result.st_size, 'partial'
+                    continue
+                
+                days = policies.get(folder, default_days)
+                if days and age > days * 24 * 60 * 60:
+                    yield entry.path, folder, stat_result.st_size, 'output'
+
+def run_retention(dry_run=False, now=None):
+    """
+    Run a retention sweep over the processed folder
+    
+    Args:
+        dry_run: Report what would be removed without deleting anything
+        now: Current time as a timestamp (for testing)
+    
+    Returns:
+        Report dictionary with totals, a per-folder breakdown and any errors
+    """
+    if not _sweep_lock.acquire(blocking=False):
+        return {'success': False, 'error': 'A retention sweep is already running'}
+    
+    try:
+        return _sweep(dry_run, now)
+    finally:
+        _sweep_lock.release()
+
+def _sweep(dry_run, now):
+    """Body of run_retention (called with the sweep lock held)"""
+    config = current_app.config
+    root = config.get('PROCESSED_FOLDER', 'processed')
+    default_days = config.get('RETENTION_DAYS', 30)
+    batch_size = config.get('RETENTION_BATCH_SIZE', 500)
+    limiter = RateLimiter(config.get('RETENTION_DELETES_PER_SECOND', 50))
+    
+    started = time.time()
+    policies = get_retention_policies(default_days, root)
+    report = {
+        'success': True,
+        'dry_run': dry_run,
+        'files': 0,
+        'bytes': 0,
+        'records_expired': 0,
+        'orphaned_peaks': 0,
+        'folders': {},
+        'errors': []
+    }
+    
+    batch = []
+    orphans = []
+    for path, folder, size, kind in scan_expired(root, policies, default_days, now):
+        summary = report['folders'].setdefault(folder or '(root)', {'files': 0, 'bytes': 0})
+        summary['files'] += 1
+        summary['bytes'] += size
+        report['files'] += 1
+        report['bytes'] += size
+        if kind == 'orphan':
+            report['orphaned_peaks'] += 1
+        
+        if dry_run:
+            continue
+        
+        limiter.wait()
+        try:
+            os.remove(path)
+        except OSError as e:
+            # An orphan may already have gone along with its expired audio
+            if not (kind == 'orphan' and isinstance(e, FileNotFoundError)):
+                report['errors'].append(f"{path}: {str(e)}")
+            continue
+        
+        if kind == 'output':
+            _remove_sidecars(path)
+            batch.append(path)
+        elif kind == 'orphan':
+            orphans.append(path)
+        
+        if len(batch) >= batch_size:
+            report['records_expired'] += _mark_expired(batch)
+            batch = []
+        if len(orphans) >= batch_size:
+            _forget_peaks(orphans)
+            orphans = []
+    
+    if batch:
+        report['records_expired'] += _mark_expired(batch)
+    if orphans:
+        _forget_peaks(orphans)
+    
+    report['duration'] = round(time.time() - started, 2)
+    logger.info(f"Retention sweep{' (dry run)' if dry_run else ''}: {report['files']} files, "
+                f"{report['bytes'] / (1024 * 1024):.1f} MB, {len(report['errors'])} errors")
+    return report
+
+def _remove_sidecars(path):
+    """Delete files that only exist to describe a removed output"""
+    # Imported here because the waveform module loads numpy
+    from app.waveform import get_peaks_path
+    
+    try:
+        os.remove(get_peaks_path(path))
+    except FileNotFoundError:
+        pass
+
+def _forget_peaks(paths):
+    """Stop records pointing at a batch of deleted orphaned peaks files"""
+    ProcessedFile.query.filter(
+        ProcessedFile.peaks_filename.in_(paths)
+    ).update({'peaks_filename': None}, synchronize_session=False)
+    db.session.commit()
+
+def _mark_expired(paths):
+    """
+    Mark the records for a batch of deleted files as expired
+    
+    Returns:
+        Number of records updated
+    """
+    expired_at = datetime.utcnow()
+    
+    updated = ProcessedOutput.query.filter(
+        ProcessedOutput.output_filename.in_(paths),
+        ProcessedOutput.expired_at.is_(None)
+    ).update({'expired_at': expired_at}, synchronize_session=False)
+    
+    updated += ProcessedFile.query.filter(
+        ProcessedFile.output_filename.in_(paths),
+        ProcessedFile.expired_at.is_(None)
+    ).update({'expired_at': expired_at, 'peaks_filename': None}, synchronize_session=False)
+    
+    db.session.commit()
+    return updated
+
+def start_retention_sweep(app):
+    """Run a real (not dry-run) sweep on a background thread"""
+    def run():
+        with app.app_context():
+            run_retention()
+            db.session.remove()
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -3,15 +3,29 @@ Web Routes for Radio Automation System
 These functions handle web page requests and form submissions
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify,
+                   current_app, session, make_response, Response, stream_with_context)
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import Show, ShowAlias, ProcessedFile, ProcessingTemplate
-from app.audio_processor import process_audio_file
-from app.pattern_matcher import parse_filename
+from app.models import (Show, ShowAlias, ShowOutputTarget, ShowJingle, ProcessedFile,
+                        ProcessedOutput, ProcessingTemplate, ProcessingJob, LoudnessProfile)
+from app.jobs import create_job, run_job
+from app.scheduler import get_queue, at_risk_report, start_workers
+from app.retention import run_retention, start_retention_sweep
+from app.rerender import run_rerender, start_rerender_sweep, count_stale_files
+from app.pattern_matcher import parse_filename, compile_grammar, show_alias_names, PatternError
 from app.utils import allowed_file, get_file_info
+from app.template_engine import compile_template, clear_template_cache
+from app.loudness import check_compliance
+from app.file_delivery import send_processed_file
+from app.preview import build_playlist, get_preview_segment, get_segment_count
+from app.catalog import get_show_catalog, get_catalog_fragment, catalog_to_json
+from app.bulk import parse_filenames, submit_jobs
+from app.admission import check_admission
+from app.storage import get_upload_path
 import os
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
 import time
 
 # Create a blueprint (a way to organize routes)
@@ -40,12 +54,77 @@ def index():
                          recent_files=recent_files,
                          success_rate=round(success_rate, 1))
 
+def _admission_refused(urgent=False, job_count=1):
+    """
+    Check whether the server can take this request's files right now
+    
+    Args:
+        urgent: Check the urgent limits instead of the normal ones
+        job_count: Number of jobs the request would queue
+    
+    Returns:
+        None when admitted, otherwise the check_admission decision
+    """
+    decision = check_admission(current_app.config, urgent=urgent,
+                               incoming_bytes=request.content_length or 0,
+                               job_count=job_count)
+    if decision['admitted']:
+        return None
+    current_app.logger.warning(f"Refused {request.path} ({decision['status']}): {decision['reason']}")
+    return decision
+
+def _batch_refused(urgent_count, normal_count):
+    """
+    Check a whole batch: its urgent jobs must all fit under the urgent
+    limits and the rest under the normal ones, or none of it is taken
+    
+    Returns:
+        None when admitted, otherwise the check_admission decision
+    """
+    if urgent_count:
+        decision = _admission_refused(urgent=True, job_count=urgent_count)
+        if decision is not None:
+            return decision
+    if normal_count:
+        return _admission_refused(job_count=normal_count)
+    return None
+
+def _urgent_request():
+    """
+    Whether an upload is marked urgent - read from the query string
+    (?urgent=1) or an X-Urgent header, so it is known before the body is
+    """
+    flag = request.args.get('urgent') or request.headers.get('X-Urgent') or ''
+    return flag.lower() in ('1', 'true', 'on', 'yes')
+
+def _refusal_response(decision):
+    """JSON 429/503 reply telling the client when to try again"""
+    response = jsonify({'error': decision['reason'], 'retry_after': decision['retry_after']})
+    response.status_code = decision['status']
+    response.headers['Retry-After'] = str(decision['retry_after'])
+    return response
+
 @main_bp.route('/upload', methods=['GET', 'POST'])
 def upload():
     """
     File upload page - handles single and multiple file uploads
     """
     if request.method == 'POST':
+        # Refuse before reading the body if even an urgent file wouldn't fit,
+        # then apply the normal limits unless the upload is marked urgent
+        urgent = _urgent_request()
+        decision = _admission_refused(urgent=True)
+        if decision is None and not urgent:
+            decision = _admission_refused()
+        if decision is not None:
+            flash(f"Upload refused: {decision['reason']}. "
+                  f"Try again in {decision['retry_after']} seconds.", 'error')
+            templates = ProcessingTemplate.query.order_by(ProcessingTemplate.name).all()
+            response = make_response(render_template('upload.html', templates=templates),
+                                     decision['status'])
+            response.headers['Retry-After'] = str(decision['retry_after'])
+            return response
+        
         # Check if files were uploaded
         if 'files' not in request.files:
             flash('No files selected', 'error')
@@ -53,11 +132,22 @@ def upload():
         
         files = request.files.getlist('files')
         
-        # Get processing options from form
-        normalize = request.form.get('normalize', 'on') == 'on'
-        output_format = request.form.get('format', 'wav')
+        # Get processing options from form - anything left on "Show default"
+        # is passed as None so the show's own setting is used
+        normalize = {'on': True, 'off': False}.get(request.form.get('normalize'))
+        output_format = request.form.get('format') or None
+        template_id = request.form.get('template_id', type=int)
+        options = {
+            'output_format': output_format,
+            'normalize': normalize,
+            'template_id': template_id
+        }
+        
+        # With background workers, files are queued; otherwise processed now
+        inline = current_app.config.get('PROCESSING_WORKERS', 2) <= 0
         
         processed_count = 0
+        queued_count = 0
         error_count = 0
         
         for file in files:
@@ -68,50 +158,96 @@ def upload():
                 # Secure the filename
                 filename = secure_filename(file.filename)
                 
-                # Save uploaded file
-                upload_path = os.path.join('uploads', filename)
+                # Save uploaded file under a name of its own
+                upload_path = get_upload_path(current_app.config.get('UPLOAD_FOLDER', 'uploads'),
+                                              filename)
                 file.save(upload_path)
                 
-                try:
-                    # Process the file
-                    result = process_audio_file(
-                        upload_path,
-                        output_format=output_format,
-                        normalize=normalize
-                    )
-                    
-                    if result['success']:
-                        processed_count += 1
-                        flash(f'Successfully processed: {filename}', 'success')
-                    else:
-                        error_count += 1
-                        flash(f'Error processing {filename}: {result["error"]}', 'error')
-                        
-                except Exception as e:
+                # Quick header check - anything that isn't audio stops here
+                job = create_job(filename, upload_path, processing_options=options, urgent=urgent)
+                if job.status == 'rejected':
+                    error_count += 1
+                    flash(f'Rejected {filename}: {job.validation_detail}', 'error')
+                    continue
+                
+                if not inline:
+                    queued_count += 1
+                    continue
+                
+                # Process the file
+                result = run_job(job)
+                
+                if result['success']:
+                    processed_count += 1
+                    flash(f'Successfully processed: {filename}', 'success')
+                else:
                     error_count += 1
-                    flash(f'Error processing {filename}: {str(e)}', 'error')
+                    flash(f'Error processing {filename}: {result["error"]}', 'error')
             else:
                 error_count += 1
                 flash(f'Invalid file type: {file.filename}', 'error')
         
+        if queued_count > 0:
+            start_workers(current_app._get_current_object())
+        
         # Summary message
         if processed_count > 0:
             flash(f'Successfully processed {processed_count} file(s)', 'info')
+        if queued_count > 0:
+            flash(f'Queued {queued_count} file(s) for processing', 'info')
         if error_count > 0:
             flash(f'{error_count} file(s) had errors', 'warning')
             
         return redirect(url_for('main.history'))
     
     # GET request - show upload form
-    return render_template('upload.html')
+    templates = ProcessingTemplate.query.order_by(ProcessingTemplate.name).all()
+    return render_template('upload.html', templates=templates)
 
 @main_bp.route('/shows')
 def shows():
     """
     Show management page - list all radio shows
+    
+    The show cards come from the cached catalog, and browsers that already
+    have the current version get a 304 Not Modified.
+    """
+    fingerprint, entries = get_show_catalog()
+    etag = f'catalog-{fingerprint}'
+    
+    # A pending flash message has to be shown, so never answer 304 then
+    if '_flashes' not in session and etag in request.if_none_match:
+        return _catalog_response('', etag, 304)
+    
+    cards = get_catalog_fragment(
+        'show_cards', fingerprint,
+        lambda: render_template('_show_cards.html', shows=entries)
+    )
+    return _catalog_response(render_template('shows.html', show_cards=cards), etag)
+
+@main_bp.route('/api/shows')
+def api_shows():
     """
-    all_shows = Show.query.order_by(Show.name).all()
-    return render_template('shows.html', shows=all_shows)
+    API endpoint listing every show with its aliases and file count
+    """
+    fingerprint, entries = get_show_catalog()
+    etag = f'catalog-{fingerprint}'
+    if etag in request.if_none_match:
+        return _catalog_response('', etag, 304)
+    
+    body = get_catalog_fragment(
+        'json', fingerprint,
+        lambda: json.dumps({'shows': catalog_to_json(entries)})
+    )
+    return _catalog_response(body, etag, mimetype='application/json')
+
+def _catalog_response(body, etag, status=200, mimetype='text/html'):
+    """Response that browsers must revalidate with the catalog ETag"""
+    response = make_response(body, status)
+    response.mimetype = mimetype
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 @main_bp.route('/shows/add', methods=['GET', 'POST'])
 def add_show():
@@ -144,7 +280,12 @@ def add_show():
             bit_depth=int(request.form.get('bit_depth', 16)),
             channels=int(request.form.get('channels', 2)),
             normalize=request.form.get('normalize', 'on') == 'on',
-            normalize_level=float(request.form.get('normalize_level', -1.0))
+            normalize_level=float(request.form.get('normalize_level', -1.0)),
+            trim_silence=request.form.get('trim_silence') == 'on',
+            template_id=request.form.get('template_id', type=int),
+            retention_days=request.form.get('retention_days', type=int),
+            air_time=_parse_air_time(request.form.get('air_time')),
+            filename_pattern=request.form.get('filename_pattern', '').strip() or None
         )
         
         db.session.add(show)
@@ -161,12 +302,19 @@ def add_show():
                     )
                     db.session.add(show_alias)
         
+        error = _check_filename_pattern(show)
+        if error:
+            db.session.rollback()
+            flash(error, 'error')
+            return redirect(request.url)
+        
         db.session.commit()
         flash(f'Show "{name}" added successfully!', 'success')
         return redirect(url_for('main.shows'))
     
     # GET request - show form
-    return render_template('add_show.html')
+    templates = ProcessingTemplate.query.order_by(ProcessingTemplate.name).all()
+    return render_template('add_show.html', templates=templates)
 
 @main_bp.route('/shows/<int:show_id>/edit', methods=['GET', 'POST'])
 def edit_show(show_id):
@@ -185,13 +333,127 @@ def edit_show(show_id):
         show.channels = int(request.form.get('channels', 2))
         show.normalize = request.form.get('normalize', 'on') == 'on'
         show.normalize_level = float(request.form.get('normalize_level', -1.0))
+        show.trim_silence = request.form.get('trim_silence') == 'on'
+        show.template_id = request.form.get('template_id', type=int)
+        show.retention_days = request.form.get('retention_days', type=int)
+        show.air_time = _parse_air_time(request.form.get('air_time'))
+        show.filename_pattern = request.form.get('filename_pattern', '').strip() or None
+        
+        error = _check_filename_pattern(show)
+        if error:
+            db.session.rollback()
+            flash(error, 'error')
+            return redirect(request.url)
         
         db.session.commit()
         flash(f'Show "{show.name}" updated successfully!', 'success')
+        
+        stale = count_stale_files(show)
+        if stale:
+            flash(f'{stale} processed file(s) of this show were rendered with other settings - '
+                  f'run `flask rerender --show {show.id}` to bring them up to date', 'info')
         return redirect(url_for('main.shows'))
     
     # GET request - show form with current values
-    return render_template('edit_show.html', show=show)
+    templates = ProcessingTemplate.query.order_by(ProcessingTemplate.name).all()
+    return render_template('edit_show.html', show=show, templates=templates)
+
+def _check_filename_pattern(show):
+    """Error message if the show's filename pattern can't be compiled, else None"""
+    if not show.filename_pattern:
+        return None
+    try:
+        compile_grammar(show.filename_pattern, aliases=show_alias_names(show))
+    except PatternError as e:
+        return f'Invalid filename pattern: {str(e)}'
+    return None
+
+def _parse_air_time(value):
+    """Turn an HH:MM form value into a time (blank or invalid = None)"""
+    try:
+        return datetime.strptime(value.strip(), '%H:%M').time()
+    except (AttributeError, ValueError):
+        return None
+
+@main_bp.route('/shows/<int:show_id>/targets/add', methods=['POST'])
+def add_output_target(show_id):
+    """
+    Add an output target to a show
+    Every target is rendered from the same decode when a file is processed
+    """
+    show = Show.query.get_or_404(show_id)
+    
+    output_format = request.form.get('target_format', 'wav')
+    bitrate = request.form.get('target_bitrate', '').strip()
+    
+    target = ShowOutputTarget(
+        show_id=show.id,
+        label=request.form.get('target_label', '').strip() or None,
+        output_format=output_format,
+        sample_rate=int(request.form.get('target_sample_rate', 44100)),
+        bit_depth=int(request.form.get('target_bit_depth', 16)),
+        channels=int(request.form.get('target_channels', 2)),
+        bitrate=int(bitrate) if bitrate else None
+    )
+    
+    db.session.add(target)
+    db.session.commit()
+    flash(f'Output target added to "{show.name}"', 'success')
+    return redirect(url_for('main.edit_show', show_id=show.id))
+
+@main_bp.route('/shows/<int:show_id>/targets/<int:target_id>/delete', methods=['POST'])
+def delete_output_target(show_id, target_id):
+    """
+    Remove an output target from a show
+    """
+    target = ShowOutputTarget.query.filter_by(id=target_id, show_id=show_id).first_or_404()
+    
+    db.session.delete(target)
+    db.session.commit()
+    flash('Output target removed', 'success')
+    return redirect(url_for('main.edit_show', show_id=show_id))
+
+@main_bp.route('/shows/<int:show_id>/jingles/add', methods=['POST'])
+def add_jingle(show_id):
+    """
+    Fingerprint an uploaded jingle so files of this show can be recognised
+    by their audio when their names can't be parsed
+    """
+    # Imported here because fingerprinting loads numpy and the audio stack
+    from app.audio_fingerprint import add_jingle as store_jingle
+    
+    show = Show.query.get_or_404(show_id)
+    upload = request.files.get('jingle')
+    if not upload or not upload.filename or not allowed_file(upload.filename):
+        flash('Choose an audio file with the jingle', 'error')
+        return redirect(url_for('main.edit_show', show_id=show.id))
+    
+    filename = secure_filename(upload.filename)
+    path = os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), f'jingle-{filename}')
+    upload.save(path)
+    try:
+        result = store_jingle(show, path, label=request.form.get('jingle_label', '').strip() or None,
+                              config=current_app.config)
+    finally:
+        os.remove(path)
+    
+    if result['success']:
+        flash(f'Jingle added to "{show.name}" ({result["jingle"].hash_count} hashes)', 'success')
+    else:
+        flash(f'Could not add jingle: {result["error"]}', 'error')
+    return redirect(url_for('main.edit_show', show_id=show.id))
+
+@main_bp.route('/shows/<int:show_id>/jingles/<int:jingle_id>/delete', methods=['POST'])
+def delete_jingle(show_id, jingle_id):
+    """
+    Remove a jingle fingerprint from a show
+    """
+    jingle = ShowJingle.query.filter_by(id=jingle_id, show_id=show_id).first_or_404()
+    
+    db.session.delete(jingle)
+    db.session.commit()
+    flash('Jingle removed', 'success')
+    return redirect(url_for('main.edit_show', show_id=show_id))
 
 @main_bp.route('/shows/<int:show_id>/delete', methods=['POST'])
 def delete_show(show_id):
@@ -239,6 +501,119 @@ def settings():
     templates = ProcessingTemplate.query.all()
     return render_template('settings.html', templates=templates)
 
+@main_bp.route('/api/templates', methods=['GET', 'POST'])
+def api_templates():
+    """
+    API endpoint to list processing templates or create a new one
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        if not data.get('name'):
+            return jsonify({'error': 'Template name is required'}), 400
+        if ProcessingTemplate.query.filter_by(name=data['name']).first():
+            return jsonify({'error': 'A template with this name already exists'}), 400
+        
+        template = ProcessingTemplate()
+        return _save_template(template, data, 201)
+    
+    templates = ProcessingTemplate.query.order_by(ProcessingTemplate.name).all()
+    return jsonify([_template_to_dict(template) for template in templates])
+
+@main_bp.route('/api/templates/<int:template_id>', methods=['GET', 'PUT', 'DELETE'])
+def api_template(template_id):
+    """
+    API endpoint to view, update or delete a processing template
+    """
+    template = ProcessingTemplate.query.get_or_404(template_id)
+    
+    if request.method == 'PUT':
+        return _save_template(template, request.get_json() or {}, 200)
+    
+    if request.method == 'DELETE':
+        in_use = _template_in_use(template.id)
+        if in_use:
+            return jsonify({'error': f'Template is in use by {in_use}'}), 400
+        db.session.delete(template)
+        db.session.commit()
+        clear_template_cache(template_id)
+        return jsonify({'success': True})
+    
+    return jsonify(_template_to_dict(template))
+
+def _template_in_use(template_id):
+    """
+    What still refers to a template, or None if it can be deleted
+    
+    Shows pick a template, jobs waiting in the queue may have been
+    submitted with one, and processed files record the template they were
+    rendered with (re-rendering needs it to tell whether they are stale).
+    """
+    if Show.query.filter_by(template_id=template_id).count() > 0:
+        return 'one or more shows'
+    
+    # Queued jobs keep their options as JSON, so the text is only a first filter
+    jobs = ProcessingJob.query.filter(
+        ProcessingJob.status.in_(['queued', 'processing']),
+        ProcessingJob.processing_options.like('%template_id%')
+    ).all()
+    for job in jobs:
+        if json.loads(job.processing_options).get('template_id') == template_id:
+            return 'one or more queued jobs'
+    
+    if ProcessedFile.query.filter_by(template_id=template_id).count() > 0:
+        return 'one or more processed files'
+    return None
+
+def _save_template(template, data, status):
+    """
+    Apply submitted fields to a template, validate it by compiling it,
+    and save it (the version number is bumped automatically on update)
+    """
+    fields = {
+        'name': str, 'description': str, 'output_format': str,
+        'sample_rate': int, 'bit_depth': int, 'channels': int,
+        'normalize': bool, 'normalize_level': float, 'remove_dc_offset': bool,
+        'fade_in_ms': int, 'fade_out_ms': int
+    }
+    
+    try:
+        for field, convert in fields.items():
+            if field in data:
+                setattr(template, field, convert(data[field]))
+        
+        # Fill in column defaults for new templates before validating
+        for column in ProcessingTemplate.__table__.columns:
+            if getattr(template, column.name) is None and column.default is not None \
+                    and not callable(column.default.arg):
+                setattr(template, column.name, column.default.arg)
+        
+        compile_template(template)
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.add(template)
+    db.session.commit()
+    return jsonify(_template_to_dict(template)), status
+
+def _template_to_dict(template):
+    """Return a processing template as a JSON-friendly dictionary"""
+    return {
+        'id': template.id,
+        'name': template.name,
+        'description': template.description,
+        'output_format': template.output_format,
+        'sample_rate': template.sample_rate,
+        'bit_depth': template.bit_depth,
+        'channels': template.channels,
+        'normalize': template.normalize,
+        'normalize_level': template.normalize_level,
+        'remove_dc_offset': template.remove_dc_offset,
+        'fade_in_ms': template.fade_in_ms,
+        'fade_out_ms': template.fade_out_ms,
+        'version': template.version
+    }
+
 @main_bp.route('/api/parse-filename', methods=['POST'])
 def api_parse_filename():
     """
@@ -252,6 +627,51 @@ def api_parse_filename():
     
     return jsonify(result)
 
+@main_bp.route('/api/parse-filenames', methods=['POST'])
+def api_parse_filenames():
+    """
+    API endpoint to parse and match many filenames in one call
+    
+    Body: {"filenames": ["AIG_100424.wav", "FOF_123199.mp3", ...]}
+    Send `Accept: application/x-ndjson` (or ?stream=1) to receive one JSON
+    line per filename as it is parsed instead of a single JSON reply.
+    """
+    data = request.get_json(silent=True) or {}
+    filenames = data.get('filenames')
+    if not isinstance(filenames, list):
+        return jsonify({'error': 'filenames must be a list'}), 400
+    
+    limit = current_app.config.get('BULK_MAX_ITEMS', 10000)
+    if len(filenames) > limit:
+        return jsonify({'error': f'At most {limit} filenames per request'}), 413
+    
+    return _batch_response(parse_filenames(filenames))
+
+def _batch_response(results):
+    """
+    Reply to a batch request
+    
+    Clients that accept application/x-ndjson (or pass ?stream=1) get each
+    result as its own JSON line the moment it's ready; everyone else gets
+    one JSON object once the whole batch is done.
+    """
+    preferred = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    streaming = preferred == 'application/x-ndjson' or \
+        request.args.get('stream', '0') in ('1', 'true', 'yes')
+    
+    if streaming:
+        def generate():
+            for result in results:
+                yield json.dumps(result) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    results = list(results)
+    return jsonify({
+        'count': len(results),
+        'succeeded': sum(1 for result in results if result['success']),
+        'results': results
+    })
+
 @main_bp.route('/api/file-info/<int:file_id>')
 def api_file_info(file_id):
     """
@@ -272,9 +692,359 @@ def api_file_info(file_id):
         'channels': file.original_channels,
         'processed_at': file.processed_at.strftime('%Y-%m-%d %H:%M:%S'),
         'success': file.success,
-        'error_message': file.error_message
+        'error_message': file.error_message,
+        'has_waveform': bool(file.peaks_filename),
+        'trim_start': file.trim_start,
+        'trim_end': file.trim_end,
+        'outputs': [{
+            'id': output.id,
+            'label': output.label,
+            'format': output.output_format,
+            'sample_rate': output.sample_rate,
+            'bit_depth': output.bit_depth,
+            'channels': output.channels,
+            'size_mb': output.get_file_size_mb()
+        } for output in file.outputs],
+        'loudness': file.loudness.to_dict() if file.loudness else None,
+        'expired_at': file.expired_at.strftime('%Y-%m-%d %H:%M:%S') if file.expired_at else None
     })
 
+@main_bp.route('/api/loudness/compliance')
+def api_loudness_compliance():
+    """
+    API endpoint for a loudness compliance report
+    
+    Answered entirely from stored measurements - no audio is decoded.
+    
+    Query parameters:
+        target: Integrated loudness target in LUFS (default from config)
+        tolerance: Allowed deviation in LU (default from config)
+        max_true_peak: True peak ceiling in dBTP (default from config)
+        show_id: Only include files for this show
+        days: Only include files processed in the last N days
+    """
+    config = current_app.config
+    target = request.args.get('target', config.get('LOUDNESS_TARGET_LUFS', -23.0), type=float)
+    tolerance = request.args.get('tolerance', config.get('LOUDNESS_TOLERANCE_LU', 1.0), type=float)
+    max_true_peak = request.args.get('max_true_peak', config.get('LOUDNESS_MAX_TRUE_PEAK', -1.0),
+                                     type=float)
+    
+    query = db.session.query(LoudnessProfile, ProcessedFile).join(
+        ProcessedFile, LoudnessProfile.processed_file_id == ProcessedFile.id
+    )
+    show_id = request.args.get('show_id', type=int)
+    if show_id:
+        query = query.filter(ProcessedFile.show_id == show_id)
+    days = request.args.get('days', type=int)
+    if days:
+        query = query.filter(ProcessedFile.processed_at >= datetime.utcnow() - timedelta(days=days))
+    
+    checked = 0
+    failures = []
+    for profile, file in query.order_by(ProcessedFile.processed_at.desc()):
+        checked += 1
+        result = check_compliance(profile, target, tolerance, max_true_peak)
+        if not result['compliant']:
+            failures.append({
+                'file_id': file.id,
+                'filename': file.output_filename,
+                'show_name': file.show.name if file.show else 'Unknown',
+                'loudness': profile.to_dict(),
+                'problems': result['problems']
+            })
+    
+    return jsonify({
+        'spec': {
+            'target_lufs': target,
+            'tolerance_lu': tolerance,
+            'max_true_peak': max_true_peak
+        },
+        'checked': checked,
+        'compliant': checked - len(failures),
+        'non_compliant': len(failures),
+        'failures': failures
+    })
+
+@main_bp.route('/api/waveform/<int:file_id>')
+def api_waveform(file_id):
+    """
+    API endpoint to get waveform peaks for part of a processed file
+    
+    Query parameters:
+        start: Start of the range in seconds (default 0)
+        end: End of the range in seconds (default end of file)
+        buckets: Maximum number of min/max pairs to return (default 1000)
+    """
+    file = ProcessedFile.query.get_or_404(file_id)
+    
+    if not file.peaks_filename or not os.path.exists(file.peaks_filename):
+        return jsonify({'error': 'No waveform available for this file'}), 404
+    
+    start = request.args.get('start', 0.0, type=float)
+    end = request.args.get('end', None, type=float)
+    buckets = request.args.get('buckets', 1000, type=int)
+    buckets = max(1, min(buckets, 10000))
+    
+    # Imported here because the waveform module loads numpy
+    from app.waveform import read_peaks_range
+    
+    try:
+        result = read_peaks_range(file.peaks_filename, start=start, end=end,
+                                  max_buckets=buckets)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 500
+    
+    result['file_id'] = file.id
+    return jsonify(result)
+
+@main_bp.route('/api/retention', methods=['POST'])
+def api_retention():
+    """
+    API endpoint to run a retention sweep
+    
+    With dry_run=1 the report of what would be removed is returned straight
+    away. A real sweep is rate limited and can take a while, so it runs in
+    the background.
+    """
+    if request.args.get('dry_run', '0') in ('1', 'true', 'yes'):
+        return jsonify(run_retention(dry_run=True))
+    
+    start_retention_sweep(current_app._get_current_object())
+    return jsonify({'success': True, 'started': True}), 202
+
+@main_bp.route('/api/rerender', methods=['POST'])
+def api_rerender():
+    """
+    API endpoint to re-render files whose show settings have changed
+    
+    Takes an optional show_id. With dry_run=1 the number of stale files is
+    returned straight away; otherwise the sweep runs in the background,
+    whenever the workers are idle.
+    """
+    show_id = request.args.get('show_id', type=int)
+    if request.args.get('dry_run', '0') in ('1', 'true', 'yes'):
+        return jsonify(run_rerender(show_id=show_id, dry_run=True))
+    
+    start_rerender_sweep(current_app._get_current_object(), show_id)
+    return jsonify({'success': True, 'started': True}), 202
+
+@main_bp.route('/api/jobs')
+def api_jobs():
+    """
+    API endpoint listing queued jobs in the order they will be processed
+    """
+    limit = request.args.get('limit', 100, type=int)
+    queue = get_queue(limit)
+    return jsonify({
+        'running': [job.to_dict() for job in ProcessingJob.query.filter_by(status='processing').all()],
+        'queued': [job.to_dict() for job in queue]
+    })
+
+@main_bp.route('/api/jobs/bulk', methods=['POST'])
+def api_jobs_bulk():
+    """
+    API endpoint to submit many files as processing jobs
+    
+    Either a JSON body naming files already on the server:
+        {"defaults": {"output_format": "mp3"},
+         "items": [{"path": "/archive/AIG_100424.wav", "options": {...}, "urgent": true}]}
+    or a multipart upload with any number of `files`, plus optional
+    `defaults` and `items` form fields holding the same JSON (items are
+    matched to uploads by "filename").
+    
+    Each item's options override the defaults. Results come back in item
+    order, as one JSON reply or streamed NDJSON (see api_parse_filenames).
+    """
+    limit = current_app.config.get('BULK_MAX_ITEMS', 10000)
+    
+    # Refuse before reading the body if even urgent files wouldn't fit;
+    # the normal limits are applied once we know whether the batch is urgent
+    decision = _admission_refused(urgent=True)
+    if decision is not None:
+        return _refusal_response(decision)
+    
+    if request.files:
+        try:
+            defaults = json.loads(request.form.get('defaults') or '{}')
+            settings = json.loads(request.form.get('items') or '[]')
+        except ValueError:
+            return jsonify({'error': 'defaults and items must be JSON'}), 400
+        if not isinstance(settings, list):
+            return jsonify({'error': 'items must be a list'}), 400
+        by_name = {entry.get('filename'): entry for entry in settings if isinstance(entry, dict)}
+        
+        uploads = request.files.getlist('files')
+        if len(uploads) > limit:
+            return jsonify({'error': f'At most {limit} files per request'}), 413
+        
+        # Checked before any upload is written to disk
+        urgent_count = sum(1 for upload in uploads if by_name.get(upload.filename, {}).get('urgent'))
+        decision = _batch_refused(urgent_count, len(uploads) - urgent_count)
+        if decision is not None:
+            return _refusal_response(decision)
+        
+        items = []
+        for upload in uploads:
+            entry = by_name.get(upload.filename, {})
+            if not upload.filename or not allowed_file(upload.filename):
+                # Kept in the list so the error comes back in the right position
+                items.append({'filename': upload.filename, 'error': 'Invalid file type'})
+                continue
+            filename = secure_filename(upload.filename)
+            upload_path = get_upload_path(current_app.config.get('UPLOAD_FOLDER', 'uploads'),
+                                          filename)
+            upload.save(upload_path)
+            items.append({'upload_path': upload_path, 'filename': filename,
+                          'options': entry.get('options'), 'urgent': entry.get('urgent')})
+    else:
+        data = request.get_json(silent=True) or {}
+        defaults = data.get('defaults') or {}
+        items = data.get('items')
+        if not isinstance(items, list):
+            return jsonify({'error': 'items must be a list'}), 400
+        if len(items) > limit:
+            return jsonify({'error': f'At most {limit} items per request'}), 413
+        
+        # Only these keys are taken from the client (upload_path is internal)
+        items = [{key: item.get(key) for key in ('path', 'filename', 'options', 'urgent')}
+                 if isinstance(item, dict) else item for item in items]
+        
+        urgent_count = sum(1 for item in items if isinstance(item, dict) and item.get('urgent'))
+        decision = _batch_refused(urgent_count, len(items) - urgent_count)
+        if decision is not None:
+            return _refusal_response(decision)
+    
+    if not isinstance(defaults, dict):
+        return jsonify({'error': 'defaults must be an object'}), 400
+    
+    app = current_app._get_current_object()
+    inline = app.config.get('PROCESSING_WORKERS', 2) <= 0
+    
+    def results():
+        for result in submit_jobs(items, defaults, run_inline=inline):
+            if result['success'] and not inline:
+                start_workers(app)
+            yield result
+    
+    return _batch_response(results())
+
+@main_bp.route('/api/admission')
+def api_admission():
+    """
+    API endpoint showing whether normal and urgent work would be accepted
+    right now, and the load figures behind it
+    """
+    normal = check_admission(current_app.config)
+    urgent = check_admission(current_app.config, urgent=True)
+    return jsonify({
+        'enabled': current_app.config.get('ADMISSION_ENABLED', True),
+        'normal': {key: normal[key] for key in ('admitted', 'status', 'retry_after', 'reason')},
+        'urgent': {key: urgent[key] for key in ('admitted', 'status', 'retry_after', 'reason')},
+        'load': normal['load']
+    })
+
+@main_bp.route('/api/jobs/at-risk')
+def api_jobs_at_risk():
+    """
+    API endpoint listing queued jobs that are unlikely to be ready before
+    their deadline at the current processing rate
+    """
+    workers = max(1, current_app.config.get('PROCESSING_WORKERS', 2))
+    return jsonify(at_risk_report(workers))
+
+@main_bp.route('/api/jobs/<int:job_id>')
+def api_job(job_id):
+    """
+    API endpoint to get the status of a processing job
+    """
+    job = ProcessingJob.query.get_or_404(job_id)
+    return jsonify(job.to_dict())
+
+@main_bp.route('/api/jobs/<int:job_id>/urgent', methods=['POST'])
+def api_job_urgent(job_id):
+    """
+    API endpoint to move a queued job to the front of the queue
+    (send {"urgent": false} to undo)
+    """
+    job = ProcessingJob.query.get_or_404(job_id)
+    if job.status != 'queued':
+        return jsonify({'error': f'Job is {job.status}, only queued jobs can be reprioritised'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    job.urgent = bool(data.get('urgent', True))
+    db.session.commit()
+    return jsonify(job.to_dict())
+
+@main_bp.route('/api/preview/<int:file_id>')
+def api_preview(file_id):
+    """
+    API endpoint describing the preview stream of a processed file
+    """
+    file = ProcessedFile.query.get_or_404(file_id)
+    duration, error = _preview_duration(file)
+    if error:
+        return jsonify({'error': error}), 404
+    
+    segment_seconds = current_app.config.get('PREVIEW_SEGMENT_SECONDS', 10)
+    return jsonify({
+        'file_id': file.id,
+        'duration': duration,
+        'segment_seconds': segment_seconds,
+        'segment_count': get_segment_count(duration, segment_seconds),
+        'playlist_url': url_for('main.preview_playlist', file_id=file.id),
+    })
+
+@main_bp.route('/preview/<int:file_id>/playlist.m3u8')
+def preview_playlist(file_id):
+    """
+    HLS playlist for the low-bitrate preview of a processed file
+    """
+    file = ProcessedFile.query.get_or_404(file_id)
+    duration, error = _preview_duration(file)
+    if error:
+        return jsonify({'error': error}), 404
+    
+    playlist = build_playlist(
+        duration,
+        current_app.config.get('PREVIEW_SEGMENT_SECONDS', 10),
+        lambda index: url_for('main.preview_segment', file_id=file.id, index=index)
+    )
+    return current_app.response_class(playlist, mimetype='application/vnd.apple.mpegurl')
+
+@main_bp.route('/preview/<int:file_id>/<int:index>.mp3')
+def preview_segment(file_id, index):
+    """
+    One preview segment - transcoded on first request, then served from cache
+    """
+    file = ProcessedFile.query.get_or_404(file_id)
+    duration, error = _preview_duration(file)
+    if error:
+        return jsonify({'error': error}), 404
+    
+    segment_seconds = current_app.config.get('PREVIEW_SEGMENT_SECONDS', 10)
+    if index >= get_segment_count(duration, segment_seconds):
+        return jsonify({'error': 'Segment out of range'}), 404
+    
+    try:
+        path = get_preview_segment(file.output_filename, index, current_app.config)
+    except RuntimeError as e:
+        current_app.logger.error(f"Preview segment {index} of file {file.id} failed: {str(e)}")
+        return jsonify({'error': 'Could not create preview segment'}), 500
+    
+    # A segment never changes for a given render, so browsers can keep it
+    return send_file(os.path.abspath(path), mimetype='audio/mpeg', conditional=True,
+                     max_age=86400)
+
+def _preview_duration(file):
+    """Duration of a processed file's primary output, or an error message"""
+    if not file.output_filename or not os.path.exists(file.output_filename):
+        return None, 'Processed file not found'
+    
+    info = get_file_info(file.output_filename)
+    if not info['success'] or not info['duration']:
+        return None, 'Could not read processed file'
+    return info['duration'], None
+
 @main_bp.route('/download/<int:file_id>')
 def download_file(file_id):
     """
@@ -282,11 +1052,33 @@ def download_file(file_id):
     """
     file = ProcessedFile.query.get_or_404(file_id)
     
+    if file.expired_at:
+        flash('This file has passed its retention period and was removed', 'warning')
+        return redirect(url_for('main.history'))
+    
     if not file.output_filename or not os.path.exists(file.output_filename):
         flash('Processed file not found', 'error')
         return redirect(url_for('main.history'))
     
-    return send_file(file.output_filename, as_attachment=True)
+    return send_processed_file(file.output_filename)
+
+@main_bp.route('/download/<int:file_id>/outputs/<int:output_id>')
+def download_output(file_id, output_id):
+    """
+    Download one of the outputs rendered for a processed file
+    """
+    output = ProcessedOutput.query.filter_by(id=output_id,
+                                             processed_file_id=file_id).first_or_404()
+    
+    if output.expired_at:
+        flash('This file has passed its retention period and was removed', 'warning')
+        return redirect(url_for('main.history'))
+    
+    if not output.output_filename or not os.path.exists(output.output_filename):
+        flash('Processed file not found', 'error')
+        return redirect(url_for('main.history'))
+    
+    return send_processed_file(output.output_filename)
 
 # Error handlers
 @main_bp.errorhandler(404)
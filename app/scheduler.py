@@ -0,0 +1,393 @@
+"""
+Job Scheduler Module for Radio Automation System
+Decides which queued job runs next and warns about jobs that won't be
+ready in time for air
+
+Order of work:
+  1. Urgent jobs (marked by hand)
+  2. Jobs with the closest deadline (air time minus a safety margin)
+  3. Jobs with no known air date, oldest first
+
+Workers may run in several processes or on several machines sharing one
+database. A worker claims a job with a conditional UPDATE and holds a
+lease on it that it renews while the job runs; a job whose lease runs out
+is put back in the queue for someone else.
+"""
+
+import os
+import math
+import time
+import socket
+import threading
+import logging
+from datetime import datetime, time as time_of_day, timedelta
+from sqlalchemy import case
+from app import db
+from app.models import ProcessingJob, Show, ShowAlias
+from app.pattern_matcher import parse_filename
+
+logger = logging.getLogger(__name__)
+
+# Jobs used to estimate how long a job takes
+THROUGHPUT_SAMPLE = 50
+
+# Used when nothing has been processed yet
+DEFAULT_JOB_SECONDS = 30.0
+
+def find_show_for_filename(filename):
+    """
+    Work out the show and air date of a file from its name
+    
+    Returns:
+        Tuple of (show or None, date or None)
+    """
+    parsed = parse_filename(filename)
+    show = None
+    if parsed['show_id']:
+        # The show's own filename pattern matched
+        show = Show.query.get(parsed['show_id'])
+    elif parsed['show_name']:
+        alias = ShowAlias.query.filter_by(alias=parsed['show_name'].lower()).first()
+        if alias:
+            show = alias.show
+    return show, parsed['date']
+
+def compute_deadline(show, air_date, config):
+    """
+    When a file for this show and date must be finished
+    
+    Args:
+        show: Show the file belongs to (may be None)
+        air_date: Date the episode airs (None = no deadline)
+        config: Application config (DEFAULT_AIR_TIME, JOB_DEADLINE_LEAD_MINUTES)
+    
+    Returns:
+        datetime or None
+    """
+    if air_date is None:
+        return None
+    
+    air_time = show.air_time if show and show.air_time else None
+    if air_time is None:
+        hours, minutes = config.get('DEFAULT_AIR_TIME', '06:00').split(':')
+        air_time = time_of_day(int(hours), int(minutes))
+    
+    lead = timedelta(minutes=config.get('JOB_DEADLINE_LEAD_MINUTES', 60))
+    return datetime.combine(air_date, air_time) - lead
+
+def queue_order():
+    """ORDER BY clauses that put the most pressing job first"""
+    return (
+        ProcessingJob.urgent.desc(),
+        # Jobs without a deadline go after every job that has one
+        case((ProcessingJob.deadline.is_(None), 1), else_=0),
+        ProcessingJob.deadline.asc(),
+        ProcessingJob.created_at.asc(),
+        ProcessingJob.id.asc()
+    )
+
+def get_queue(limit=None):
+    """Queued jobs in the order they will run"""
+    query = ProcessingJob.query.filter_by(status='queued').order_by(*queue_order())
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+def make_worker_id(number=0):
+    """Name a worker after its machine, process and thread number"""
+    return f"{socket.gethostname()}:{os.getpid()}:{number}"
+
+def claim_next_job(worker_id=None, lease_seconds=120):
+    """
+    Take the most pressing queued job and lease it to a worker
+    
+    The status change is a conditional UPDATE, so if two workers (in any
+    process or on any machine) pick the same job only one of them gets it.
+    
+    Args:
+        worker_id: Name of the claiming worker (see make_worker_id)
+        lease_seconds: How long the job is held without a heartbeat
+    
+    Returns:
+        ProcessingJob or None if the queue is empty
+    """
+    while True:
+        job = ProcessingJob.query.filter_by(status='queued').order_by(*queue_order()).first()
+        if job is None:
+            return None
+        
+        now = datetime.utcnow()
+        claimed = ProcessingJob.query.filter_by(id=job.id, status='queued').update({
+            'status': 'processing',
+            'started_at': now,
+            'worker_id': worker_id,
+            'heartbeat_at': now,
+            'lease_expires_at': now + timedelta(seconds=lease_seconds),
+            'attempts': ProcessingJob.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        
+        if claimed:
+            db.session.refresh(job)
+            return job
+
+def renew_lease(job_id, worker_id, lease_seconds):
+    """
+    Heartbeat: extend a worker's lease on a job
+    
+    Returns:
+        False if the worker no longer holds the job (its lease ran out and
+        the job was requeued)
+    """
+    now = datetime.utcnow()
+    renewed = ProcessingJob.query.filter_by(
+        id=job_id, worker_id=worker_id, status='processing'
+    ).update({
+        'heartbeat_at': now,
+        'lease_expires_at': now + timedelta(seconds=lease_seconds)
+    }, synchronize_session=False)
+    db.session.commit()
+    return bool(renewed)
+
+def requeue_expired(max_attempts=3, now=None):
+    """
+    Put jobs whose worker stopped sending heartbeats back in the queue
+    
+    Jobs that have already been tried max_attempts times are failed
+    instead, so a file that crashes workers can't take them all down.
+    
+    Returns:
+        Tuple of (requeued count, failed count)
+    """
+    now = now or datetime.utcnow()
+    expired = ProcessingJob.query.filter(
+        ProcessingJob.status == 'processing',
+        ProcessingJob.lease_expires_at < now
+    )
+    
+    failed = expired.filter(ProcessingJob.attempts >= max_attempts).update({
+        'status': 'failed',
+        'error_message': f'Worker stopped responding ({max_attempts} attempts)',
+        'finished_at': now,
+        'lease_expires_at': None
+    }, synchronize_session=False)
+    
+    requeued = expired.update({
+        'status': 'queued',
+        'worker_id': None,
+        'started_at': None,
+        'lease_expires_at': None
+    }, synchronize_session=False)
+    db.session.commit()
+    
+    if requeued or failed:
+        logger.warning(f"Lease expired: requeued {requeued} job(s), failed {failed}")
+    return requeued, failed
+
+class Heartbeat:
+    """
+    Renews a job's lease on a background thread while the job runs
+    
+    Use as a context manager around the work; the `lost` event is set if
+    another worker took the job over in the meantime (run_job uses it to
+    stop the job's FFmpeg runs).
+    """
+    
+    def __init__(self, app, job_id, worker_id):
+        self.app = app
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = app.config.get('WORKER_LEASE_SECONDS', 120)
+        self.interval = app.config.get('WORKER_HEARTBEAT_SECONDS', 20)
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    if not renew_lease(self.job_id, self.worker_id, self.lease_seconds):
+                        self.lost.set()
+                        logger.warning(f"Worker {self.worker_id} lost its lease on job {self.job_id}")
+                        return
+                except Exception as e:
+                    # A missed heartbeat is fine as long as the next one gets through
+                    logger.warning(f"Heartbeat for job {self.job_id} failed: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+def estimate_job_seconds(sample=THROUGHPUT_SAMPLE):
+    """Average wall-clock time of recently finished jobs"""
+    jobs = ProcessingJob.query.filter(
+        ProcessingJob.status.in_(('completed', 'failed')),
+        ProcessingJob.started_at.isnot(None),
+        ProcessingJob.finished_at.isnot(None)
+    ).order_by(ProcessingJob.finished_at.desc()).limit(sample).all()
+    
+    durations = [(job.finished_at - job.started_at).total_seconds() for job in jobs]
+    if not durations:
+        return DEFAULT_JOB_SECONDS
+    return max(0.1, sum(durations) / len(durations))
+
+def at_risk_report(workers, now=None):
+    """
+    Estimate when each queued job will finish and flag the ones that
+    will miss their deadline
+    
+    Jobs are walked in queue order; with N workers, the k-th job finishes
+    after roughly ceil(k / N) average job times.
+    
+    Args:
+        workers: Number of jobs processed at once
+        now: Current local time (for testing)
+    
+    Returns:
+        Dictionary with the throughput estimate and the at-risk jobs
+    """
+    # Air times (and so deadlines) are station local time
+    now = now or datetime.now()
+    workers = max(1, workers)
+    job_seconds = estimate_job_seconds()
+    
+    # Jobs already running hold a worker for about half a job on average
+    running = ProcessingJob.query.filter_by(status='processing').count()
+    backlog = running * 0.5
+    
+    at_risk = []
+    queue = get_queue()
+    for position, job in enumerate(queue, start=1):
+        rounds = math.ceil((backlog + position) / workers)
+        estimated_finish = now + timedelta(seconds=rounds * job_seconds)
+        
+        if job.deadline and estimated_finish > job.deadline:
+            entry = job.to_dict()
+            entry['position'] = position
+            entry['estimated_finish'] = estimated_finish.isoformat()
+            entry['late_by_seconds'] = round((estimated_finish - job.deadline).total_seconds())
+            entry['already_late'] = job.deadline < now
+            at_risk.append(entry)
+    
+    return {
+        'queued': len(queue),
+        'running': running,
+        'workers': workers,
+        'seconds_per_job': round(job_seconds, 2),
+        'jobs_per_hour': round(3600 * workers / job_seconds, 1),
+        'at_risk': at_risk
+    }
+
+class WorkerPool:
+    """
+    Background threads that run queued jobs in priority order
+    
+    Workers sleep when the queue is empty and are woken by notify()
+    whenever a job is added in this process, or after WORKER_POLL_SECONDS
+    to pick up jobs added elsewhere and requeue jobs of dead workers.
+    """
+    
+    def __init__(self, app, count):
+        self.app = app
+        self.count = count
+        self._wake = threading.Event()
+        self._threads = []
+        self._next_sweep = 0
+    
+    def start(self):
+        """Start the worker threads"""
+        for number in range(self.count):
+            thread = threading.Thread(target=self._run, args=(make_worker_id(number),),
+                                      name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.count} processing worker(s)")
+    
+    def join(self):
+        """Wait for the worker threads (they run until the process is stopped)"""
+        for thread in self._threads:
+            thread.join()
+    
+    def notify(self):
+        """Wake idle workers because there's new work"""
+        self._wake.set()
+    
+    def _run(self, worker_id):
+        """Worker loop: claim a job, run it under a lease, repeat"""
+        # Imported here because jobs imports the audio processor
+        from app.jobs import run_job
+        
+        config = self.app.config
+        lease_seconds = config.get('WORKER_LEASE_SECONDS', 120)
+        
+        while True:
+            with self.app.app_context():
+                try:
+                    # Look for dead workers' jobs about once per heartbeat
+                    if time.monotonic() >= self._next_sweep:
+                        self._next_sweep = time.monotonic() + config.get('WORKER_HEARTBEAT_SECONDS', 20)
+                        requeue_expired(config.get('JOB_MAX_ATTEMPTS', 3))
+                    job = claim_next_job(worker_id, lease_seconds)
+                    if job is not None:
+                        with Heartbeat(self.app, job.id, worker_id) as heartbeat:
+                            run_job(job, worker_id=worker_id, cancel=heartbeat.lost)
+                        continue
+                except Exception as e:
+                    logger.error(f"Worker {worker_id} error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            
+            self._wake.wait(timeout=config.get('WORKER_POLL_SECONDS', 5))
+            self._wake.clear()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def init_workers(app):
+    """
+    Start a web process's worker pool with the first request it serves
+    
+    Under gunicorn nothing else runs when a process starts, so without this
+    jobs left in the queue by a restart (including ones whose lease
+    requeue_expired would reclaim) would wait for the next upload. CLI
+    commands never serve a request, so they don't start a pool.
+    """
+    if not app.config.get('WORKERS_START_WITH_APP', True):
+        return
+    
+    @app.before_request
+    def start_worker_pool():
+        if _pool is None:
+            start_workers(app)
+
+def start_workers(app, count=None):
+    """
+    Start this process's worker pool (once) and wake it up
+    
+    Args:
+        app: Flask application
+        count: Number of worker threads (default PROCESSING_WORKERS)
+    
+    Returns:
+        The WorkerPool, or None if there are no workers
+    """
+    global _pool
+    count = app.config.get('PROCESSING_WORKERS', 2) if count is None else count
+    if count <= 0:
+        return None
+    
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(app, count)
+            _pool.start()
+    _pool.notify()
+    return _pool
@@ -0,0 +1,109 @@
+"""
+Schema Upgrade Module for Radio Automation System
+Brings a database made by an older version up to date in place
+
+db.create_all() creates tables that are missing but never changes a table
+that already exists, so a column added to a model after its table was
+created would be missing from existing databases ("no such column").
+upgrade_schema() adds each such column with ALTER TABLE ... ADD COLUMN.
+It only adds what's missing, so it is safe to run on every start.
+"""
+
+import logging
+from sqlalchemy import inspect, literal, text
+
+logger = logging.getLogger(__name__)
+
+# Columns added to tables after the tables were first released, oldest
+# first, as (table, column). The column definitions come from the models.
+ADDED_COLUMNS = [
+    # Waveform peak files
+    ('processed_files', 'peaks_filename'),
+    # Silence trimming
+    ('shows', 'trim_silence'),
+    ('processed_files', 'trim_start'),
+    ('processed_files', 'trim_end'),
+    # Processing templates
+    ('shows', 'template_id'),
+    ('processed_files', 'template_id'),
+    ('processed_files', 'template_version'),
+    ('processing_templates', 'updated_at'),
+    ('processing_templates', 'version'),
+    # Retention
+    ('shows', 'retention_days'),
+    ('processed_files', 'expired_at'),
+    ('processed_outputs', 'expired_at'),
+    # Deadline scheduling
+    ('shows', 'air_time'),
+    ('processing_jobs', 'show_id'),
+    ('processing_jobs', 'air_date'),
+    ('processing_jobs', 'deadline'),
+    ('processing_jobs', 'urgent'),
+    ('processing_jobs', 'processing_options'),
+    # Worker leases
+    ('processing_jobs', 'worker_id'),
+    ('processing_jobs', 'lease_expires_at'),
+    ('processing_jobs', 'heartbeat_at'),
+    ('processing_jobs', 'attempts'),
+    # Resource governor events
+    ('processing_jobs', 'resource_events'),
+    # Re-rendering on settings changes
+    ('processed_files', 'source_path'),
+    ('processed_files', 'settings_hash'),
+    ('processed_files', 'replaced_by_id'),
+]
+
+def column_definition(column, dialect):
+    """
+    The "name TYPE [NOT NULL DEFAULT value]" part of ADD COLUMN for a model column
+    
+    Existing rows get the column's default. A NOT NULL column needs one
+    (SQLite refuses to add it otherwise), so without a plain default value
+    the column is added as nullable.
+    """
+    definition = f'{column.name} {column.type.compile(dialect=dialect)}'
+    
+    default = column.default
+    if default is not None and default.is_scalar:
+        value = literal(default.arg, type_=column.type).compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True})
+        definition += f' DEFAULT {value}'
+        if not column.nullable:
+            definition += ' NOT NULL'
+    return definition
+
+def upgrade_schema(db):
+    """
+    Add any columns in ADDED_COLUMNS that the database doesn't have yet,
+    with their indexes
+    Needs an application context, and runs after db.create_all()
+    
+    Returns:
+        List of "table.column" names that were added
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing = {}
+    added = []
+    
+    for table_name, column_name in ADDED_COLUMNS:
+        if table_name not in existing:
+            existing[table_name] = {c['name'] for c in inspector.get_columns(table_name)}
+        if column_name in existing[table_name]:
+            continue
+        
+        table = db.metadata.tables[table_name]
+        column = table.columns[column_name]
+        with engine.begin() as connection:
+            connection.execute(text(
+                f'ALTER TABLE {table_name} ADD COLUMN {column_definition(column, engine.dialect)}'))
+        existing[table_name].add(column_name)
+        
+        for index in table.indexes:
+            if column_name in index.columns:
+                index.create(engine, checkfirst=True)
+        
+        added.append(f'{table_name}.{column_name}')
+        logger.info(f"Added column {table_name}.{column_name} to the database")
+    
+    return added
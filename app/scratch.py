@@ -0,0 +1,254 @@
+"""
+Scratch Space Module for Radio Automation System
+Keeps the busy intermediate I/O of a job off the storage array the playout
+server reads from
+
+When SCRATCH_FOLDER points at a fast location (tmpfs, a local NVMe disk),
+each job copies its input there in one sequential read, runs every
+analysis pass and the FFmpeg render against that copy, and writes its
+outputs there too. Finished outputs are then moved to PROCESSED_FOLDER in
+one sequential write each.
+
+The scratch folder has a size budget (SCRATCH_BUDGET_MB). A job that would
+go over it - or that doesn't fit in the space actually free there - simply
+spills: it works straight from uploads/ into processed/ as before.
+"""
+
+import os
+import uuid
+import shutil
+import threading
+import logging
+from app.storage import get_partial_path, commit_output
+
+logger = logging.getLogger(__name__)
+
+# FLAC output size as a fraction of the same audio as PCM (real files are
+# usually well under this)
+LOSSLESS_RATIO = 0.7
+
+# Extra room allowed on top of the size estimate
+ESTIMATE_MARGIN = 1.1
+
+_spaces = {}
+_spaces_lock = threading.Lock()
+
+class ScratchSpace:
+    """
+    A scratch folder and the bytes currently reserved in it
+    
+    Each job gets its own subfolder, named after this process, so several
+    worker processes on one machine can share the folder and leftovers
+    from a crashed process can be told apart and cleaned up.
+    """
+    
+    def __init__(self, root, budget_bytes, min_free_bytes=0):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.reserved_bytes = 0
+        self.spills = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(root, exist_ok=True)
+        remove_stale_folders(root)
+    
+    def reserve(self, size):
+        """
+        Claim room for a job
+        
+        Args:
+            size: Bytes the job expects to write to scratch
+        
+        Returns:
+            ScratchLease, or None if the job should spill to normal storage
+        """
+        with self._lock:
+            if self.reserved_bytes + size > self.budget_bytes:
+                self.spills += 1
+                return None
+            
+            # Other processes share the folder, so also check what's really free
+            try:
+                free = shutil.disk_usage(self.root).free
+            except OSError:
+                free = 0
+            if free - size < self.min_free_bytes:
+                self.spills += 1
+                return None
+            
+            self.reserved_bytes += size
+        
+        directory = os.path.join(self.root, f"{os.getpid()}-{uuid.uuid4().hex[:12]}")
+        try:
+            os.makedirs(directory)
+        except OSError:
+            self._release(size)
+            raise
+        return ScratchLease(self, directory, size)
+    
+    def _release(self, size):
+        with self._lock:
+            self.reserved_bytes = max(0, self.reserved_bytes - size)
+    
+    def usage(self):
+        """Budget, reserved bytes and spill count, for status pages"""
+        with self._lock:
+            return {
+                'root': self.root,
+                'budget_bytes': self.budget_bytes,
+                'reserved_bytes': self.reserved_bytes,
+                'spills': self.spills
+            }
+
+class ScratchLease:
+    """
+    One job's subfolder in the scratch space
+    
+    Use it as a context manager (or call close) so the folder is removed
+    and its reservation returned however the job ends.
+    """
+    
+    def __init__(self, space, directory, size):
+        self.space = space
+        self.directory = directory
+        self.size = size
+        self._closed = False
+    
+    def path(self, name):
+        """Path for a file inside this job's folder"""
+        return os.path.join(self.directory, os.path.basename(name))
+    
+    def stage_input(self, input_path):
+        """
+        Copy the input into scratch with one sequential read
+        
+        Returns:
+            Path of the copy, which keeps the original filename
+        """
+        staged_path = self.path(input_path)
+        shutil.copyfile(input_path, staged_path)
+        return staged_path
+    
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.space._release(self.size)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def get_scratch_space(config):
+    """
+    The scratch space for this process, or None if it isn't configured
+    
+    Args:
+        config: Application config (SCRATCH_* settings)
+    """
+    root = config.get('SCRATCH_FOLDER')
+    if not root:
+        return None
+    
+    budget = int(config.get('SCRATCH_BUDGET_MB', 2048) * 1024 * 1024)
+    min_free = int(config.get('SCRATCH_MIN_FREE_MB', 256) * 1024 * 1024)
+    key = (os.path.abspath(root), budget, min_free)
+    
+    with _spaces_lock:
+        space = _spaces.get(key)
+        if space is None:
+            try:
+                space = ScratchSpace(key[0], budget, min_free)
+            except OSError as e:
+                logger.warning(f"Scratch folder {root} is not usable, working on disk: {str(e)}")
+                return None
+            _spaces[key] = space
+        return space
+
+def estimate_scratch_bytes(file_info, targets, stage_input=True, segmented=False,
+                           waveform_rate=None):
+    """
+    Upper estimate of what a job writes to scratch
+    
+    Args:
+        file_info: get_file_info result for the input
+        targets: Output targets (format, sample_rate, channels, bit_depth, bitrate)
+        stage_input: The input will be copied to scratch as well
+        segmented: The render may be split into parallel segments (see
+                   segments.py), whose raw audio - about the size of each
+                   PCM output - sits in scratch until it is joined
+        waveform_rate: Sample rate of the waveform tap, which a segmented
+                       render also keeps in scratch (float samples)
+    
+    Returns:
+        Size in bytes
+    """
+    duration = file_info.get('duration') or 0
+    total = (file_info.get('size') or 0) if stage_input else 0
+    
+    for target in targets:
+        sample_rate = target.get('sample_rate') or 44100
+        channels = target.get('channels') or 2
+        if target['format'] in ('mp3', 'm4a'):
+            bytes_per_second = (target.get('bitrate') or 320) * 1000 / 8
+        else:
+            bytes_per_second = sample_rate * channels * (target.get('bit_depth') or 16) / 8
+            if target['format'] == 'flac':
+                bytes_per_second *= LOSSLESS_RATIO
+            elif segmented:
+                total += duration * bytes_per_second
+        total += duration * bytes_per_second
+    
+    if segmented and waveform_rate:
+        total += duration * waveform_rate * 4
+    
+    return int(total * ESTIMATE_MARGIN)
+
+def move_to_storage(scratch_path, final_path):
+    """
+    Move a finished output from scratch to its final place
+    
+    The file is copied across in one sequential write under its partial
+    name, then renamed into place with commit_output, so the final folder
+    never shows a half-copied file.
+    """
+    partial_path = get_partial_path(final_path)
+    try:
+        shutil.copyfile(scratch_path, partial_path)
+        commit_output(partial_path, final_path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+    os.remove(scratch_path)
+
+def remove_stale_folders(root):
+    """Delete job folders left behind by processes that no longer exist"""
+    try:
+        entries = os.listdir(root)
+    except OSError:
+        return
+    
+    for name in entries:
+        pid = name.split('-', 1)[0]
+        if not pid.isdigit() or int(pid) == os.getpid() or _process_alive(int(pid)):
+            continue
+        logger.info(f"Removing leftover scratch folder {name}")
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
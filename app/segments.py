@@ -0,0 +1,318 @@
+"""
+Segment-Parallel Rendering Module for Radio Automation System
+Spreads the render of very long recordings across CPU cores
+
+A single FFmpeg run works through a recording on one core, so a
+multi-hour file keeps one core busy for a long time while the rest sit
+idle. Here the recording is cut into segments at exact sample positions
+and each segment is rendered on its own core, with the same gain (from
+the one loudness measurement), into raw PCM for every target. A last
+FFmpeg run joins the pieces into the output files.
+
+Each segment runs the same filter graph a single run would, just over
+fewer samples, so the output is byte for byte what a single run makes.
+That only holds when nothing in the graph depends on audio from before
+the cut, so splitting is limited to:
+  - a plain gain change (no DC filter, fades or loudnorm)
+  - PCM targets (WAV, AIFF) at the source's sample rate - encoders and
+    resamplers carry state from one sample to the next
+  - sources that decode to the same samples after a seek (PCM, FLAC)
+Everything else renders in one run, as before.
+"""
+
+import os
+import json
+import math
+import uuid
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.governor import get_limits, available_cpus, current_scope, run_in_scope
+from app.storage import PARTIAL_SUFFIX, MUXERS, discard_output, get_codec_args
+
+logger = logging.getLogger(__name__)
+
+# Codecs that decode to the same samples after a seek as in a straight
+# decode (as do all pcm_* codecs), checked byte for byte by
+# tests/test_segments.py. AAC and other codecs with encoder priming don't,
+# and MP3 seeks land where the Xing table or bitrate suggests, which can be
+# further off than SEEK_PREROLL_SECONDS in a VBR file.
+EXACT_SEEK_CODECS = ('flac',)
+
+# Shortest segment worth its own FFmpeg run (seconds)
+MIN_SEGMENT_SECONDS = 300
+
+# Later segments seek this far ahead of their first sample so the decoder
+# has settled by the time the kept audio starts (seconds)
+SEEK_PREROLL_SECONDS = 1.0
+
+def probe_stream(file_path):
+    """
+    Read the codec and sample rate of a file's first audio stream
+    
+    Returns:
+        Dictionary with codec and sample_rate, or None if ffprobe
+        couldn't read the file
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,sample_rate',
+        '-of', 'json',
+        file_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        stream = json.loads(result.stdout)['streams'][0]
+        return {'codec': stream['codec_name'], 'sample_rate': int(stream['sample_rate'])}
+    except (subprocess.SubprocessError, OSError, ValueError, KeyError, IndexError) as e:
+        logger.debug(f"Could not probe {file_path}: {str(e)}")
+        return None
+
+def sample_range(trim_start, trim_end, sample_rate):
+    """
+    The samples a render keeps, picked the way FFmpeg picks them
+    
+    The processor hands trim points to FFmpeg as -ss and -t in
+    milliseconds, and FFmpeg rounds each to the nearest sample. Doing the
+    same here means the segments cover exactly what a single run would.
+    
+    Returns:
+        Tuple of (first sample, end sample or None for the end of the file)
+    """
+    def to_samples(seconds):
+        milliseconds = round(float(f'{seconds:.3f}') * 1000)
+        return (milliseconds * sample_rate + 500) // 1000
+    
+    first = to_samples(trim_start) if trim_start else 0
+    if trim_end is None:
+        return first, None
+    return first, first + to_samples(trim_end - (trim_start or 0))
+
+def pcm_muxer(target):
+    """Raw muxer for a target's PCM codec (s16le for pcm_s16le), or None if it isn't PCM"""
+    codec_args = target.get('codec_args')
+    if codec_args is None:
+        codec_args = get_codec_args(target['format'], target.get('bit_depth', 16),
+                                    target.get('bitrate'))
+    if '-acodec' not in codec_args:
+        return None
+    codec = codec_args[codec_args.index('-acodec') + 1]
+    return codec[len('pcm_'):] if codec.startswith('pcm_') else None
+
+def default_workers(config):
+    """This worker's share of the CPUs"""
+    limits = get_limits(config)
+    cpus = available_cpus(limits)
+    if not limits['cpu_sets']:
+        # Without CPU sets every processing worker draws on the same CPUs
+        cpus //= max(1, config.get('PROCESSING_WORKERS', 1))
+    return max(1, cpus)
+
+def segment_count(duration, config):
+    """Number of segments a render of this length would be cut into (0 or 1 = none)"""
+    if not config.get('SEGMENT_PARALLEL_ENABLED', True) or not duration:
+        return 0
+    if duration < config.get('SEGMENT_PARALLEL_MIN_SECONDS', 1800):
+        return 0
+    
+    workers = config.get('SEGMENT_PARALLEL_WORKERS', 0) or default_workers(config)
+    return min(workers, int(duration // MIN_SEGMENT_SECONDS))
+
+def may_segment(duration, targets, config):
+    """
+    Quick check, before anything is measured, of whether a render might be
+    split - used to size the job's scratch reservation
+    """
+    if segment_count(duration, config) < 2:
+        return False
+    return None not in [pcm_muxer(target) for target in targets]
+
+def plan_segments(source_path, duration, filters, targets, trim_start, trim_end, config):
+    """
+    Decide whether a render should be split, and where
+    
+    Args:
+        source_path: File being rendered
+        duration: Rendered duration in seconds (after trimming)
+        filters: Shared filter chain for the render
+        targets: Render targets
+        trim_start, trim_end: Silence trim points in seconds
+        config: Application config (SEGMENT_PARALLEL_* settings)
+    
+    Returns:
+        Dictionary with segments (list of (first, end) sample numbers, end
+        None for the end of the file), muxers (raw muxer per target) and
+        sample_rate - or None to render in a single run
+    """
+    count = segment_count(duration, config)
+    if count < 2:
+        return None
+    
+    filename = os.path.basename(source_path)
+    if any(not f.startswith('volume=') for f in filters):
+        logger.debug(f"Rendering {filename} in one run: its filters can't be cut up")
+        return None
+    
+    muxers = [pcm_muxer(target) for target in targets]
+    if None in muxers:
+        logger.debug(f"Rendering {filename} in one run: compressed output")
+        return None
+    
+    stream = probe_stream(source_path)
+    if stream is None:
+        return None
+    if not (stream['codec'].startswith('pcm_') or stream['codec'] in EXACT_SEEK_CODECS):
+        logger.debug(f"Rendering {filename} in one run: {stream['codec']} can't be "
+                     f"cut at exact samples")
+        return None
+    
+    sample_rate = stream['sample_rate']
+    if any(target.get('sample_rate', 44100) != sample_rate for target in targets):
+        logger.debug(f"Rendering {filename} in one run: resampled output")
+        return None
+    
+    first, end = sample_range(trim_start, trim_end, sample_rate)
+    # The duration only places the cuts - without an end trim the last
+    # segment runs to the end of the file, wherever that turns out to be
+    last = end if end is not None else first + int(duration * sample_rate)
+    cuts = [first + (last - first) * i // count for i in range(count)] + [end]
+    
+    return {
+        'segments': list(zip(cuts[:-1], cuts[1:])),
+        'muxers': muxers,
+        'sample_rate': sample_rate
+    }
+
+def segment_input(index, first, end, sample_rate, trim_start):
+    """
+    Input options and leading filters that select one segment's samples
+    
+    The first segment opens the file exactly as a single run does and
+    counts off its samples. Later segments seek to just before their
+    first sample, keeping the file's own timestamps (counted from zero)
+    so atrim can cut at exact sample numbers wherever the seek landed.
+    
+    Returns:
+        Tuple of (input options, filters)
+    """
+    if index == 0:
+        options = ['-ss', f'{trim_start:.3f}'] if trim_start else []
+        return options, [f'atrim=end_sample={end - first}']
+    
+    options = []
+    seek = max(0.0, first / sample_rate - SEEK_PREROLL_SECONDS)
+    if seek:
+        options.extend(['-ss', f'{math.floor(seek * 1000) / 1000:.3f}'])
+    options.extend(['-copyts', '-start_at_zero'])
+    
+    trim = f'atrim=start_pts={first}'
+    if end is not None:
+        trim += f':end_pts={end}'
+    return options, [trim, 'asetpts=PTS-STARTPTS']
+
+def build_join_command(plan, targets, segment_paths, metadata_path):
+    """
+    Build the FFmpeg command that joins the raw segments into the outputs
+    
+    Each target's segments are read back to back as one raw input, and the
+    original file is opened as a last input for its tags only.
+    """
+    cmd = ['ffmpeg', '-y']
+    for t, target in enumerate(targets):
+        cmd.extend([
+            '-f', plan['muxers'][t],
+            '-ar', str(plan['sample_rate']),
+            '-ac', str(target.get('channels', 2)),
+            '-i', 'concat:' + '|'.join(paths[t] for paths in segment_paths)
+        ])
+    cmd.extend(['-i', metadata_path])
+    
+    for t, target in enumerate(targets):
+        codec_args = target.get('codec_args')
+        if codec_args is None:
+            codec_args = get_codec_args(target['format'], target.get('bit_depth', 16),
+                                        target.get('bitrate'))
+        cmd.extend(['-map', f'{t}:a:0', '-map_metadata', str(len(targets))])
+        cmd.extend(codec_args)
+        cmd.extend(['-ar', str(plan['sample_rate']), '-ac', str(target.get('channels', 2))])
+        if target.get('partial_path'):
+            cmd.extend(['-f', MUXERS[target['format']], target['partial_path']])
+        else:
+            cmd.append(target['output_path'])
+    return cmd
+
+def render_segmented(plan, source_path, targets, filters, work_dir, trim_start=None,
+                     waveform_rate=None, stdout_consumer=None):
+    """
+    Render a file in parallel segments and join them into the targets
+    
+    Args:
+        plan: Dictionary from plan_segments
+        source_path: File being rendered
+        targets: Render targets, as for build_fanout_command
+        filters: Shared filter chain (plain gain changes only)
+        work_dir: Folder for the raw segments until they're joined (the
+                  job's scratch folder when it has one)
+        trim_start: Leading trim point in seconds
+        waveform_rate, stdout_consumer: Waveform tap, as for a single run
+    
+    Returns:
+        Tuple of (return_code, stderr_tail), like run_ffmpeg
+    """
+    # Imported here because audio_processor imports this module
+    from app.audio_processor import build_fanout_command, run_ffmpeg
+    
+    app = current_app._get_current_object()
+    scope = current_scope()
+    
+    token = uuid.uuid4().hex[:12]
+    segment_paths = [
+        [os.path.join(work_dir, f'{token}-{i:03d}-{t}{PARTIAL_SUFFIX}') for t in range(len(targets))]
+        for i in range(len(plan['segments']))
+    ]
+    tap_paths = [os.path.join(work_dir, f'{token}-{i:03d}-tap{PARTIAL_SUFFIX}')
+                 for i in range(len(plan['segments']))]
+    
+    def render(i):
+        first, end = plan['segments'][i]
+        input_args, trim = segment_input(i, first, end, plan['sample_rate'], trim_start)
+        segment_targets = [dict(target, partial_path=segment_paths[i][t], muxer=plan['muxers'][t])
+                           for t, target in enumerate(targets)]
+        cmd = build_fanout_command(source_path, segment_targets, filters=trim + list(filters),
+                                   waveform_rate=waveform_rate, input_args=input_args)
+        
+        # Worker threads need the app (for the FFMPEG_* limits) and the
+        # job's resource scope (for its CPUs and any limits enforced)
+        with app.app_context():
+            if not waveform_rate:
+                return run_in_scope(scope, run_ffmpeg, cmd, step=f'segment {i + 1}')
+            with open(tap_paths[i], 'wb') as tap:
+                return run_in_scope(scope, run_ffmpeg, cmd, stdout_consumer=tap.write,
+                                    step=f'segment {i + 1}')
+    
+    try:
+        with ThreadPoolExecutor(max_workers=len(tap_paths), thread_name_prefix='segment') as pool:
+            results = list(pool.map(render, range(len(tap_paths))))
+        
+        for returncode, stderr_tail in results:
+            if returncode != 0:
+                return returncode, stderr_tail
+        
+        cmd = build_join_command(plan, targets, segment_paths, source_path)
+        returncode, stderr_tail = run_ffmpeg(cmd, step='join')
+        
+        # The segments' waveform taps, in order, make the whole file's (the
+        # preview's resampler restarts at each cut, which the peaks don't show)
+        if returncode == 0 and waveform_rate and stdout_consumer:
+            for path in tap_paths:
+                with open(path, 'rb') as tap:
+                    for chunk in iter(lambda: tap.read(65536), b''):
+                        stdout_consumer(chunk)
+        
+        return returncode, stderr_tail
+    
+    finally:
+        for path in tap_paths + [path for paths in segment_paths for path in paths]:
+            discard_output(path)
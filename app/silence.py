@@ -0,0 +1,210 @@
+"""
+Silence Detection Module for Radio Automation System
+Finds dead air at the start and end of a recording so it can be trimmed
+during processing without an extra decode of the whole file
+"""
+
+import logging
+import numpy as np
+from app.utils import read_wav_header
+
+logger = logging.getLogger(__name__)
+
+# WAV format tags we can read straight from disk
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+
+# Rate used when a compressed file has to be decoded for detection
+DECODE_SAMPLE_RATE = 16000
+
+def find_trim_points(file_path, threshold_db=-50.0, window_ms=50, max_scan_seconds=120,
+                     pad_ms=250, duration=None):
+    """
+    Find where the audio starts and ends, ignoring leading/trailing silence
+    
+    Only the first and last `max_scan_seconds` of the file are examined.
+    WAV files are memory-mapped so just those regions are ever read from
+    disk; other formats have just those regions decoded by FFmpeg.
+    
+    Args:
+        file_path: Path to the audio file
+        threshold_db: RMS level (dBFS) a window must exceed to count as audio
+        window_ms: Length of each RMS window in milliseconds
+        max_scan_seconds: How far into each end of the file to look
+        pad_ms: Silence to keep before the first and after the last window
+        duration: Known duration in seconds (needed for non-WAV files)
+    
+    Returns:
+        Dictionary with:
+            - success: Boolean indicating if detection ran
+            - start: Seconds to skip at the start of the file
+            - end: Position in seconds where the audio should stop
+            - duration: Duration of the source in seconds
+            - method: 'memmap' or 'ffmpeg'
+            - error: Error message if detection failed
+    """
+    result = {
+        'success': False,
+        'start': None,
+        'end': None,
+        'duration': duration,
+        'method': None,
+        'error': None
+    }
+    
+    threshold = 10 ** (threshold_db / 20.0)
+    
+    try:
+        wav_info = read_wav_header(file_path)
+        if wav_info and _can_memmap(wav_info):
+            head, tail, sample_rate, total_frames = _read_wav_regions(
+                file_path, wav_info, max_scan_seconds
+            )
+            result['method'] = 'memmap'
+        else:
+            if not duration:
+                result['error'] = "Duration is required to trim this format"
+                return result
+            head, tail, sample_rate, total_frames = _decode_regions(
+                file_path, duration, max_scan_seconds
+            )
+            result['method'] = 'ffmpeg'
+        
+        duration = total_frames / sample_rate
+        result['duration'] = duration
+        window = max(1, int(sample_rate * window_ms / 1000))
+        pad = pad_ms / 1000.0
+        
+        # First window above the threshold at the head of the file
+        head_rms = _window_rms(head, window)
+        loud = np.flatnonzero(head_rms > threshold)
+        if len(loud):
+            start = loud[0] * window / sample_rate
+        elif len(head) >= total_frames:
+            # Whole file is below the threshold - leave it alone
+            result['start'] = 0.0
+            result['end'] = duration
+            result['success'] = True
+            return result
+        else:
+            start = len(head) / sample_rate
+        
+        # Last window above the threshold at the tail, with windows
+        # aligned to the end of the file
+        tail_rms = _window_rms(tail[::-1], window)
+        loud = np.flatnonzero(tail_rms > threshold)
+        if len(loud):
+            end = duration - loud[0] * window / sample_rate
+        else:
+            end = duration - len(tail) / sample_rate
+        
+        result['start'] = round(float(max(0.0, start - pad)), 3)
+        result['end'] = round(float(min(duration, end + pad)), 3)
+        if result['end'] <= result['start']:
+            result['start'] = 0.0
+            result['end'] = duration
+        result['success'] = True
+    
+    except Exception as e:
+        result['error'] = f"Silence detection failed: {str(e)}"
+        logger.error(f"Error detecting silence in {file_path}: {str(e)}")
+    
+    return result
+
+def _can_memmap(wav_info):
+    """Check if the WAV sample format is one we can convert ourselves"""
+    if wav_info['format_tag'] == WAVE_FORMAT_PCM:
+        return wav_info['bits_per_sample'] in (8, 16, 24, 32)
+    if wav_info['format_tag'] == WAVE_FORMAT_IEEE_FLOAT:
+        return wav_info['bits_per_sample'] in (32, 64)
+    return False
+
+def _read_wav_regions(file_path, wav_info, max_scan_seconds):
+    """
+    Memory-map the WAV data and pull out the head and tail regions
+    
+    Returns:
+        Tuple of (head_frames, tail_frames, sample_rate, total_frames)
+        where the frame arrays are float32 shaped (frames, channels)
+    """
+    channels = wav_info['channels']
+    sample_rate = wav_info['sample_rate']
+    frame_bytes = wav_info['block_align']
+    total_frames = wav_info['data_size'] // frame_bytes
+    
+    data = np.memmap(file_path, dtype=np.uint8, mode='r',
+                     offset=wav_info['data_offset'],
+                     shape=(total_frames * frame_bytes,))
+    
+    try:
+        scan_frames = min(total_frames, int(max_scan_seconds * sample_rate))
+        head = _pcm_to_float(data[:scan_frames * frame_bytes], wav_info, channels)
+        
+        tail_start = total_frames - scan_frames
+        tail = _pcm_to_float(data[tail_start * frame_bytes:], wav_info, channels)
+    finally:
+        del data
+    
+    return head, tail, sample_rate, total_frames
+
+def _pcm_to_float(raw, wav_info, channels):
+    """Convert a slice of raw WAV bytes to float32 frames"""
+    bits = wav_info['bits_per_sample']
+    
+    if wav_info['format_tag'] == WAVE_FORMAT_IEEE_FLOAT:
+        dtype = '<f4' if bits == 32 else '<f8'
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    elif bits == 8:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif bits == 16:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif bits == 24:
+        # Widen each 3-byte sample into the top of an int32
+        triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        widened = np.zeros((len(triplets), 4), dtype=np.uint8)
+        widened[:, 1:] = triplets
+        samples = widened.view('<i4').reshape(-1).astype(np.float32) / 2147483648.0
+    else:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    
+    return samples.reshape(-1, channels)
+
+def _decode_regions(file_path, duration, max_scan_seconds):
+    """
+    Decode only the head and tail of a compressed file with FFmpeg
+    
+    Returns:
+        Same tuple as _read_wav_regions, at DECODE_SAMPLE_RATE mono
+    """
+    scan = min(duration, max_scan_seconds)
+    head = _decode_pcm(['-t', str(scan), '-i', file_path])
+    
+    if duration > max_scan_seconds:
+        tail = _decode_pcm(['-sseof', f'-{scan}', '-i', file_path])
+    else:
+        # Short file - the head already covers all of it
+        tail = head
+    
+    total_frames = int(round(duration * DECODE_SAMPLE_RATE))
+    return head, tail, DECODE_SAMPLE_RATE, total_frames
+
+def _decode_pcm(input_args):
+    """Run FFmpeg and return mono float32 frames shaped (frames, 1)"""
+    # Imported here to avoid a circular import with the audio processor
+    from app.audio_processor import run_ffmpeg
+    
+    cmd = (['ffmpeg', '-v', 'error'] + input_args +
+           ['-ac', '1', '-ar', str(DECODE_SAMPLE_RATE), '-f', 'f32le', 'pipe:1'])
+    output = bytearray()
+    returncode, errors = run_ffmpeg(cmd, stdout_consumer=output.extend, step='silence')
+    if returncode != 0:
+        raise RuntimeError(errors[-500:])
+    return np.frombuffer(bytes(output), dtype='<f4').reshape(-1, 1)
+
+def _window_rms(frames, window):
+    """RMS of each complete window of frames, all channels combined"""
+    count = len(frames) // window
+    if count == 0:
+        return np.empty(0, dtype=np.float32)
+    windows = frames[:count * window].reshape(count, -1)
+    return np.sqrt(np.mean(np.square(windows, dtype=np.float64), axis=1))
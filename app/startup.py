@@ -0,0 +1,114 @@
+"""
+Startup Timing Module for Radio Automation System
+Measures how long each step of create_app takes so slow starts (gunicorn
+worker boots, CLI commands) can be spotted and tracked over time
+
+Only uses the standard library, so importing it costs nothing.
+"""
+
+import os
+import json
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """
+    Stopwatch for the phases of application startup
+    
+    Usage:
+        timer = StartupTimer()
+        ... load config ...
+        timer.mark('config')
+        ... register blueprints ...
+        timer.mark('blueprints')
+    """
+    
+    def __init__(self, started=None):
+        self.started = started or time.perf_counter()
+        self._last = self.started
+        self.phases = {}
+    
+    def mark(self, phase):
+        """Record the time since the previous mark under this phase name"""
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self._last) * 1000, 1)
+        self._last = now
+    
+    def to_dict(self):
+        """Phase durations and the total, in milliseconds"""
+        return {
+            'phases': dict(self.phases),
+            'total_ms': round((self._last - self.started) * 1000, 1)
+        }
+
+def record_startup(app, timer):
+    """
+    Keep the timing on the app, log it and append it to STARTUP_TIMING_FILE
+    
+    Args:
+        app: Flask application that just finished starting
+        timer: StartupTimer used during create_app
+    """
+    report = timer.to_dict()
+    app.extensions['startup_timing'] = report
+    
+    phases = ', '.join(f"{name} {ms:.0f}ms" for name, ms in report['phases'].items())
+    app.logger.info(f"Startup took {report['total_ms']:.0f}ms ({phases})")
+    
+    path = app.config.get('STARTUP_TIMING_FILE')
+    if not path:
+        return report
+    
+    entry = dict(report, at=datetime.utcnow().isoformat(), pid=os.getpid(),
+                 auto_init_db=bool(app.config.get('AUTO_INIT_DB')))
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+    except OSError as e:
+        logger.warning(f"Could not write startup timing to {path}: {str(e)}")
+    
+    return report
+
+def read_startup_history(path, limit=None):
+    """
+    Load past startup timings from STARTUP_TIMING_FILE
+    
+    Returns:
+        List of timing dictionaries, oldest first
+    """
+    history = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    history.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return []
+    return history[-limit:] if limit else history
+
+def summarize_startups(history):
+    """
+    Median and 90th percentile of total startup time
+    
+    Returns:
+        Dictionary with count, median_ms, p90_ms, fastest_ms and slowest_ms
+        (None values when there is no history)
+    """
+    totals = sorted(entry['total_ms'] for entry in history if 'total_ms' in entry)
+    if not totals:
+        return {'count': 0, 'median_ms': None, 'p90_ms': None,
+                'fastest_ms': None, 'slowest_ms': None}
+    
+    return {
+        'count': len(totals),
+        'median_ms': totals[len(totals) // 2],
+        'p90_ms': totals[min(len(totals) - 1, int(len(totals) * 0.9))],
+        'fastest_ms': totals[0],
+        'slowest_ms': totals[-1]
+    }
@@ -0,0 +1,206 @@
+"""
+Output Storage Module for Radio Automation System
+Decides where processed files live and how they're named
+
+Outputs are sharded into show/year/month folders so no single directory
+grows without bound, collisions are resolved with a sequence number kept
+in the database (the disk is only checked the first time a name is
+used), and files are written under a
+temporary name and renamed into place only once complete.
+"""
+
+import os
+import re
+import uuid
+import logging
+from datetime import datetime
+from sqlalchemy import select, insert, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import OutputSequence
+
+logger = logging.getLogger(__name__)
+
+# Suffix for files that are still being written
+PARTIAL_SUFFIX = '.partial'
+
+# Folder for files that couldn't be matched to a show
+UNSORTED_FOLDER = '_unsorted'
+
+# FFmpeg muxer for each output format - needed because partial files
+# don't end in the real extension
+MUXERS = {
+    'wav': 'wav',
+    'mp3': 'mp3',
+    'aiff': 'aiff',
+    'flac': 'flac',
+    'm4a': 'ipod'
+}
+
+def get_codec_args(output_format, bit_depth=16, bitrate=None):
+    """
+    FFmpeg codec arguments for an output format
+    
+    Args:
+        output_format: wav, mp3, aiff or flac
+        bit_depth: Bit depth for PCM formats
+        bitrate: Bitrate in kbps for compressed formats (default 320)
+    """
+    if output_format == 'wav':
+        # PCM codec for WAV
+        if bit_depth == 8:
+            return ['-acodec', 'pcm_u8']
+        elif bit_depth == 16:
+            return ['-acodec', 'pcm_s16le']
+        elif bit_depth == 24:
+            return ['-acodec', 'pcm_s24le']
+        elif bit_depth == 32:
+            return ['-acodec', 'pcm_s32le']
+    elif output_format == 'mp3':
+        return ['-acodec', 'libmp3lame', '-b:a', f'{bitrate or 320}k']
+    elif output_format == 'aiff':
+        return ['-acodec', 'pcm_s16be']
+    elif output_format == 'flac':
+        return ['-acodec', 'flac']
+    
+    return []
+
+def slugify(name):
+    """Turn a show name into a safe folder name"""
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', name or '').strip('_')
+    return slug or UNSORTED_FOLDER
+
+def get_upload_path(upload_folder, filename):
+    """
+    Where to save an upload so it can't overwrite another one
+    
+    Uploads wait in the queue, so a second file with the same name must not
+    replace the input of a job that hasn't run yet. The original name is
+    kept on the job, and that is what the show and date are read from.
+    """
+    return os.path.join(upload_folder, f"{uuid.uuid4().hex}_{filename}")
+
+def get_output_directory(root, show=None, air_date=None):
+    """
+    Work out the shard folder for an output
+    
+    Args:
+        root: Processed files folder (PROCESSED_FOLDER)
+        show: Show the file belongs to, if known
+        air_date: Date from the filename (falls back to today)
+    
+    Returns:
+        Folder path such as processed/Focus_On_The_Family/2024/01
+    """
+    show_folder = slugify(show.name) if show else UNSORTED_FOLDER
+    air_date = air_date or datetime.utcnow().date()
+    return os.path.join(root, show_folder, f"{air_date.year:04d}", f"{air_date.month:02d}")
+
+def claim_output_name(directory, base_name, suffixes=()):
+    """
+    Reserve a unique base name in a folder
+    
+    The first render of a name gets it unchanged, later ones get _1, _2 ...
+    The counter lives in the output_sequences table, so claiming a name
+    is one small database update however many files are in the folder.
+    
+    The folder is only looked at when the counter for a name is created:
+    files left over from before the counter existed (e.g. a restored
+    database) are skipped rather than overwritten. After that the counter
+    alone decides.
+    
+    Args:
+        directory: Folder the output will be written to
+        base_name: Wanted filename without extension
+        suffixes: Extra endings the caller may add to the name (e.g. a
+                  target label, as in name_web.mp3) - checked along with
+                  the name itself when the folder is looked at
+    
+    Returns:
+        Base name to use (without extension)
+    """
+    check_disk = False
+    while True:
+        value, created = _next_sequence_value(directory, base_name)
+        check_disk = check_disk or created
+        name = base_name if value == 0 else f"{base_name}_{value}"
+        
+        if check_disk and _name_in_use(directory, name, suffixes):
+            logger.warning(f"{name} already exists in {directory}, skipping to next sequence")
+            continue
+        
+        return name
+
+def _next_sequence_value(directory, base_name):
+    """
+    Take the next number from a name's counter
+    
+    Runs in a connection of its own, so claiming a name never commits (or
+    rolls back) anything the caller has pending in the session. The counter
+    is moved on with a compare-and-swap UPDATE (only if it still holds the
+    value just read), so two workers claiming the same name at once can
+    never both get the same number.
+    
+    Returns:
+        Tuple of (number claimed, whether the counter was created for it)
+    """
+    table = OutputSequence.__table__
+    match = (table.c.directory == directory) & (table.c.base_name == base_name)
+    
+    while True:
+        try:
+            with db.engine.begin() as connection:
+                value = connection.execute(select(table.c.next_value).where(match)).scalar()
+                if value is None:
+                    connection.execute(insert(table).values(
+                        directory=directory, base_name=base_name, next_value=1))
+                    return 0, True
+                
+                claimed = connection.execute(
+                    update(table)
+                    .where(match, table.c.next_value == value)
+                    .values(next_value=value + 1)
+                ).rowcount
+                if claimed == 1:
+                    return value, False
+            # Another worker took this number - read the counter again
+        except IntegrityError:
+            # Another worker created the counter first - use theirs
+            continue
+
+def _name_in_use(directory, name, suffixes=()):
+    """
+    Check for an existing output with this base name (any extension, with
+    or without one of the suffixes), finished or still being written -
+    only done for a name whose counter is new
+    """
+    for ending in [''] + [f"_{suffix}" for suffix in suffixes]:
+        for extension in MUXERS:
+            path = os.path.join(directory, f"{name}{ending}.{extension}")
+            if os.path.exists(path) or os.path.exists(get_partial_path(path)):
+                return True
+    return False
+
+def get_partial_path(final_path):
+    """Temporary path an output is written to before being renamed into place"""
+    return final_path + PARTIAL_SUFFIX
+
+def commit_output(partial_path, final_path):
+    """
+    Move a finished output into place
+    
+    os.replace is atomic on the same filesystem, so anything watching the
+    folder sees either no file or the whole file.
+    """
+    with open(partial_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(partial_path, final_path)
+
+def discard_output(partial_path):
+    """Remove a partial output after a failed render"""
+    try:
+        os.remove(partial_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove partial file {partial_path}: {str(e)}")
@@ -0,0 +1,181 @@
+"""
+Processing Template Engine for Radio Automation System
+Compiles ProcessingTemplate records into ready-to-use filter chains and
+codec arguments, cached by template version
+"""
+
+import threading
+import logging
+from app.utils import validate_processing_options
+from app.storage import get_codec_args
+
+logger = logging.getLogger(__name__)
+
+# Longest fade we accept (milliseconds)
+MAX_FADE_MS = 60000
+
+# High-pass corner used to strip DC offset - well below anything audible
+DC_FILTER_HZ = 5
+
+class TemplateError(ValueError):
+    """Raised when a template's settings can't be turned into a valid render"""
+
+class CompiledTemplate:
+    """
+    A validated, render-ready form of a ProcessingTemplate
+    
+    Everything that doesn't depend on the input file is worked out once
+    at compile time. The only per-file input is the rendered duration,
+    which the fade-out needs to know where to start.
+    """
+    
+    def __init__(self, template_id, version, name, target, normalize,
+                 normalize_level, pre_filters, fade_in_ms, fade_out_ms, codec_args):
+        self.template_id = template_id
+        self.version = version
+        self.name = name
+        self.target = target
+        self.normalize = normalize
+        self.normalize_level = normalize_level
+        self.pre_filters = pre_filters
+        self.fade_in_ms = fade_in_ms
+        self.fade_out_ms = fade_out_ms
+        self.codec_args = codec_args
+    
+    def __repr__(self):
+        return f'<CompiledTemplate {self.name} v{self.version}>'
+    
+    def filter_chain(self, duration=None, normalize_filter=None):
+        """
+        Build the shared filter chain for one file
+        
+        DC removal, normalization and fades all run inside the same FFmpeg
+        filter graph, so none of them costs an extra pass over the audio.
+        
+        Args:
+            duration: Rendered duration in seconds (needed for fade-out)
+            normalize_filter: Normalization filter built by the processor,
+                              or None to skip normalization
+        
+        Returns:
+            List of FFmpeg filter strings
+        """
+        filters = list(self.pre_filters)
+        
+        if normalize_filter:
+            filters.append(normalize_filter)
+        
+        if self.fade_in_ms:
+            filters.append(f'afade=t=in:st=0:d={self.fade_in_ms / 1000.0:.3f}')
+        
+        if self.fade_out_ms and duration:
+            fade = min(self.fade_out_ms / 1000.0, duration)
+            filters.append(f'afade=t=out:st={max(0.0, duration - fade):.3f}:d={fade:.3f}')
+        
+        return filters
+    
+    def to_target(self):
+        """Return the template's output settings as a render target"""
+        target = dict(self.target)
+        target['codec_args'] = list(self.codec_args)
+        return target
+
+def compile_template(template):
+    """
+    Validate a ProcessingTemplate and compile it
+    
+    Args:
+        template: ProcessingTemplate model instance
+    
+    Returns:
+        CompiledTemplate
+    
+    Raises:
+        TemplateError: If any setting is invalid
+    """
+    is_valid, errors = validate_processing_options({
+        'format': template.output_format,
+        'sample_rate': template.sample_rate,
+        'bit_depth': template.bit_depth,
+        'channels': template.channels,
+        'normalize_level': template.normalize_level if template.normalize_level is not None else -1.0
+    })
+    
+    fade_in_ms = template.fade_in_ms or 0
+    fade_out_ms = template.fade_out_ms or 0
+    for label, value in (('Fade in', fade_in_ms), ('Fade out', fade_out_ms)):
+        if value < 0 or value > MAX_FADE_MS:
+            errors.append(f"{label} must be between 0 and {MAX_FADE_MS} ms")
+    
+    codec_args = get_codec_args(template.output_format, template.bit_depth)
+    if not codec_args and not errors:
+        errors.append(f"No encoder available for format: {template.output_format}")
+    
+    if errors:
+        raise TemplateError(f"Template '{template.name}' is invalid: " + '; '.join(errors))
+    
+    pre_filters = []
+    if template.remove_dc_offset:
+        pre_filters.append(f'highpass=f={DC_FILTER_HZ}:poles=1')
+    
+    return CompiledTemplate(
+        template_id=template.id,
+        version=template.version,
+        name=template.name,
+        target={
+            'label': template.name,
+            'format': template.output_format,
+            'sample_rate': template.sample_rate,
+            'bit_depth': template.bit_depth,
+            'channels': template.channels,
+            'bitrate': None
+        },
+        normalize=bool(template.normalize),
+        normalize_level=template.normalize_level,
+        pre_filters=pre_filters,
+        fade_in_ms=fade_in_ms,
+        fade_out_ms=fade_out_ms,
+        codec_args=codec_args
+    )
+
+# Compiled templates keyed by (template id, version)
+_cache = {}
+_cache_lock = threading.Lock()
+
+def get_compiled_template(template):
+    """
+    Return the compiled form of a template, compiling it only when the
+    template has changed since it was last used
+    
+    Args:
+        template: ProcessingTemplate model instance
+    
+    Returns:
+        CompiledTemplate
+    """
+    key = (template.id, template.version)
+    
+    with _cache_lock:
+        compiled = _cache.get(key)
+    if compiled is not None:
+        return compiled
+    
+    compiled = compile_template(template)
+    logger.debug(f"Compiled processing template {template.name} v{template.version}")
+    
+    with _cache_lock:
+        # Drop older versions of the same template
+        for old_key in [k for k in _cache if k[0] == template.id]:
+            del _cache[old_key]
+        _cache[key] = compiled
+    
+    return compiled
+
+def clear_template_cache(template_id=None):
+    """Forget compiled templates (all of them, or just one template's)"""
+    with _cache_lock:
+        if template_id is None:
+            _cache.clear()
+        else:
+            for key in [k for k in _cache if k[0] == template_id]:
+                del _cache[key]
@@ -6,13 +6,9 @@ Helper functions used throughout the application
 import os
 import subprocess
 import json
+import struct
 from werkzeug.utils import secure_filename
 from flask import current_app
-import mutagen
-from mutagen.wave import WAVE
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC
-from mutagen.mp4 import MP4
 import logging
 
 logger = logging.getLogger(__name__)
@@ -66,6 +62,11 @@ def get_file_info(file_path):
         'error': None
     }
     
+    # mutagen loads a module per format, so it's imported on first use
+    # rather than every time the application starts
+    import mutagen
+    from mutagen.wave import WAVE
+    
     try:
         # Get file size
         result['size'] = os.path.getsize(file_path)
@@ -182,6 +183,75 @@ def get_file_info_ffmpeg(file_path):
     
     return result
 
+def read_wav_header(file_path):
+    """
+    Read the layout of a RIFF/WAVE file without touching the audio data
+    
+    Walks the chunk list until the 'fmt ' and 'data' chunks are found,
+    so the sample data can be memory-mapped or seeked into directly.
+    
+    Args:
+        file_path: Path to the WAV file
+    
+    Returns:
+        Dictionary with format_tag, channels, sample_rate, bits_per_sample,
+        block_align, data_offset and data_size, or None if the file is not
+        a WAV file we can read directly
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+        
+        with open(file_path, 'rb') as f:
+            riff = f.read(12)
+            if len(riff) < 12 or riff[0:4] != b'RIFF' or riff[8:12] != b'WAVE':
+                return None
+            
+            info = {}
+            while True:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    break
+                
+                chunk_id = chunk_header[0:4]
+                chunk_size = struct.unpack('<I', chunk_header[4:8])[0]
+                
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    if len(fmt) < 16:
+                        return None
+                    (info['format_tag'], info['channels'], info['sample_rate'],
+                     _, info['block_align'], info['bits_per_sample']) = \
+                        struct.unpack('<HHIIHH', fmt[0:16])
+                    
+                    # WAVE_FORMAT_EXTENSIBLE keeps the real format in the sub-format GUID
+                    if info['format_tag'] == 0xFFFE and len(fmt) >= 26:
+                        info['format_tag'] = struct.unpack('<H', fmt[24:26])[0]
+                    
+                    if chunk_size % 2:
+                        f.seek(1, os.SEEK_CUR)
+                
+                elif chunk_id == b'data':
+                    info['data_offset'] = f.tell()
+                    # Some recorders leave the size at 0 or 0xFFFFFFFF while writing
+                    available = file_size - info['data_offset']
+                    if chunk_size == 0 or chunk_size > available:
+                        chunk_size = available
+                    info['data_size'] = chunk_size
+                    break
+                
+                else:
+                    # Skip chunks we don't care about (LIST, bext, cart...)
+                    f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+            
+            if 'format_tag' not in info or 'data_offset' not in info:
+                return None
+            
+            return info
+    
+    except (OSError, struct.error) as e:
+        logger.error(f"Error reading WAV header of {file_path}: {str(e)}")
+        return None
+
 def format_duration(seconds):
     """
     Format duration from seconds to human-readable string
@@ -248,6 +318,9 @@ def clean_old_files(directory, days=7):
     """
     Remove files older than specified number of days
     
+    For scratch folders such as uploads. Processed outputs are handled by
+    the retention engine (app.retention), which also updates the database.
+    
     Args:
         directory: Directory to clean
         days: Number of days to keep files
@@ -260,19 +333,18 @@ def clean_old_files(directory, days=7):
     removed_count = 0
     
     try:
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            
-            # Skip if not a file
-            if not os.path.isfile(file_path):
-                continue
-            
-            # Check file age
-            file_modified = os.path.getmtime(file_path)
-            if file_modified < cutoff:
-                os.remove(file_path)
-                removed_count += 1
-                logger.info(f"Removed old file: {filename}")
+        # scandir gives the file type without an extra stat per entry
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # Skip if not a file
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                
+                # Check file age
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed_count += 1
+                    logger.info(f"Removed old file: {entry.name}")
         
         if removed_count > 0:
             logger.info(f"Cleaned {removed_count} old files from {directory}")
@@ -350,7 +422,11 @@ def validate_processing_options(options):
 
 def generate_unique_filename(base_name, extension, directory):
     """
-    Generate a unique filename if file already exists
+    Generate a unique filename for a new file in a directory
+    
+    Uses the stored sequence for the name (see app.storage), so this is
+    normally one database update. The directory is only checked the first
+    time a name is used in it.
     
     Args:
         base_name: Base filename without extension
@@ -360,24 +436,7 @@ def generate_unique_filename(base_name, extension, directory):
     Returns:
         Unique filename
     """
-    filename = f"{base_name}.{extension}"
-    file_path = os.path.join(directory, filename)
-    
-    # If file doesn't exist, return original
-    if not os.path.exists(file_path):
-        return filename
-    
-    # Add number suffix until we find a unique name
-    counter = 1
-    while True:
-        filename = f"{base_name}_{counter}.{extension}"
-        file_path = os.path.join(directory, filename)
-        
-        if not os.path.exists(file_path):
-            return filename
-        
-        counter += 1
-        
-        # Safety check to prevent infinite loop
-        if counter > 1000:
-            raise ValueError("Could not generate unique filename")
\ No newline at end of file
+    # Imported here because the storage module needs the database models
+    from app.storage import claim_output_name
+    
+    return f"{claim_output_name(directory, base_name)}.{extension}"
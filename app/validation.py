@@ -0,0 +1,323 @@
+"""
+Upload Validation Module for Radio Automation System
+Checks uploaded audio in two tiers:
+  1. A header sniff that reads only the first few KB of the file and
+     rejects anything that isn't audio at upload time
+  2. A full decode integrity check, run in the background for every file
+     or only for files whose header looks suspicious
+"""
+
+import os
+import queue
+import struct
+import threading
+import logging
+from datetime import datetime
+from app.utils import read_wav_header
+
+logger = logging.getLogger(__name__)
+
+# How much of the file the header sniff reads
+SNIFF_BYTES = 64 * 1024
+
+# Sanity limits for values read from headers
+MAX_CHANNELS = 8
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 384000
+
+# MPEG audio frame header tables (index -> value)
+MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+MPEG_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+MPEG1_LAYER3_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MPEG2_LAYER3_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+# MP4 brands used for audio files
+M4A_BRANDS = {b'M4A ', b'M4B ', b'mp42', b'mp41', b'isom', b'iso2', b'dash'}
+
+# Deep checks waiting for a checker thread, and the threads themselves
+_checks = queue.Queue()
+_checkers = []
+_checkers_lock = threading.Lock()
+
+def sniff_audio_header(file_path):
+    """
+    Identify an audio file from its magic bytes and container header
+    
+    Only the first SNIFF_BYTES of the file are read, so this is cheap
+    enough to run on every upload before anything else happens.
+    
+    Args:
+        file_path: Path to the uploaded file
+    
+    Returns:
+        Dictionary with:
+            - valid: False if the file is definitely not usable audio
+            - format: Detected format (wav, mp3, aiff, flac, m4a) or None
+            - suspicious: True if the header has problems worth a full decode
+            - reasons: List of things that looked wrong
+            - error: Why the file was rejected (when valid is False)
+    """
+    result = {
+        'valid': False,
+        'format': None,
+        'suspicious': False,
+        'reasons': [],
+        'error': None
+    }
+    
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+    except OSError as e:
+        result['error'] = f"Could not read file: {str(e)}"
+        return result
+    
+    if file_size == 0:
+        result['error'] = "File is empty"
+        return result
+    
+    if head[0:4] == b'RIFF' and head[8:12] == b'WAVE':
+        result['format'] = 'wav'
+        _check_wav(file_path, head, file_size, result)
+    elif head[0:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        result['format'] = 'aiff'
+        _check_aiff(head, file_size, result)
+    elif head[0:4] == b'fLaC':
+        result['format'] = 'flac'
+        _check_flac(head, result)
+    elif head[4:8] == b'ftyp':
+        result['format'] = 'm4a'
+        if head[8:12] not in M4A_BRANDS:
+            result['reasons'].append(f"Unusual MP4 brand {head[8:12]!r}")
+    elif head[0:3] == b'ID3' or _find_mpeg_frame(head, 0) is not None:
+        # Without a tag the first frame may still come after some junk,
+        # which _check_mp3 flags as suspicious
+        result['format'] = 'mp3'
+        _check_mp3(head, result)
+    else:
+        result['error'] = "Not a recognised audio file"
+        return result
+    
+    # An error found while checking the container means the file is unusable
+    if result['error']:
+        return result
+    
+    # A misleading extension isn't fatal (FFmpeg goes by content) but is odd
+    extension = os.path.splitext(file_path)[1].lower().lstrip('.')
+    if extension and extension != result['format'] and \
+            not (extension in ('aif', 'aifc') and result['format'] == 'aiff'):
+        result['reasons'].append(f"Extension .{extension} but content is {result['format']}")
+    
+    result['valid'] = True
+    result['suspicious'] = bool(result['reasons'])
+    return result
+
+def _check_wav(file_path, head, file_size, result):
+    """Check the RIFF size and format chunk of a WAV file"""
+    riff_size = struct.unpack('<I', head[4:8])[0]
+    if riff_size + 8 > file_size:
+        result['reasons'].append("File is shorter than its RIFF header says (truncated upload?)")
+    
+    info = read_wav_header(file_path)
+    if info is None:
+        result['error'] = "WAV file has no readable format or data chunk"
+        return
+    
+    if not 1 <= info['channels'] <= MAX_CHANNELS:
+        result['error'] = f"WAV header has an invalid channel count ({info['channels']})"
+    elif not MIN_SAMPLE_RATE <= info['sample_rate'] <= MAX_SAMPLE_RATE:
+        result['error'] = f"WAV header has an invalid sample rate ({info['sample_rate']})"
+    elif info['block_align'] == 0:
+        result['error'] = "WAV header has a zero block size"
+    elif info['data_size'] == 0:
+        result['error'] = "WAV file contains no audio data"
+    elif info['data_size'] % info['block_align']:
+        result['reasons'].append("Audio data ends part way through a sample frame")
+
+def _check_aiff(head, file_size, result):
+    """Check the FORM size and COMM chunk of an AIFF file"""
+    form_size = struct.unpack('>I', head[4:8])[0]
+    if form_size + 8 > file_size:
+        result['reasons'].append("File is shorter than its FORM header says (truncated upload?)")
+    
+    position = 12
+    while position + 8 <= len(head):
+        chunk_id = head[position:position + 4]
+        chunk_size = struct.unpack('>I', head[position + 4:position + 8])[0]
+        if chunk_id == b'COMM':
+            if position + 16 > len(head):
+                break
+            channels = struct.unpack('>h', head[position + 8:position + 10])[0]
+            if not 1 <= channels <= MAX_CHANNELS:
+                result['error'] = f"AIFF header has an invalid channel count ({channels})"
+            return
+        position += 8 + chunk_size + (chunk_size % 2)
+    
+    result['reasons'].append("COMM chunk not found near the start of the file")
+
+def _check_flac(head, result):
+    """Check the STREAMINFO block that must follow the FLAC marker"""
+    if len(head) < 8 + 34 or head[4] & 0x7F != 0:
+        result['error'] = "FLAC file is missing its STREAMINFO block"
+        return
+    
+    streaminfo = head[8:8 + 34]
+    sample_rate = (streaminfo[10] << 12) | (streaminfo[11] << 4) | (streaminfo[12] >> 4)
+    channels = ((streaminfo[12] >> 1) & 0x07) + 1
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        result['error'] = f"FLAC header has an invalid sample rate ({sample_rate})"
+    elif channels > MAX_CHANNELS:
+        result['error'] = f"FLAC header has an invalid channel count ({channels})"
+
+def _check_mp3(head, result):
+    """Find the first MPEG frame (after any ID3 tag) and check the next one follows it"""
+    position = 0
+    if head[0:3] == b'ID3':
+        # ID3v2 size is a 28-bit "syncsafe" integer
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        position = 10 + size + (10 if head[5] & 0x10 else 0)
+        if position >= len(head):
+            # Large cover art - the audio starts beyond what we sniffed
+            result['reasons'].append("ID3 tag is larger than the sniffed header")
+            return
+    
+    frame = _find_mpeg_frame(head, position)
+    if frame is None:
+        result['error'] = "No MPEG audio frames found"
+        return
+    if frame != position:
+        result['reasons'].append("Junk data before the first MPEG frame")
+    
+    length = _mpeg_frame_length(head, frame)
+    following = frame + length
+    if following + 4 <= len(head) and _mpeg_frame_length(head, following) is None:
+        result['reasons'].append("Second MPEG frame is not where the first one says")
+
+def _find_mpeg_frame(data, start):
+    """Offset of the first valid MPEG audio frame header at or after start"""
+    position = data.find(b'\xff', start)
+    while position != -1 and position + 4 <= len(data):
+        if _mpeg_frame_length(data, position):
+            return position
+        position = data.find(b'\xff', position + 1)
+    return None
+
+def _mpeg_frame_length(data, position):
+    """Length in bytes of the MPEG frame at position, or None if it isn't one"""
+    if position + 4 > len(data):
+        return None
+    b1, b2 = data[position + 1], data[position + 2]
+    if data[position] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    
+    version = MPEG_VERSIONS.get((b1 >> 3) & 0x03)
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version is None or layer != 3 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    
+    padding = (b2 >> 1) & 0x01
+    sample_rate = MPEG_SAMPLE_RATES[version][rate_index]
+    if version == 1:
+        bitrate = MPEG1_LAYER3_BITRATES[bitrate_index]
+        return 144000 * bitrate // sample_rate + padding
+    bitrate = MPEG2_LAYER3_BITRATES[bitrate_index]
+    return 72000 * bitrate // sample_rate + padding
+
+def deep_check_audio(file_path, max_errors=20):
+    """
+    Decode the whole file and report any errors FFmpeg finds
+    
+    Args:
+        file_path: Path to the audio file
+        max_errors: Number of error lines to keep
+    
+    Returns:
+        Tuple of (passed, message)
+    """
+    # Imported here to avoid a circular import with the audio processor
+    from app.audio_processor import run_ffmpeg
+    
+    cmd = ['ffmpeg', '-v', 'error', '-nostats', '-i', file_path,
+           '-map', '0:a:0', '-f', 'null', '-']
+    returncode, errors = run_ffmpeg(cmd, stderr_lines=max_errors, step='integrity')
+    
+    errors = errors.strip()
+    if returncode != 0:
+        return False, errors or "FFmpeg could not decode the file"
+    if errors:
+        # FFmpeg carried on but hit damaged frames on the way
+        return False, errors
+    return True, None
+
+def should_deep_check(sniff, mode):
+    """
+    Decide whether a file gets the full decode check
+    
+    Args:
+        sniff: Result of sniff_audio_header
+        mode: 'always', 'suspicious' or 'never' (VALIDATION_DEEP_CHECK)
+    """
+    if mode == 'always':
+        return True
+    if mode == 'suspicious':
+        return sniff['suspicious']
+    return False
+
+def start_integrity_check(app, job_id):
+    """
+    Queue the deep check for a job
+    
+    INTEGRITY_CHECK_WORKERS background threads work through the queue, so
+    a large upload doesn't start a full decode for every file at once on
+    top of the renders. The outcome is recorded on the ProcessingJob
+    (integrity_status, integrity_detail, integrity_checked_at).
+    
+    Args:
+        app: Flask application (the threads need their own app context)
+        job_id: ProcessingJob to check
+    """
+    with _checkers_lock:
+        while len(_checkers) < max(1, app.config.get('INTEGRITY_CHECK_WORKERS', 1)):
+            thread = threading.Thread(target=_integrity_worker,
+                                      name=f'integrity-check-{len(_checkers)}', daemon=True)
+            thread.start()
+            _checkers.append(thread)
+    _checks.put((app, job_id))
+
+def _integrity_worker():
+    """Checker thread: run queued deep checks one after another"""
+    while True:
+        app, job_id = _checks.get()
+        try:
+            _run_integrity_check(app, job_id)
+        except Exception as e:
+            logger.error(f"Integrity check for job {job_id} failed to run: {str(e)}")
+
+def _run_integrity_check(app, job_id):
+    """Deep check one job and record the outcome"""
+    from app import db
+    from app.models import ProcessingJob
+    
+    with app.app_context():
+        job = ProcessingJob.query.get(job_id)
+        if job is None:
+            return
+        
+        try:
+            passed, message = deep_check_audio(job.input_path)
+        except Exception as e:
+            passed, message = False, f"Integrity check error: {str(e)}"
+        
+        job.integrity_status = 'passed' if passed else 'failed'
+        job.integrity_detail = message
+        job.integrity_checked_at = datetime.utcnow()
+        db.session.commit()
+        
+        if passed:
+            logger.info(f"Integrity check passed for {job.filename}")
+        else:
+            logger.warning(f"Integrity check failed for {job.filename}: {message}")
+        db.session.remove()
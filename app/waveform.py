@@ -0,0 +1,259 @@
+"""
+Waveform Peaks Module for Radio Automation System
+Builds compact multi-resolution peak files while audio is being processed
+and reads slices of them back for the web interface
+"""
+
+import os
+import struct
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Peak file layout (all values little-endian):
+#   header:      magic, version, level count, sample rate, zoom factor, total samples
+#   level table: samples per bucket, bucket count (one entry per level)
+#   data:        int16 (min, max) pairs for level 0, then level 1, ...
+PEAKS_MAGIC = b'RAPK'
+PEAKS_VERSION = 1
+HEADER_FORMAT = '<4sHHIIQ'
+LEVEL_FORMAT = '<IQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+LEVEL_SIZE = struct.calcsize(LEVEL_FORMAT)
+PEAK_PAIR_SIZE = 4  # two int16 values per bucket
+
+# Defaults used when the application config does not override them
+DEFAULT_SAMPLE_RATE = 8000      # Hz - plenty for drawing a waveform
+DEFAULT_BUCKET_SIZE = 80        # samples per bucket at the finest level (100 per second)
+DEFAULT_ZOOM_FACTOR = 4         # each level is 4x coarser than the previous one
+DEFAULT_LEVELS = 6              # finest level 10ms per bucket, coarsest ~10s per bucket
+
+class PeakBuilder:
+    """
+    Accumulates min/max peaks from a stream of mono float32 PCM
+    
+    Audio arrives in arbitrary sized chunks straight from FFmpeg's stdout,
+    so samples that don't fill a whole bucket are carried over to the
+    next chunk. Only the finest level is kept while streaming; the coarser
+    levels are derived from it when the stream is finished.
+    """
+    
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, bucket_size=DEFAULT_BUCKET_SIZE,
+                 zoom_factor=DEFAULT_ZOOM_FACTOR, levels=DEFAULT_LEVELS):
+        self.sample_rate = sample_rate
+        self.bucket_size = bucket_size
+        self.zoom_factor = zoom_factor
+        self.level_count = levels
+        self.total_samples = 0
+        
+        self._byte_carry = b''
+        self._sample_carry = np.empty(0, dtype=np.float32)
+        self._chunks = []
+    
+    def feed(self, data):
+        """Add a chunk of raw f32le PCM bytes"""
+        if self._byte_carry:
+            data = self._byte_carry + data
+        
+        # Keep any trailing partial sample for the next chunk
+        usable = len(data) - (len(data) % 4)
+        self._byte_carry = data[usable:]
+        if usable == 0:
+            return
+        
+        samples = np.frombuffer(data[:usable], dtype='<f4')
+        self.total_samples += len(samples)
+        
+        if len(self._sample_carry):
+            samples = np.concatenate((self._sample_carry, samples))
+        
+        full = len(samples) - (len(samples) % self.bucket_size)
+        self._sample_carry = samples[full:].copy()
+        
+        if full:
+            buckets = samples[:full].reshape(-1, self.bucket_size)
+            self._chunks.append(np.stack((buckets.min(axis=1), buckets.max(axis=1)), axis=1))
+    
+    def finish(self):
+        """
+        Flush the last partial bucket and build every zoom level
+        
+        Returns:
+            List of int16 arrays shaped (buckets, 2), finest level first
+        """
+        if len(self._sample_carry):
+            tail = self._sample_carry
+            self._chunks.append(np.array([[tail.min(), tail.max()]], dtype=np.float32))
+            self._sample_carry = np.empty(0, dtype=np.float32)
+        
+        if self._chunks:
+            level = np.concatenate(self._chunks)
+        else:
+            level = np.empty((0, 2), dtype=np.float32)
+        self._chunks = []
+        
+        levels = [level]
+        for _ in range(1, self.level_count):
+            levels.append(_reduce_level(levels[-1], self.zoom_factor))
+        
+        return [_to_int16(level) for level in levels]
+
+def _reduce_level(level, factor):
+    """Combine every `factor` buckets into one (min of mins, max of maxes)"""
+    if len(level) == 0:
+        return level
+    
+    full = len(level) - (len(level) % factor)
+    parts = []
+    if full:
+        grouped = level[:full].reshape(-1, factor, 2)
+        parts.append(np.stack((grouped[:, :, 0].min(axis=1),
+                               grouped[:, :, 1].max(axis=1)), axis=1))
+    if full < len(level):
+        tail = level[full:]
+        parts.append(np.array([[tail[:, 0].min(), tail[:, 1].max()]], dtype=level.dtype))
+    
+    return np.concatenate(parts)
+
+def _to_int16(level):
+    """Scale float peaks (-1.0 .. 1.0) to int16"""
+    return np.clip(np.round(level * 32767.0), -32768, 32767).astype('<i2')
+
+def write_peaks_file(path, builder):
+    """
+    Finish a PeakBuilder and write its levels to a peaks file
+    
+    Args:
+        path: Where to write the peaks file
+        builder: PeakBuilder that has been fed the whole stream
+    
+    Returns:
+        Path of the written file
+    """
+    levels = builder.finish()
+    
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, PEAKS_MAGIC, PEAKS_VERSION, len(levels),
+                            builder.sample_rate, builder.zoom_factor, builder.total_samples))
+        
+        bucket_size = builder.bucket_size
+        for level in levels:
+            f.write(struct.pack(LEVEL_FORMAT, bucket_size, len(level)))
+            bucket_size *= builder.zoom_factor
+        
+        for level in levels:
+            f.write(level.tobytes())
+    
+    os.replace(tmp_path, path)
+    return path
+
+def read_peaks_header(path):
+    """
+    Read the header and level table of a peaks file
+    
+    Returns:
+        Dictionary with sample_rate, total_samples, duration and a list of
+        levels (samples_per_bucket, bucket_count, data offset)
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError("Peaks file is truncated")
+        
+        magic, version, level_count, sample_rate, zoom_factor, total_samples = \
+            struct.unpack(HEADER_FORMAT, header)
+        if magic != PEAKS_MAGIC:
+            raise ValueError("Not a peaks file")
+        if version != PEAKS_VERSION:
+            raise ValueError(f"Unsupported peaks file version: {version}")
+        
+        levels = []
+        offset = HEADER_SIZE + level_count * LEVEL_SIZE
+        for _ in range(level_count):
+            samples_per_bucket, bucket_count = struct.unpack(LEVEL_FORMAT, f.read(LEVEL_SIZE))
+            levels.append({
+                'samples_per_bucket': samples_per_bucket,
+                'bucket_count': bucket_count,
+                'offset': offset
+            })
+            offset += bucket_count * PEAK_PAIR_SIZE
+    
+    return {
+        'sample_rate': sample_rate,
+        'zoom_factor': zoom_factor,
+        'total_samples': total_samples,
+        'duration': total_samples / sample_rate if sample_rate else 0,
+        'levels': levels
+    }
+
+def read_peaks_range(path, start=0.0, end=None, max_buckets=1000):
+    """
+    Read the peaks for a time range at the most detailed level that fits
+    
+    Only the requested slice of the chosen level is read from disk, so a
+    two hour show costs the same as a two minute one.
+    
+    Args:
+        path: Peaks file path
+        start: Start of the range in seconds
+        end: End of the range in seconds (None = end of file)
+        max_buckets: Maximum number of (min, max) pairs to return
+    
+    Returns:
+        Dictionary with the range, bucket duration and a flat list of
+        min/max values (int16 scale)
+    """
+    header = read_peaks_header(path)
+    sample_rate = header['sample_rate']
+    
+    duration = header['duration']
+    start = max(0.0, min(float(start), duration))
+    end = duration if end is None else max(start, min(float(end), duration))
+    max_buckets = max(1, int(max_buckets))
+    
+    # Pick the finest level that still fits inside max_buckets
+    chosen = header['levels'][-1] if header['levels'] else None
+    for level in header['levels']:
+        span = (end - start) * sample_rate / level['samples_per_bucket']
+        if span <= max_buckets:
+            chosen = level
+            break
+    
+    if chosen is None or chosen['bucket_count'] == 0:
+        return {
+            'start': start,
+            'end': end,
+            'duration': duration,
+            'seconds_per_bucket': None,
+            'peaks': []
+        }
+    
+    samples_per_bucket = chosen['samples_per_bucket']
+    first = int(start * sample_rate // samples_per_bucket)
+    last = int(-(-end * sample_rate // samples_per_bucket))  # ceiling
+    first = min(first, chosen['bucket_count'])
+    last = min(max(last, first), chosen['bucket_count'])
+    
+    with open(path, 'rb') as f:
+        f.seek(chosen['offset'] + first * PEAK_PAIR_SIZE)
+        data = np.fromfile(f, dtype='<i2', count=(last - first) * 2).reshape(-1, 2)
+    
+    # Rounding out to whole buckets, or a range too long for even the
+    # coarsest level, can give more than max_buckets - combine them
+    factor = -(-len(data) // max_buckets)  # ceiling
+    if factor > 1:
+        data = _reduce_level(data, factor)
+    
+    return {
+        'start': first * samples_per_bucket / sample_rate,
+        'end': min(last * samples_per_bucket / sample_rate, duration),
+        'duration': duration,
+        'seconds_per_bucket': samples_per_bucket * max(factor, 1) / sample_rate,
+        'peaks': data.ravel().tolist()
+    }
+
+def get_peaks_path(output_path):
+    """Peaks files live next to the audio they describe"""
+    return f"{output_path}.peaks"
@@ -18,17 +18,156 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # File upload configuration
-    UPLOAD_FOLDER = 'uploads'
-    PROCESSED_FOLDER = 'processed'
+    # When workers run on several machines, point these at shared storage
+    # mounted at the same path on every machine
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
+    PROCESSED_FOLDER = os.environ.get('PROCESSED_FOLDER') or 'processed'
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500 MB max file size
     ALLOWED_EXTENSIONS = {'wav', 'mp3', 'aiff', 'flac', 'm4a'}
     
+    # Bulk APIs (/api/parse-filenames, /api/jobs/bulk)
+    BULK_MAX_ITEMS = 10000  # Most filenames or files accepted in one request
+    # Folders whose files may be submitted by server-side path, separated
+    # by os.pathsep (":" on Linux). Empty means paths aren't accepted.
+    BULK_IMPORT_ROOTS = [path for path in os.environ.get('BULK_IMPORT_ROOTS', '').split(os.pathsep) if path]
+    
+    # Admission control - uploads and bulk submissions are refused with 429
+    # (busy) or 503 (disk low) plus a Retry-After header when the server is
+    # overloaded, and the CLI ingest pauses instead
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    ADMISSION_MAX_QUEUED = 200  # Most jobs waiting before normal uploads are refused
+    ADMISSION_MAX_BACKLOG_SECONDS = 3600  # Most estimated work queued for the workers
+    ADMISSION_MAX_URGENT_QUEUED = 50  # Urgent files skip the limits above, up to this many
+    ADMISSION_MIN_FREE_MB = 2048  # Free space kept in the upload and processed folders
+    ADMISSION_URGENT_RESERVE_MB = 512  # Urgent files may dig into the space above, down to this
+    ADMISSION_DISK_RETRY_SECONDS = 300  # Retry-After sent when the disk is low
+    
+    # Scratch space for intermediate audio
+    # Point SCRATCH_FOLDER at a fast local folder (tmpfs, NVMe) to stage each
+    # job's input and outputs there instead of on the main storage. Jobs
+    # that don't fit in the budget work on disk as before.
+    SCRATCH_FOLDER = os.environ.get('SCRATCH_FOLDER') or None
+    SCRATCH_BUDGET_MB = int(os.environ.get('SCRATCH_BUDGET_MB', 2048))
+    SCRATCH_MIN_FREE_MB = 256  # Always leave this much free in the scratch filesystem
+    SCRATCH_STAGE_INPUTS = True  # Copy inputs to scratch too, not just outputs
+    
+    # FFmpeg resource limits, so processing can share a host with on-air
+    # systems. FFMPEG_CPU_SETS gives each worker its own CPUs, e.g.
+    # "2-3;4-5" puts worker 0 on CPUs 2-3 and worker 1 on 4-5.
+    FFMPEG_NICE = 10  # CPU priority added to FFmpeg (0 = unchanged, 19 = lowest)
+    FFMPEG_IONICE_CLASS = 'best-effort'  # 'idle', 'best-effort', 'realtime' or None
+    FFMPEG_IONICE_LEVEL = 7  # Priority within best-effort (0 = highest, 7 = lowest)
+    FFMPEG_CPU_SETS = os.environ.get('FFMPEG_CPU_SETS', '')
+    FFMPEG_THREADS = 2  # Decoder/filter threads per FFmpeg run (0 = FFmpeg decides)
+    FFMPEG_TIMEOUT_SECONDS = 3600  # Kill a run after this long (0 = no limit)
+    FFMPEG_MEMORY_LIMIT_MB = 2048  # Kill a run using more memory than this (0 = no limit)
+    
+    # Segment-parallel rendering for very long recordings
+    # The recording is cut into segments at exact sample positions, each is
+    # rendered on its own CPU and the pieces are joined into the outputs.
+    # Used for WAV/AIFF outputs at the source's sample rate with no filters
+    # besides normalization; needs free space for a second copy of them.
+    SEGMENT_PARALLEL_ENABLED = True
+    SEGMENT_PARALLEL_MIN_SECONDS = 1800  # Shorter recordings render in one run
+    SEGMENT_PARALLEL_WORKERS = 0  # Segments rendered at once (0 = the worker's share of the CPUs)
+    
+    # Upload validation
+    # Every upload gets a quick header check. The full decode check runs in
+    # the background for 'always', only for odd-looking headers for
+    # 'suspicious', or not at all for 'never'.
+    VALIDATION_DEEP_CHECK = 'suspicious'
+    INTEGRITY_CHECK_WORKERS = 1  # Deep checks decoded at once (the rest wait their turn)
+    
+    # Downloads
+    # Set DOWNLOAD_OFFLOAD to 'x-sendfile' (Apache/lighttpd) or
+    # 'x-accel-redirect' (nginx) to let the web server send the file.
+    # For nginx, DOWNLOAD_ACCEL_PREFIX must be an internal location that
+    # points at PROCESSED_FOLDER.
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD')
+    DOWNLOAD_ACCEL_PREFIX = '/protected/processed/'
+    DOWNLOAD_MAX_AGE = 0  # Seconds browsers may reuse a download without revalidating
+    
+    # Browser previews
+    # Low-bitrate MP3 segments made on demand and kept in an LRU disk cache
+    PREVIEW_SEGMENT_SECONDS = 10
+    PREVIEW_BITRATE = 64             # kbps
+    PREVIEW_SAMPLE_RATE = 22050      # Hz
+    PREVIEW_CACHE_FOLDER = os.path.join('cache', 'previews')
+    PREVIEW_CACHE_MB = 500           # Oldest unused segments are removed beyond this
+    
+    # Retention
+    # Processed files older than a show's retention period (or RETENTION_DAYS
+    # for shows without one) are removed by `flask retention`
+    RETENTION_DAYS = 30                # None keeps files forever
+    RETENTION_BATCH_SIZE = 500         # Database records updated per batch
+    RETENTION_DELETES_PER_SECOND = 50  # Keeps sweeps from saturating the disk
+    
+    # Re-rendering
+    # `flask rerender` brings outputs up to date after a show's settings
+    # change. It renders one file at a time, only while no jobs are queued
+    # or running, checking again every RERENDER_IDLE_POLL_SECONDS.
+    RERENDER_IDLE_POLL_SECONDS = 10
+    
+    # Processing queue
+    # Uploads are queued and run by background workers: urgent jobs first,
+    # then by deadline (the show's air time on the date in the filename,
+    # minus JOB_DEADLINE_LEAD_MINUTES)
+    PROCESSING_WORKERS = 2           # 0 processes uploads during the request
+    WORKERS_START_WITH_APP = True    # Each web process starts its workers with its
+                                     # first request (off if only `flask worker` runs jobs)
+    DEFAULT_AIR_TIME = '06:00'       # For shows without an air time (HH:MM)
+    JOB_DEADLINE_LEAD_MINUTES = 60   # How long before air a file must be ready
+    
+    # Worker leases
+    # A worker renews its job's lease every WORKER_HEARTBEAT_SECONDS; if the
+    # lease runs out (worker crashed or lost its machine) the job is queued
+    # again, up to JOB_MAX_ATTEMPTS times. Extra workers on other machines
+    # are started with `flask worker` against the same database.
+    WORKER_LEASE_SECONDS = 120
+    WORKER_HEARTBEAT_SECONDS = 20
+    WORKER_POLL_SECONDS = 5          # How often idle workers look for new jobs
+    JOB_MAX_ATTEMPTS = 3
+    SQLITE_BUSY_TIMEOUT_MS = 30000   # How long SQLite waits for another process's write lock
+    
     # Audio processing defaults
     DEFAULT_SAMPLE_RATE = 44100  # CD quality
     DEFAULT_BIT_DEPTH = 16       # Standard for radio
     DEFAULT_CHANNELS = 2         # Stereo
     DEFAULT_NORMALIZE_LEVEL = -1.0  # dB below full scale
     
+    # Waveform previews
+    # Peaks are built during processing at several zoom levels so long
+    # shows can be drawn without downloading or decoding the audio
+    WAVEFORM_ENABLED = True
+    WAVEFORM_SAMPLE_RATE = 8000   # Hz, analysis rate for the peaks
+    WAVEFORM_BUCKET_SIZE = 80     # Samples per bucket at the finest zoom level
+    WAVEFORM_ZOOM_FACTOR = 4      # Each zoom level is this many times coarser
+    WAVEFORM_LEVELS = 6           # Number of zoom levels stored
+    
+    # Silence trimming
+    # Only the first/last SILENCE_MAX_SCAN_SECONDS of a file are examined
+    TRIM_SILENCE = False             # Default for shows that don't say otherwise
+    SILENCE_THRESHOLD_DB = -50.0     # RMS level (dBFS) treated as dead air
+    SILENCE_WINDOW_MS = 50           # Length of each RMS window
+    SILENCE_MAX_SCAN_SECONDS = 120   # How far into each end to look
+    SILENCE_PAD_MS = 250             # Silence kept before/after the audio
+    
+    # Loudness analysis (EBU R128)
+    # Every file is measured once while processing; compliance reports
+    # use the stored measurements
+    LOUDNESS_ANALYSIS_ENABLED = True
+    LOUDNESS_TARGET_LUFS = -23.0     # EBU R128 (use -24.0 for ATSC A/85)
+    LOUDNESS_TOLERANCE_LU = 1.0      # Allowed deviation from the target
+    LOUDNESS_MAX_TRUE_PEAK = -1.0    # dBTP ceiling
+    
+    # Show identification by audio
+    # Files whose names don't say which show they are (track01.wav, vendor
+    # GUIDs) are matched against the shows' jingle fingerprints, using only
+    # the first FINGERPRINT_SECONDS of audio
+    FINGERPRINT_ENABLED = True
+    FINGERPRINT_SECONDS = 45         # 30-60s covers a jingle after some pre-roll
+    FINGERPRINT_MIN_MATCHES = 20     # Aligned hashes needed to accept a match
+    
     # Date parsing configuration
     # For year interpretation in MMDDYY format
     YEAR_CUTOFF = 30  # Years 00-30 = 2000-2030, 31-99 = 1931-1999
@@ -44,9 +183,36 @@ class Config:
     # Pagination
     FILES_PER_PAGE = 25
     
+    # Startup
+    # AUTO_INIT_DB creates missing tables and the default shows every time
+    # the app starts. Where startup speed matters (gunicorn workers, CLI
+    # tools) turn it off and run `flask init-db` after installing or
+    # upgrading instead.
+    AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', '1').lower() not in ('0', 'false', 'no')
+    STARTUP_TIMING_FILE = os.environ.get('STARTUP_TIMING_FILE')  # e.g. logs/startup.jsonl
+    
+    # Profiling
+    # With PROFILING_ENABLED every request and job is sample-profiled (only
+    # those slower than PROFILE_MIN_MS are kept). Otherwise single requests
+    # can ask for it with an "X-Profile: <PROFILING_TOKEN>" header or
+    # ?profile=<PROFILING_TOKEN> - any value works in debug mode.
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0').lower() in ('1', 'true', 'yes')
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILE_JOBS = os.environ.get('PROFILE_JOBS', '0').lower() in ('1', 'true', 'yes')  # Keep a profile of every job
+    PROFILE_FOLDER = 'logs/profiles'
+    PROFILE_SAMPLE_INTERVAL_MS = 5
+    PROFILE_MIN_MS = 500
+    SLOW_QUERY_MS = 250  # Log queries slower than this with their route or job (0 = off)
+    
     # Logging
+    # Records are written by a background thread; several worker processes
+    # can share LOG_FILE. LOG_FORMAT is 'json' or 'text'.
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
     LOG_FILE = 'logs/radio_automation.log'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_MAX_BYTES = 10240000  # Rotate at 10MB
+    LOG_BACKUP_COUNT = 10
 
 class DevelopmentConfig(Config):
     """Development environment specific configuration"""
@@ -60,11 +226,16 @@ class ProductionConfig(Config):
     
     # In production, you might want to use PostgreSQL instead of SQLite
     # SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    
+    # Schema is set up with `flask init-db` rather than on every worker boot
+    AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', '0').lower() in ('1', 'true', 'yes')
 
 class TestingConfig(Config):
     """Testing environment specific configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # Use in-memory database for tests
+    PROCESSING_WORKERS = 0  # Run jobs inline so tests see the result straight away
+    ADMISSION_ENABLED = False  # Don't depend on the free space of the test machine
 
 # Dictionary to easily access configurations
 config = {
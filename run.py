@@ -2,20 +2,34 @@
 """
 Radio Workflow Automation System - Main Entry Point
 This file starts the web application server
+
+Command line tools run through it too, e.g.
+    python run.py ingest /path/to/archive --workers 4
 """
 
 from app import create_app
+from app.scheduler import start_workers
+from flask.cli import FlaskGroup
 import os
+import sys
 
 # Create the Flask application
 app = create_app()
 
-if __name__ == '__main__':
+if __name__ == '__main__' and len(sys.argv) > 1:
+    # `python run.py <command>` runs the same commands as `flask <command>`
+    FlaskGroup(create_app=lambda: app)()
+elif __name__ == '__main__':
     # Ensure required directories exist
-    os.makedirs('uploads', exist_ok=True)
-    os.makedirs('processed', exist_ok=True)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['PROCESSED_FOLDER'], exist_ok=True)
     os.makedirs('instance', exist_ok=True)
     
+    # Pick up any jobs left in the queue from the last run
+    # (only in the reloader's child process, which is the one serving requests)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_workers(app)
+    
     # Run the application
     # Debug=True means it will show errors and auto-reload when you make changes
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
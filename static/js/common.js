@@ -104,6 +104,108 @@ const RadioAutomation = {
         });
     },
 
+    // Draw a waveform preview from the server's peak data
+    // Only the buckets needed for the canvas width are downloaded
+    drawWaveform: function(canvas, fileId, start, end) {
+        if (!canvas) return;
+        const width = canvas.clientWidth || canvas.width;
+        canvas.width = width;
+        
+        let url = `/api/waveform/${fileId}?buckets=${width}`;
+        if (start !== undefined) url += `&start=${start}`;
+        if (end !== undefined) url += `&end=${end}`;
+        
+        fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.peaks) return;
+            
+            const ctx = canvas.getContext('2d');
+            const middle = canvas.height / 2;
+            const count = data.peaks.length / 2;
+            const step = width / Math.max(count, 1);
+            
+            ctx.clearRect(0, 0, width, canvas.height);
+            ctx.fillStyle = getComputedStyle(document.documentElement)
+                .getPropertyValue('--bs-primary') || '#0d6efd';
+            
+            for (let i = 0; i < count; i++) {
+                const min = data.peaks[i * 2] / 32768;
+                const max = data.peaks[i * 2 + 1] / 32768;
+                const top = middle - max * middle;
+                const height = Math.max(1, (max - min) * middle);
+                ctx.fillRect(i * step, top, Math.max(1, step), height);
+            }
+        })
+        .catch(error => {
+            console.error('Error loading waveform:', error);
+        });
+    },
+
+    // Play the low-bitrate preview of a processed file, starting at
+    // `start` seconds. Segments are fetched a few at a time as playback
+    // moves on, so starting deep into a long show is as quick as the top.
+    playPreview: function(audio, fileId, start) {
+        if (!audio) return;
+        start = start || 0;
+        
+        fetch(`/api/preview/${fileId}`)
+        .then(response => response.json())
+        .then(info => {
+            if (info.error) throw new Error(info.error);
+            
+            // Browsers without Media Source Extensions (Safari) play HLS natively
+            if (!window.MediaSource || !MediaSource.isTypeSupported('audio/mpeg')) {
+                audio.src = info.playlist_url;
+                audio.currentTime = start;
+                audio.play();
+                return;
+            }
+            
+            const mediaSource = new MediaSource();
+            let next = Math.min(Math.floor(start / info.segment_seconds), info.segment_count - 1);
+            let loading = false;
+            
+            const loadMore = function() {
+                const buffer = mediaSource.sourceBuffers[0];
+                if (loading || !buffer || buffer.updating) return;
+                if (next >= info.segment_count) {
+                    if (mediaSource.readyState === 'open') mediaSource.endOfStream();
+                    return;
+                }
+                // Stay about three segments ahead of the playhead
+                if (next * info.segment_seconds > audio.currentTime + info.segment_seconds * 3) return;
+                
+                loading = true;
+                const index = next++;
+                fetch(`/preview/${fileId}/${index}.mp3`)
+                .then(response => response.arrayBuffer())
+                .then(data => {
+                    buffer.timestampOffset = index * info.segment_seconds;
+                    buffer.appendBuffer(data);
+                    loading = false;
+                })
+                .catch(error => {
+                    loading = false;
+                    console.error('Error loading preview segment:', error);
+                });
+            };
+            
+            mediaSource.addEventListener('sourceopen', function() {
+                const buffer = mediaSource.addSourceBuffer('audio/mpeg');
+                buffer.addEventListener('updateend', loadMore);
+                audio.currentTime = start;
+                loadMore();
+                audio.play();
+            });
+            audio.ontimeupdate = loadMore;
+            audio.src = URL.createObjectURL(mediaSource);
+        })
+        .catch(error => {
+            console.error('Error starting preview:', error);
+        });
+    },
+
     // Show loading spinner
     showLoading: function(message) {
         const existingModal = document.getElementById('loadingModal');
@@ -0,0 +1,91 @@
+"""
+Tests for admission control (app/admission.py)
+
+The testing config turns admission control off, so each test turns it
+back on with limits small enough to hit with a handful of jobs.
+"""
+
+import threading
+import pytest
+
+from app import create_app, db, admission
+from app.models import ProcessingJob
+from app.admission import check_admission, wait_for_capacity
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Every check sees the jobs just added
+    monkeypatch.setattr(admission, 'SNAPSHOT_SECONDS', 0)
+    app = create_app('testing')
+    app.config.update(
+        UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+        PROCESSED_FOLDER=str(tmp_path / 'processed'),
+        ADMISSION_ENABLED=True,
+        ADMISSION_MAX_QUEUED=3,
+        ADMISSION_MAX_URGENT_QUEUED=2,
+        ADMISSION_MAX_BACKLOG_SECONDS=3600,
+        ADMISSION_MIN_FREE_MB=0,
+        ADMISSION_URGENT_RESERVE_MB=0
+    )
+    with app.app_context():
+        yield app
+
+def queue_jobs(count, urgent=False):
+    for number in range(count):
+        db.session.add(ProcessingJob(filename=f'show_{number}.wav', input_path='/uploads/x.wav',
+                                     urgent=urgent))
+    db.session.commit()
+
+def test_admitted_while_the_queue_has_room(app):
+    queue_jobs(2)
+    assert check_admission(app.config)['admitted']
+
+def test_full_queue_is_refused_but_urgent_files_get_in(app):
+    queue_jobs(3)
+    
+    decision = check_admission(app.config)
+    assert not decision['admitted']
+    assert decision['status'] == 429
+    assert 1 <= decision['retry_after'] <= 600
+    
+    assert check_admission(app.config, urgent=True)['admitted']
+    queue_jobs(2, urgent=True)
+    assert check_admission(app.config, urgent=True)['status'] == 429
+
+def test_a_batch_must_fit_whole(app):
+    queue_jobs(1)
+    assert check_admission(app.config, job_count=2)['admitted']
+    decision = check_admission(app.config, job_count=3)
+    assert not decision['admitted']
+    assert 'too full for 3 more jobs' in decision['reason']
+
+def test_saturated_workers_are_refused(app):
+    app.config.update(ADMISSION_MAX_QUEUED=100, ADMISSION_MAX_BACKLOG_SECONDS=60)
+    # With nothing processed yet a job is estimated at 30 seconds
+    queue_jobs(2)
+    assert check_admission(app.config)['admitted']
+    queue_jobs(1)
+    decision = check_admission(app.config)
+    assert decision['status'] == 429
+    assert 'saturated' in decision['reason']
+
+def test_low_disk_is_refused_for_everyone(app):
+    app.config['ADMISSION_URGENT_RESERVE_MB'] = 10 ** 12
+    decision = check_admission(app.config, urgent=True)
+    assert decision['status'] == 503
+    assert decision['retry_after'] == app.config['ADMISSION_DISK_RETRY_SECONDS']
+
+def test_upload_refusal_tells_the_client_when_to_retry(app):
+    queue_jobs(3)
+    response = app.test_client().post('/upload', data={})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+def test_waiting_producer_can_be_stopped(app):
+    queue_jobs(3)
+    stop = threading.Event()
+    messages = []
+    threading.Timer(0.1, stop.set).start()
+    
+    assert wait_for_capacity(app.config, stop=stop, echo=messages.append) is False
+    assert messages[0].startswith('Pausing: Processing queue is full')
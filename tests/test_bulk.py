@@ -0,0 +1,103 @@
+"""
+Tests for the bulk filename and job APIs (app/bulk.py)
+
+Jobs are only queued here, never run, so no FFmpeg is needed.
+"""
+
+import json
+import struct
+import pytest
+
+from app import create_app, db
+from app.models import ProcessingJob
+from app.bulk import parse_filenames, submit_jobs, clean_job_options
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+                      BULK_IMPORT_ROOTS=[str(tmp_path / 'archive')], BULK_MAX_ITEMS=3)
+    with app.app_context():
+        yield app
+
+def write_wav(path):
+    """Header of a one-second 16-bit stereo WAV, enough to pass the sniff"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = bytes(44100 * 4)
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 36 + len(data)) + b'WAVE')
+        f.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 2, 44100, 44100 * 4, 4, 16))
+        f.write(b'data' + struct.pack('<I', len(data)) + data)
+    return str(path)
+
+def test_results_come_back_in_order(app):
+    results = list(parse_filenames(['AIG_100424.wav', 'no date here.wav', 42]))
+    
+    assert [result['index'] for result in results] == [0, 1, 2]
+    assert results[0]['success']
+    assert results[0]['date'] == '2024-10-04'
+    assert results[0]['show_id'] is not None
+    assert not results[2]['success']
+    assert results[2]['error'] == 'Filename must be a string'
+
+def test_options_are_type_checked():
+    assert clean_job_options({'output_format': 'mp3', 'normalize': True}) == \
+        ({'output_format': 'mp3', 'normalize': True}, [])
+    
+    _, errors = clean_job_options({'sample_rate': '44100', 'channels': True, 'colour': 'red'})
+    assert errors == ['Option sample_rate has the wrong type', 'Option channels has the wrong type',
+                      'Unknown option: colour']
+
+def test_server_paths_must_be_inside_the_import_folders(app, tmp_path):
+    good = write_wav(tmp_path / 'archive' / 'AIG_100424.wav')
+    outside = write_wav(tmp_path / 'elsewhere' / 'AIG_100424.wav')
+    
+    results = list(submit_jobs([
+        {'path': good, 'urgent': True},
+        {'path': outside},
+        {'path': str(tmp_path / 'archive' / '..' / 'elsewhere' / 'AIG_100424.wav')},
+        {'path': str(tmp_path / 'archive' / 'missing.wav')},
+        {'path': good, 'options': {'sample_rate': 'fast'}}
+    ]))
+    
+    assert results[0]['success']
+    assert [result['error'] for result in results[1:]] == [
+        'Path is outside the allowed import folders',
+        'Path is outside the allowed import folders',
+        'File not found',
+        'Option sample_rate has the wrong type'
+    ]
+    job = db.session.get(ProcessingJob, results[0]['job_id'])
+    assert job.status == 'queued'
+    assert job.urgent
+    assert ProcessingJob.query.count() == 1
+
+def test_rejected_server_file_is_kept(app, tmp_path):
+    junk = tmp_path / 'archive' / 'not_audio.wav'
+    junk.parent.mkdir()
+    junk.write_bytes(b'this is not a wav file' * 10)
+    
+    result = next(submit_jobs([{'path': str(junk)}]))
+    assert not result['success']
+    assert result['status'] == 'rejected'
+    # It belongs to whoever put it there
+    assert junk.exists()
+
+def test_parse_api_replies_as_json_or_ndjson(app):
+    client = app.test_client()
+    body = {'filenames': ['AIG_100424.wav', 'FOF_123199.mp3']}
+    
+    reply = client.post('/api/parse-filenames', json=body).get_json()
+    assert (reply['count'], reply['succeeded']) == (2, 2)
+    
+    response = client.post('/api/parse-filenames', json=body,
+                           headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['filename'] for line in lines] == body['filenames']
+
+def test_batch_limit(app):
+    client = app.test_client()
+    assert client.post('/api/parse-filenames', json={'filenames': ['a.wav'] * 4}).status_code == 413
+    assert client.post('/api/jobs/bulk', json={'items': [{}] * 4}).status_code == 413
+    assert client.post('/api/jobs/bulk', json={'items': 'all of them'}).status_code == 400
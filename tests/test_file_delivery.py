@@ -0,0 +1,90 @@
+"""
+Tests for processed file downloads (app/file_delivery.py)
+
+Downloads must honour Range and conditional requests, and with
+DOWNLOAD_OFFLOAD set must leave the transfer to the front-end server.
+"""
+
+import os
+import pytest
+
+from app import create_app, db
+from app.models import ProcessedFile
+
+CONTENT = bytes(range(256)) * 64
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config['PROCESSED_FOLDER'] = str(tmp_path / 'processed')
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def processed_file(app):
+    path = os.path.join(app.config['PROCESSED_FOLDER'], 'Show', '2024', '01', 'Show_20240105.wav')
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(CONTENT)
+    
+    processed_file = ProcessedFile(original_filename='Show_010524.wav', output_filename=path)
+    db.session.add(processed_file)
+    db.session.commit()
+    return processed_file
+
+def test_whole_file(client, processed_file):
+    response = client.get(f'/download/{processed_file.id}')
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'Show_20240105.wav' in response.headers['Content-Disposition']
+
+def test_range_request(client, processed_file):
+    response = client.get(f'/download/{processed_file.id}', headers={'Range': 'bytes=1000-1999'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[1000:2000]
+    assert response.headers['Content-Range'] == f'bytes 1000-1999/{len(CONTENT)}'
+    
+    response = client.get(f'/download/{processed_file.id}', headers={'Range': 'bytes=-10'})
+    assert response.data == CONTENT[-10:]
+
+def test_unchanged_file_is_not_sent_again(client, processed_file):
+    etag = client.get(f'/download/{processed_file.id}').headers['ETag']
+    
+    response = client.get(f'/download/{processed_file.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    
+    # Rewriting the file changes its ETag
+    with open(processed_file.output_filename, 'ab') as f:
+        f.write(b'more')
+    response = client.get(f'/download/{processed_file.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+def test_x_accel_redirect(app, client, processed_file):
+    app.config['DOWNLOAD_OFFLOAD'] = 'x-accel-redirect'
+    
+    response = client.get(f'/download/{processed_file.id}')
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == '/protected/processed/Show/2024/01/Show_20240105.wav'
+    assert response.headers['Content-Type'].startswith('audio/')
+    
+    etag = response.headers['ETag']
+    assert client.get(f'/download/{processed_file.id}',
+                      headers={'If-None-Match': etag}).status_code == 304
+
+def test_x_sendfile(app, client, processed_file):
+    app.config['DOWNLOAD_OFFLOAD'] = 'x-sendfile'
+    response = client.get(f'/download/{processed_file.id}')
+    assert response.headers['X-Sendfile'] == os.path.abspath(processed_file.output_filename)
+
+def test_expired_file_is_not_served(client, processed_file):
+    processed_file.expired_at = processed_file.processed_at
+    db.session.commit()
+    response = client.get(f'/download/{processed_file.id}')
+    assert response.status_code == 302
@@ -0,0 +1,80 @@
+"""
+Tests for jingle recognition (app/audio_fingerprint.py)
+
+The jingles here are made up of random tone sequences, generated at the
+fingerprint sample rate, so no decoding (and no FFmpeg) is needed.
+"""
+
+import numpy as np
+import pytest
+
+from app.audio_fingerprint import (SAMPLE_RATE, HASH_DTYPE, MAX_HASH_HITS, HOP_SIZE, JingleIndex,
+                                   landmark_hashes)
+
+def tones(seed, seconds=6.0):
+    """A jingle: a different random tone every 150ms"""
+    rng = np.random.default_rng(seed)
+    note = int(SAMPLE_RATE * 0.15)
+    t = np.arange(note) / SAMPLE_RATE
+    notes = [0.5 * np.sin(2 * np.pi * rng.uniform(200, 3500) * t)
+             for _ in range(int(seconds / 0.15))]
+    return np.concatenate(notes).astype(np.float32)
+
+def noise(seconds, seed=99, level=0.01):
+    rng = np.random.default_rng(seed)
+    return (level * rng.standard_normal(int(SAMPLE_RATE * seconds))).astype(np.float32)
+
+def pack(samples):
+    hashes, offsets = landmark_hashes(samples)
+    packed = np.empty(len(hashes), dtype=HASH_DTYPE)
+    packed['hash'] = hashes
+    packed['offset'] = offsets
+    return packed.tobytes()
+
+@pytest.fixture(scope='module')
+def index():
+    return JingleIndex([
+        (11, 1, pack(tones(1))),
+        (12, 2, pack(tones(2))),
+        (13, 2, pack(tones(3)))
+    ])
+
+def test_finds_the_jingle_and_where_it_starts(index):
+    # 3 seconds of something else, then show 2's second jingle
+    episode = np.concatenate((noise(3.0), tones(3), noise(2.0, seed=5)))
+    episode += noise(len(episode) / SAMPLE_RATE, seed=7, level=0.02)
+    
+    ranked = index.lookup(*landmark_hashes(episode))
+    
+    show_id, jingle_id, votes, offset = ranked[0]
+    assert (show_id, jingle_id) == (2, 13)
+    assert abs(offset - 3.0) <= HOP_SIZE / SAMPLE_RATE
+    # The right jingle wins by a wide margin
+    assert all(votes > 5 * other[2] for other in ranked[1:])
+
+def test_one_entry_per_jingle_best_first(index):
+    ranked = index.lookup(*landmark_hashes(tones(1)))
+    jingle_ids = [entry[1] for entry in ranked]
+    assert jingle_ids[0] == 11
+    assert len(jingle_ids) == len(set(jingle_ids))
+    assert [entry[2] for entry in ranked] == sorted((entry[2] for entry in ranked), reverse=True)
+
+def test_unrelated_audio_gets_few_votes(index):
+    ranked = index.lookup(*landmark_hashes(tones(4)))
+    best_match = index.lookup(*landmark_hashes(tones(2)))[0][2]
+    assert not ranked or ranked[0][2] * 10 < best_match
+
+def test_empty_index_and_empty_query(index):
+    assert JingleIndex([]).lookup(*landmark_hashes(tones(1))) == []
+    assert len(JingleIndex([])) == 0
+    empty = np.empty(0, dtype=np.uint32)
+    assert index.lookup(empty, empty) == []
+
+def test_hashes_every_jingle_has_are_ignored():
+    common = np.empty(MAX_HASH_HITS + 1, dtype=HASH_DTYPE)
+    common['hash'] = 1234
+    common['offset'] = np.arange(len(common))
+    index = JingleIndex([(1, 1, common.tobytes())])
+    
+    hashes = np.full(10, 1234, dtype=np.uint32)
+    assert index.lookup(hashes, np.arange(10, dtype=np.uint32)) == []
@@ -0,0 +1,94 @@
+"""
+Tests for the FFmpeg resource governor (app/governor.py)
+
+The watchdog tests use a sleeping Python process in place of FFmpeg.
+"""
+
+import sys
+import subprocess
+import threading
+import pytest
+
+from app import governor
+from app.governor import (parse_cpu_sets, get_limits, governed_command, worker_slot_from_id,
+                          resource_scope, run_in_scope, is_cancelled, available_cpus, Watchdog)
+
+@pytest.fixture(autouse=True)
+def quick_watchdog(monkeypatch):
+    monkeypatch.setattr(governor, 'WATCHDOG_INTERVAL', 0.05)
+
+def sleeper():
+    return subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+
+def limits(**settings):
+    return get_limits(settings)
+
+def test_cpu_sets():
+    assert parse_cpu_sets('2-3;4,6') == [{2, 3}, {4, 6}]
+    assert parse_cpu_sets(' 0 ; ;1-2 ') == [{0}, {1, 2}]
+    assert parse_cpu_sets('') == []
+    assert parse_cpu_sets(None) == []
+
+def test_each_worker_gets_its_own_cpus():
+    cpu_limits = limits(FFMPEG_CPU_SETS='0-1;2-3')
+    assert available_cpus(cpu_limits) == 4
+    with resource_scope(slot=0):
+        assert available_cpus(cpu_limits) == 2
+    with resource_scope(slot=3):
+        assert governor._cpus_for_this_worker(cpu_limits['cpu_sets']) == {2, 3}
+
+def test_worker_slot_from_id():
+    assert worker_slot_from_id('studio-2:4242:1') == 1
+    assert worker_slot_from_id('studio-2') is None
+    assert worker_slot_from_id(None) is None
+
+def test_thread_caps_go_after_ffmpeg(monkeypatch):
+    monkeypatch.setattr(governor, '_ionice_path', lambda: None)
+    cmd = ['ffmpeg', '-i', 'in.wav', 'out.mp3']
+    assert governed_command(cmd, limits(FFMPEG_THREADS=2)) == \
+        ['ffmpeg', '-filter_threads', '2', '-threads', '2', '-i', 'in.wav', 'out.mp3']
+    assert governed_command(['ffprobe', 'in.wav'], limits(FFMPEG_THREADS=2)) == ['ffprobe', 'in.wav']
+    assert governed_command(cmd, limits()) == cmd
+
+def test_ionice_wraps_the_command(monkeypatch):
+    monkeypatch.setattr(governor, '_ionice_path', lambda: '/usr/bin/ionice')
+    assert governed_command(['ffmpeg'], limits(FFMPEG_IONICE_CLASS='best-effort'))[:5] == \
+        ['/usr/bin/ionice', '-c', '2', '-n', '7']
+    assert governed_command(['ffmpeg'], limits(FFMPEG_IONICE_CLASS='idle'))[:3] == \
+        ['/usr/bin/ionice', '-c', '3']
+
+def test_timeout_kills_the_process_and_is_reported():
+    process = sleeper()
+    with resource_scope() as scope:
+        with Watchdog(process, limits(FFMPEG_TIMEOUT_SECONDS=0.2), name='render') as watchdog:
+            process.wait(timeout=10)
+    
+    assert process.returncode != 0
+    assert scope.events == [watchdog.event]
+    assert watchdog.event['limit'] == 'timeout'
+    assert watchdog.event['step'] == 'render'
+    assert 'resource governor' in watchdog.message()
+
+def test_cancel_kills_the_process_without_an_event():
+    cancel = threading.Event()
+    process = sleeper()
+    with resource_scope(cancel=cancel) as scope:
+        with Watchdog(process, limits()) as watchdog:
+            threading.Timer(0.1, cancel.set).start()
+            process.wait(timeout=10)
+        assert is_cancelled()
+    
+    assert watchdog.cancelled
+    assert scope.events == []
+    assert watchdog.message() == 'FFmpeg stopped: the job was cancelled'
+    assert not is_cancelled()
+
+def test_helper_threads_share_the_scope():
+    cancel = threading.Event()
+    cancel.set()
+    scope = resource_scope(cancel=cancel)
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(run_in_scope(scope, is_cancelled)))
+    thread.start()
+    thread.join()
+    assert seen == [True]
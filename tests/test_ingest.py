@@ -0,0 +1,89 @@
+"""
+Tests for bulk ingest (app/ingest.py)
+
+process_audio_file is replaced with a recorder, so these tests cover the
+folder walk and the checkpoint rather than the audio itself. They use a
+database file so the worker threads each get a real connection.
+"""
+
+import os
+import threading
+import pytest
+
+from app import create_app, db, ingest
+from app.ingest import run_ingest, find_audio_files, Checkpoint
+from config import TestingConfig
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(ingest, 'PROGRESS_INTERVAL', 0.01)
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def processed(monkeypatch):
+    """Paths process_audio_file was called with; names containing 'bad' fail"""
+    calls = []
+    lock = threading.Lock()
+    
+    def fake_process(path, **options):
+        with lock:
+            calls.append(path)
+        if 'bad' in os.path.basename(path):
+            return {'success': False, 'error': 'could not decode'}
+        return {'success': True, 'file_id': len(calls)}
+    
+    monkeypatch.setattr(ingest, 'process_audio_file', fake_process)
+    return calls
+
+@pytest.fixture
+def folder(tmp_path):
+    root = tmp_path / 'archive'
+    for name in ('2023/show_a.wav', '2023/show_b.mp3', '2024/01/show_c.flac', '2024/bad.wav',
+                 '2024/notes.txt', '.trash/old.wav'):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'\0' * 100)
+    return str(root)
+
+def ingest_folder(app, folder, tmp_path):
+    return run_ingest(app, folder, workers=2, checkpoint_path=str(tmp_path / 'checkpoint.jsonl'),
+                      echo=lambda message: None)
+
+def test_finds_audio_files_only(folder):
+    names = [os.path.relpath(path, folder) for path, _, _ in find_audio_files(folder, {'wav', 'mp3', 'flac'})]
+    assert names == ['2023/show_a.wav', '2023/show_b.mp3', '2024/01/show_c.flac', '2024/bad.wav']
+
+def test_second_run_only_retries_failures(app, folder, processed, tmp_path):
+    summary = ingest_folder(app, folder, tmp_path)
+    assert (summary['found'], summary['processed'], summary['failed']) == (4, 3, 1)
+    assert len(summary['errors']) == 1
+    assert len(processed) == 4
+    
+    processed.clear()
+    summary = ingest_folder(app, folder, tmp_path)
+    assert summary['skipped'] == 3
+    assert [os.path.basename(path) for path in processed] == ['bad.wav']
+
+def test_changed_file_is_processed_again(app, folder, processed, tmp_path):
+    ingest_folder(app, folder, tmp_path)
+    processed.clear()
+    
+    with open(os.path.join(folder, '2023', 'show_a.wav'), 'ab') as f:
+        f.write(b'more audio')
+    ingest_folder(app, folder, tmp_path)
+    assert sorted(os.path.basename(path) for path in processed) == ['bad.wav', 'show_a.wav']
+
+def test_checkpoint_ignores_a_line_cut_short(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = Checkpoint(path)
+    checkpoint.record('a.wav|100|1', 1)
+    checkpoint.close()
+    with open(path, 'a') as f:
+        f.write('{"key": "b.wav|10')
+    
+    assert Checkpoint(path).done == {'a.wav|100|1'}
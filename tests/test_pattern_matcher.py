@@ -0,0 +1,124 @@
+"""
+Tests for filename grammars (app/pattern_matcher.py)
+
+A filename is matched against every show's own grammar and then the
+built-in ShowName_MMDDYY layouts, all in one combined regular expression.
+"""
+
+from datetime import date
+import pytest
+
+from app import create_app, db
+from app.models import Show, ShowAlias
+from app.pattern_matcher import (FilenameMatcher, PatternError, BUILTIN_GRAMMARS, compile_grammar,
+                                 parse_filename, expand_year)
+
+def builtin_matcher():
+    return FilenameMatcher([(template, None, None, None) for template in BUILTIN_GRAMMARS])
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def morning_drive(app):
+    show = Show(name='Morning Drive', filename_pattern='{alias}-{yyyy}{mm}{dd}-{part}')
+    db.session.add(show)
+    db.session.flush()
+    db.session.add(ShowAlias(alias='md', show_id=show.id))
+    db.session.commit()
+    return show
+
+@pytest.mark.parametrize('filename,show_name,air_date', [
+    ('AnswersInGenesis_100424.wav', 'Answers In Genesis', date(2024, 10, 4)),
+    ('Answers_In_Genesis_100424.mp3', 'Answers In Genesis', date(2024, 10, 4)),
+    # Acronyms are kept as they are and looked up as aliases later
+    ('FOF_123199.mp3', 'FOF', date(1999, 12, 31)),
+    ('AIG-010125.wav', 'AIG', date(2025, 1, 1)),
+    ('WeekendEdition_070423.wav', 'Weekend Edition', date(2023, 7, 4))
+])
+def test_builtin_layouts(filename, show_name, air_date):
+    result = parse_filename(filename, builtin_matcher())
+    assert result['success']
+    assert result['show_name'] == show_name
+    assert result['date'] == air_date
+    assert result['show_id'] is None
+
+@pytest.mark.parametrize('filename,error', [
+    ('random_audio.wav', "doesn't match"),
+    ('Show_133124.wav', 'Invalid date'),
+    ('Show_0431.wav', "doesn't match")
+])
+def test_names_that_dont_parse(filename, error):
+    result = parse_filename(filename, builtin_matcher())
+    assert not result['success']
+    assert error in result['error']
+
+def test_show_grammar_with_alias_and_part():
+    matcher = FilenameMatcher([
+        ('{alias}-{yyyy}{mm}{dd}-{part}', 7, 'Morning Drive', ['md', 'Morning_Drive']),
+        ('news {dd}.{mm}.{yy}', 8, 'News', None)
+    ] + [(template, None, None, None) for template in BUILTIN_GRAMMARS])
+    
+    result = parse_filename('MD-20250101-2.wav', matcher)
+    assert result['success']
+    assert result['show_id'] == 7
+    assert result['show_name'] == 'Morning Drive'
+    assert result['date'] == date(2025, 1, 1)
+    assert result['part'] == '2'
+    assert result['pattern'] == '{alias}-{yyyy}{mm}{dd}-{part}'
+    
+    result = parse_filename('news 31.12.24.mp3', matcher)
+    assert result['show_id'] == 8
+    assert result['date'] == date(2024, 12, 31)
+    
+    # Names that fit no show grammar still get the built-in layouts
+    result = parse_filename('Other_010225.wav', matcher)
+    assert result['show_id'] is None
+    assert result['show_name'] == 'Other'
+
+def test_longest_alias_wins():
+    matcher = FilenameMatcher([('{alias}_{part}', 1, 'Two', ['aig', 'aig2'])])
+    assert parse_filename('aig2_B.wav', matcher)['part'] == 'B'
+
+def test_grammar_without_a_date_only_identifies_the_show():
+    matcher = FilenameMatcher([('promo {any}', 3, 'Promos', None)])
+    result = parse_filename('promo summer drive.wav', matcher)
+    assert result['success']
+    assert result['show_id'] == 3
+    assert result['date'] is None
+
+@pytest.mark.parametrize('template', [
+    '{show}_{mm}{dd}',
+    '{show}_{yyyy}{yy}{mm}{dd}',
+    '{show}_{dd}_{dd}',
+    '{show}_{day}',
+    'no fields',
+    '{alias}_{mm}{dd}{yy}'
+])
+def test_bad_grammars_are_rejected(template):
+    with pytest.raises(PatternError):
+        compile_grammar(template)
+
+def test_expand_year():
+    assert expand_year(30) == 2030
+    assert expand_year(31) == 1931
+    assert expand_year(99, cutoff=99) == 2099
+
+def test_show_patterns_from_the_database(app, morning_drive):
+    result = parse_filename('md-20240105-A.wav')
+    assert result['show_id'] == morning_drive.id
+    assert result['part'] == 'A'
+    
+    # The combined matcher is rebuilt when a show's pattern changes
+    morning_drive.filename_pattern = 'drive_{yyyy}{mm}{dd}'
+    db.session.commit()
+    assert parse_filename('drive_20240105.wav')['show_id'] == morning_drive.id
+    assert parse_filename('md-20240105-A.wav')['show_id'] is None
+
+def test_inactive_shows_grammars_are_skipped(app, morning_drive):
+    morning_drive.active = False
+    db.session.commit()
+    assert parse_filename('md-20240105-A.wav')['show_id'] is None
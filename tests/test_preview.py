@@ -0,0 +1,105 @@
+"""
+Tests for the preview segment cache and playlists (app/preview.py)
+
+The producers here write fixed bytes instead of transcoding, so no
+FFmpeg is needed.
+"""
+
+import os
+import threading
+import time
+import pytest
+
+from app.preview import SegmentCache, build_playlist, get_segment_count
+
+def writer(size, calls=None):
+    """Producer that writes size bytes, counting how often it's called"""
+    def produce(path):
+        if calls is not None:
+            calls.append(path)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * size)
+    return produce
+
+def age(path, seconds):
+    when = time.time() - seconds
+    os.utime(path, (when, when))
+
+def test_segment_is_built_once(tmp_path):
+    cache = SegmentCache(str(tmp_path), 10000)
+    calls = []
+    
+    first = cache.get('file/0.mp3', writer(100, calls))
+    second = cache.get('file/0.mp3', writer(100, calls))
+    
+    assert first == second == str(tmp_path / 'file' / '0.mp3')
+    assert len(calls) == 1
+    assert os.listdir(tmp_path / 'file') == ['0.mp3']
+
+def test_failed_build_leaves_nothing_behind(tmp_path):
+    cache = SegmentCache(str(tmp_path), 10000)
+    
+    def broken(path):
+        with open(path, 'wb') as f:
+            f.write(b'half')
+        raise RuntimeError('transcode failed')
+    
+    with pytest.raises(RuntimeError):
+        cache.get('file/0.mp3', broken)
+    assert os.listdir(tmp_path / 'file') == []
+    assert os.path.exists(cache.get('file/0.mp3', writer(100)))
+
+def test_least_recently_used_segments_are_evicted(tmp_path):
+    cache = SegmentCache(str(tmp_path), 250)
+    paths = [cache.get(f'file/{n}.mp3', writer(100)) for n in range(2)]
+    age(paths[0], 20)
+    age(paths[1], 10)
+    
+    # A hit makes the older segment the most recent
+    cache.get('file/0.mp3', writer(100))
+    cache.get('file/2.mp3', writer(100))
+    
+    assert os.path.exists(paths[0])
+    assert not os.path.exists(paths[1])
+    assert cache.total_bytes == 200
+
+def test_caches_sharing_a_folder_share_the_limit(tmp_path):
+    # Two web processes, each with its own SegmentCache
+    first = SegmentCache(str(tmp_path), 250)
+    second = SegmentCache(str(tmp_path), 250)
+    
+    for n in range(3):
+        age(first.get(f'a/{n}.mp3', writer(100)), 30 - n)
+        age(second.get(f'b/{n}.mp3', writer(100)), 20 - n)
+    
+    remaining = [os.path.join(folder, name)
+                 for folder in os.listdir(tmp_path) for name in os.listdir(tmp_path / folder)]
+    assert len(remaining) == 2
+    assert second.total_bytes <= 250
+
+def test_concurrent_requests_build_a_segment_once(tmp_path):
+    cache = SegmentCache(str(tmp_path), 10000)
+    calls = []
+    
+    def slow(path):
+        calls.append(path)
+        time.sleep(0.1)
+        writer(100)(path)
+    
+    threads = [threading.Thread(target=cache.get, args=('file/0.mp3', slow)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(calls) == 1
+
+def test_playlist():
+    assert get_segment_count(0, 10) == 0
+    assert get_segment_count(25, 10) == 3
+    
+    playlist = build_playlist(25, 10, lambda n: f'/preview/1/{n}.mp3')
+    lines = playlist.splitlines()
+    assert lines[0] == '#EXTM3U'
+    assert '#EXT-X-TARGETDURATION:10' in lines
+    assert lines[-3:] == ['#EXTINF:5.000,', '/preview/1/2.mp3', '#EXT-X-ENDLIST']
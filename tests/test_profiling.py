@@ -0,0 +1,88 @@
+"""
+Tests for request and job profiling (app/profiling.py)
+"""
+
+import os
+import threading
+import time
+import pytest
+
+from app import create_app
+from app.profiling import SamplingProfiler, profile_job
+
+TOKEN = 'let-me-profile'
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(PROFILING_TOKEN=TOKEN, PROFILE_FOLDER=str(tmp_path / 'profiles'))
+    
+    @app.route('/test/slow')
+    def slow():
+        time.sleep(0.05)
+        return 'done'
+    
+    @app.route('/test/broken')
+    def broken():
+        raise RuntimeError('view failed')
+    
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def profiler_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'profiler']
+
+def test_request_with_the_token_is_profiled(app, client):
+    response = client.get('/test/slow', headers={'X-Profile': TOKEN})
+    
+    name = response.headers['X-Profile-File']
+    folder = app.config['PROFILE_FOLDER']
+    assert name.endswith('-request-GET_test_slow.folded')
+    assert os.path.exists(os.path.join(folder, name))
+    with open(os.path.join(folder, name[:-len('.folded')] + '.txt')) as f:
+        assert f.readline() == 'request: GET /test/slow\n'
+
+def test_requests_without_the_token_are_not_profiled(client):
+    assert 'X-Profile-File' not in client.get('/test/slow').headers
+    assert 'X-Profile-File' not in client.get('/test/slow?profile=guess').headers
+
+def test_profiler_stops_when_a_view_raises(app, client):
+    with pytest.raises(RuntimeError):
+        client.get('/test/broken', headers={'X-Profile': TOKEN})
+    
+    assert profiler_threads() == []
+    # The failed request's profile is still kept
+    names = os.listdir(app.config['PROFILE_FOLDER'])
+    assert any(name.endswith('-request-GET_test_broken.folded') for name in names)
+
+def test_jobs_are_profiled_under_their_source_name(app):
+    app.config['PROFILE_JOBS'] = True
+    
+    @profile_job
+    def process(input_path, source_name=None):
+        time.sleep(0.02)
+        return 'processed'
+    
+    assert process('/uploads/0a1b_show.wav', source_name='Show_010524.wav') == 'processed'
+    names = os.listdir(app.config['PROFILE_FOLDER'])
+    assert any(name.endswith('-job-Show_010524_wav.folded') for name in names)
+    assert profiler_threads() == []
+
+def test_hottest_functions():
+    def busy():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+    
+    profiler = SamplingProfiler(interval=0.002)
+    profiler.start()
+    busy()
+    profiler.stop()
+    
+    function, own, total = profiler.hottest()[0]
+    assert function.endswith(':busy')
+    assert own > 0 and total >= own
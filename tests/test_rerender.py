@@ -0,0 +1,125 @@
+"""
+Tests for finding files to re-render (app/rerender.py)
+
+Rendering itself needs FFmpeg; these tests cover the decisions around
+it - which files are stale, where their source is, and what happens to
+the old outputs.
+"""
+
+import os
+import pytest
+
+from app import create_app, db
+from app.models import Show, ProcessedFile, ProcessedOutput
+from app.rerender import (render_settings_hash, show_settings_hash, backfill_settings_hashes,
+                          find_stale_files, count_stale_files, find_source, retire_render,
+                          run_rerender)
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(UPLOAD_FOLDER=str(tmp_path / 'uploads'), TRIM_SILENCE=False)
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def show(app):
+    show = Show(name='Morning Drive', default_format='wav', sample_rate=44100, bit_depth=16,
+                channels=2, normalize=True, normalize_level=-1.0)
+    db.session.add(show)
+    db.session.commit()
+    return show
+
+def add_file(show, settings_hash=None, outputs=(), **fields):
+    processed_file = ProcessedFile(original_filename='Morning_Drive_010524.wav', show_id=show.id,
+                                   success=True, settings_hash=settings_hash,
+                                   normalized=True, normalize_level=-1.0, **fields)
+    db.session.add(processed_file)
+    db.session.flush()
+    for output in outputs:
+        db.session.add(ProcessedOutput(processed_file_id=processed_file.id, **output))
+    db.session.commit()
+    return processed_file
+
+WAV_44_16 = {'output_format': 'wav', 'sample_rate': 44100, 'bit_depth': 16, 'channels': 2}
+
+def test_hash_ignores_settings_that_dont_apply():
+    mp3 = {'format': 'mp3', 'sample_rate': 44100, 'channels': 2, 'bitrate': 320}
+    assert render_settings_hash([mp3], True, -1.0, False) == \
+        render_settings_hash([dict(mp3, bit_depth=24)], True, -1.0, False)
+    assert render_settings_hash([mp3], True, -1.0, False) != \
+        render_settings_hash([dict(mp3, bitrate=128)], True, -1.0, False)
+    # The level doesn't matter when normalization is off
+    assert render_settings_hash([mp3], False, -1.0, False) == \
+        render_settings_hash([mp3], False, -3.0, False)
+
+def test_only_files_with_other_settings_are_stale(app, show):
+    wanted = show_settings_hash(show, app.config)
+    current = add_file(show, settings_hash=wanted)
+    old = add_file(show, settings_hash='0123456789abcdef')
+    
+    stale = find_stale_files(show.id)
+    assert stale[show.id][0] == wanted
+    assert [f.id for f in stale[show.id][1]] == [old.id]
+    assert count_stale_files(show) == 1
+    
+    # Changing the show makes its other file stale too
+    show.sample_rate = 48000
+    db.session.commit()
+    assert count_stale_files(show) == 2
+    assert current.id in [f.id for f in find_stale_files(show.id)[show.id][1]]
+
+def test_old_files_are_hashed_from_their_output_records(app, show):
+    matching = add_file(show, outputs=[WAV_44_16])
+    different = add_file(show, outputs=[dict(WAV_44_16, bit_depth=24)])
+    unknown = add_file(show)
+    
+    # Files with no hash count as stale until the backfill has run
+    assert count_stale_files(show) == 3
+    
+    assert backfill_settings_hashes() == 2
+    stale_ids = [f.id for f in find_stale_files(show.id)[show.id][1]]
+    assert matching.id not in stale_ids
+    assert different.id in stale_ids
+    # Nothing to go by - rendered again to be sure
+    assert unknown.settings_hash is None
+    assert unknown.id in stale_ids
+
+def test_source_is_found_in_the_upload_folder(app, show, tmp_path):
+    processed_file = add_file(show, source_path=str(tmp_path / 'gone.wav'))
+    assert find_source(processed_file) is None
+    
+    os.makedirs(app.config['UPLOAD_FOLDER'])
+    upload = os.path.join(app.config['UPLOAD_FOLDER'], processed_file.original_filename)
+    open(upload, 'wb').close()
+    assert find_source(processed_file) == upload
+
+def test_retire_render_removes_only_obsolete_outputs(app, show, tmp_path):
+    paths = {name: str(tmp_path / name) for name in
+             ('show.wav', 'show.wav.peaks', 'show_web.mp3', 'show_web.mp3.peaks')}
+    for path in paths.values():
+        open(path, 'wb').close()
+    old = add_file(show, output_filename=paths['show.wav'],
+                   outputs=[dict(WAV_44_16, output_filename=paths['show.wav']),
+                            {'output_format': 'mp3', 'output_filename': paths['show_web.mp3']}])
+    new = add_file(show)
+    
+    # The new render rewrote show.wav in place but has no web output
+    retire_render(old, new.id, [paths['show.wav'], paths['show_web.mp3']], [paths['show.wav']])
+    
+    assert os.path.exists(paths['show.wav'])
+    assert os.path.exists(paths['show.wav.peaks'])
+    assert not os.path.exists(paths['show_web.mp3'])
+    assert not os.path.exists(paths['show_web.mp3.peaks'])
+    assert old.replaced_by_id == new.id
+    assert old.expired_at is not None
+    assert all(output.expired_at is not None for output in old.outputs)
+    # A replaced file is no longer looked at
+    assert old.id not in [f.id for f in find_stale_files(show.id).get(show.id, (None, []))[1]]
+
+def test_dry_run_reports_without_rendering(app, show):
+    add_file(show, settings_hash='0123456789abcdef')
+    report = run_rerender(show_id=show.id, dry_run=True)
+    assert report['success']
+    assert report['stale'] == 1
+    assert report['rendered'] == 0
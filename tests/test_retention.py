@@ -0,0 +1,124 @@
+"""
+Tests for retention sweeps (app/retention.py)
+
+Each test lays out a small processed folder with files of known ages
+and checks which of them a sweep removes and how the records change.
+"""
+
+import os
+import time
+import pytest
+
+from app import create_app, db
+from app.models import Show, ProcessedFile
+from app.retention import run_retention, get_retention_policies
+
+DAY = 24 * 60 * 60
+NOW = time.time()
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing')
+    app.config.update(
+        PROCESSED_FOLDER=str(tmp_path / 'processed'),
+        RETENTION_DAYS=30,
+        RETENTION_DELETES_PER_SECOND=0
+    )
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def show(app):
+    show = Show(name='Morning Drive', retention_days=90)
+    db.session.add(show)
+    db.session.commit()
+    return show
+
+def make_file(app, relative, age_days):
+    """Create a file under the processed folder, last modified age_days ago"""
+    path = os.path.join(app.config['PROCESSED_FOLDER'], relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 100)
+    os.utime(path, (NOW - age_days * DAY, NOW - age_days * DAY))
+    return path
+
+def record(path, show=None, peaks=None):
+    processed_file = ProcessedFile(original_filename=os.path.basename(path),
+                                   output_filename=path, peaks_filename=peaks,
+                                   show_id=show.id if show else None)
+    db.session.add(processed_file)
+    db.session.commit()
+    return processed_file
+
+def test_each_show_keeps_its_own_period(app, show):
+    kept = make_file(app, 'Morning_Drive/2024/01/Morning_Drive_20240105.wav', 60)
+    gone = make_file(app, 'Morning_Drive/2024/01/Morning_Drive_20240101.wav', 100)
+    unsorted = make_file(app, '_unsorted/2024/01/mystery.wav', 60)
+    
+    report = run_retention(now=NOW)
+    
+    assert report['success']
+    assert os.path.exists(kept)
+    assert not os.path.exists(gone)
+    assert not os.path.exists(unsorted)
+    assert report['files'] == 2
+    assert report['folders'] == {'Morning_Drive': {'files': 1, 'bytes': 100},
+                                 '_unsorted': {'files': 1, 'bytes': 100}}
+
+def test_records_and_peaks_go_with_the_file(app, show):
+    path = make_file(app, 'Morning_Drive/2024/01/old.wav', 100)
+    peaks = make_file(app, 'Morning_Drive/2024/01/old.wav.peaks', 100)
+    processed_file = record(path, show, peaks)
+    
+    report = run_retention(now=NOW)
+    
+    assert report['records_expired'] == 1
+    assert report['orphaned_peaks'] == 0
+    assert not os.path.exists(peaks)
+    db.session.refresh(processed_file)
+    assert processed_file.expired_at is not None
+    assert processed_file.peaks_filename is None
+
+def test_renamed_show_keeps_its_period_for_the_old_folder(app, show):
+    path = make_file(app, 'Morning_Drive/2024/01/Morning_Drive_20240105.wav', 60)
+    record(path, show)
+    show.name = 'Breakfast Show'
+    db.session.commit()
+    
+    policies = get_retention_policies(30, app.config['PROCESSED_FOLDER'])
+    assert policies['Breakfast_Show'] == 90
+    assert policies['Morning_Drive'] == 90
+    
+    run_retention(now=NOW)
+    assert os.path.exists(path)
+
+def test_stale_partials_are_removed(app):
+    stale = make_file(app, '_unsorted/2024/01/crashed.wav.partial', 2)
+    rendering = make_file(app, '_unsorted/2024/01/rendering.wav.partial', 0)
+    
+    run_retention(now=NOW)
+    
+    assert not os.path.exists(stale)
+    assert os.path.exists(rendering)
+
+def test_orphaned_peaks_are_removed(app, show):
+    peaks = make_file(app, 'Morning_Drive/2024/01/deleted.wav.peaks', 1)
+    processed_file = record(peaks[:-len('.peaks')], show, peaks)
+    
+    report = run_retention(now=NOW)
+    
+    assert report['orphaned_peaks'] == 1
+    assert not os.path.exists(peaks)
+    db.session.refresh(processed_file)
+    assert processed_file.peaks_filename is None
+    # The audio wasn't removed by the sweep, so the record isn't expired
+    assert processed_file.expired_at is None
+
+def test_dry_run_removes_nothing(app):
+    path = make_file(app, '_unsorted/2024/01/old.wav', 100)
+    
+    report = run_retention(dry_run=True, now=NOW)
+    
+    assert report['files'] == 1
+    assert os.path.exists(path)
@@ -0,0 +1,164 @@
+"""
+Tests for the job scheduler (app/scheduler.py)
+
+Jobs must be claimed in deadline order, and a job must only ever be
+claimed by one worker, however many are asking at once. A worker that
+stops renewing its lease loses the job to the next one. These tests use
+a database file rather than the in-memory one, so that every thread has
+a real, separate connection.
+"""
+
+import threading
+from datetime import date, datetime, time, timedelta
+import pytest
+
+from app import create_app, db
+from app.models import ProcessingJob, Show
+from app.scheduler import (compute_deadline, get_queue, claim_next_job, renew_lease,
+                           requeue_expired, Heartbeat)
+from config import TestingConfig
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def add_job(name, deadline=None, urgent=False, created_at=None):
+    job = ProcessingJob(filename=name, input_path=f"/uploads/{name}", deadline=deadline,
+                        urgent=urgent, created_at=created_at or datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def test_deadline_uses_the_show_air_time(app):
+    show = Show(name='Evening News', air_time=time(18, 30))
+    lead = timedelta(minutes=app.config['JOB_DEADLINE_LEAD_MINUTES'])
+    
+    assert compute_deadline(show, date(2024, 1, 5), app.config) == \
+        datetime(2024, 1, 5, 18, 30) - lead
+    assert compute_deadline(None, date(2024, 1, 5), app.config) == \
+        datetime(2024, 1, 5, 6, 0) - lead
+    assert compute_deadline(show, None, app.config) is None
+
+def test_queue_order(app):
+    now = datetime.utcnow()
+    add_job('no_deadline_old.wav', created_at=now - timedelta(hours=2))
+    add_job('no_deadline_new.wav', created_at=now - timedelta(hours=1))
+    add_job('later.wav', deadline=now + timedelta(days=2))
+    add_job('sooner.wav', deadline=now + timedelta(hours=3))
+    add_job('urgent.wav', urgent=True)
+    
+    assert [job.filename for job in get_queue()] == [
+        'urgent.wav', 'sooner.wav', 'later.wav', 'no_deadline_old.wav', 'no_deadline_new.wav'
+    ]
+
+def test_claim_takes_the_most_pressing_job(app):
+    now = datetime.utcnow()
+    add_job('later.wav', deadline=now + timedelta(days=2))
+    add_job('sooner.wav', deadline=now + timedelta(hours=3))
+    
+    job = claim_next_job('worker-a')
+    assert job.filename == 'sooner.wav'
+    assert job.status == 'processing'
+    assert job.worker_id == 'worker-a'
+    assert job.attempts == 1
+    
+    assert claim_next_job('worker-b').filename == 'later.wav'
+    assert claim_next_job('worker-c') is None
+
+def test_claim_skips_jobs_already_taken(app):
+    taken = add_job('taken.wav', urgent=True)
+    add_job('free.wav')
+    
+    # Another process has already claimed the urgent job
+    ProcessingJob.query.filter_by(id=taken.id).update({'status': 'processing'})
+    db.session.commit()
+    
+    assert claim_next_job('worker-a').filename == 'free.wav'
+
+def test_concurrent_claims_never_share_a_job(app):
+    for number in range(30):
+        add_job(f"show_{number}.wav")
+    
+    claimed = []
+    errors = []
+    start = threading.Barrier(6)
+    
+    def worker(number):
+        with app.app_context():
+            try:
+                start.wait()
+                while True:
+                    job = claim_next_job(f"worker-{number}")
+                    if job is None:
+                        break
+                    claimed.append(job.id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+    
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    assert sorted(claimed) == sorted(job.id for job in ProcessingJob.query.all())
+    assert ProcessingJob.query.filter_by(attempts=1).count() == 30
+
+def test_only_the_holder_renews_a_lease(app):
+    job = add_job('show.wav')
+    claim_next_job('worker-a', lease_seconds=60)
+    first_expiry = db.session.get(ProcessingJob, job.id).lease_expires_at
+    
+    assert renew_lease(job.id, 'worker-a', 600)
+    assert not renew_lease(job.id, 'worker-b', 600)
+    db.session.expire_all()
+    assert db.session.get(ProcessingJob, job.id).lease_expires_at > first_expiry
+
+def test_expired_lease_is_requeued_and_the_old_worker_loses_it(app):
+    job = add_job('show.wav')
+    claim_next_job('worker-a', lease_seconds=60)
+    
+    # Still leased: nothing happens
+    assert requeue_expired() == (0, 0)
+    
+    later = datetime.utcnow() + timedelta(minutes=5)
+    assert requeue_expired(now=later) == (1, 0)
+    db.session.expire_all()
+    job = db.session.get(ProcessingJob, job.id)
+    assert job.status == 'queued'
+    assert job.worker_id is None
+    
+    # The stalled worker wakes up to find the job gone
+    assert not renew_lease(job.id, 'worker-a', 60)
+    assert claim_next_job('worker-b').attempts == 2
+
+def test_job_that_keeps_stalling_is_failed(app):
+    job = add_job('crashes_workers.wav')
+    for attempt in range(3):
+        claim_next_job(f"worker-{attempt}", lease_seconds=60)
+        requeued, failed = requeue_expired(max_attempts=3, now=datetime.utcnow() + timedelta(minutes=5))
+    
+    assert (requeued, failed) == (0, 1)
+    db.session.expire_all()
+    job = db.session.get(ProcessingJob, job.id)
+    assert job.status == 'failed'
+    assert '3 attempts' in job.error_message
+
+def test_heartbeat_notices_a_lost_lease(app):
+    job = add_job('show.wav')
+    claim_next_job('worker-a', lease_seconds=60)
+    app.config['WORKER_HEARTBEAT_SECONDS'] = 0.05
+    
+    with Heartbeat(app, job.id, 'worker-a') as heartbeat:
+        # Another worker takes the job over
+        ProcessingJob.query.filter_by(id=job.id).update({'worker_id': 'worker-b'})
+        db.session.commit()
+        assert heartbeat.lost.wait(5)
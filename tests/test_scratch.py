@@ -0,0 +1,78 @@
+"""
+Tests for the scratch space (app/scratch.py)
+"""
+
+import os
+import pytest
+
+from app.scratch import ScratchSpace, estimate_scratch_bytes, move_to_storage, ESTIMATE_MARGIN
+
+# Higher than any PID Linux hands out
+DEAD_PID = 2 ** 22 + 1
+
+def test_jobs_over_the_budget_spill(tmp_path):
+    space = ScratchSpace(str(tmp_path), budget_bytes=1000)
+    
+    first = space.reserve(600)
+    assert first is not None
+    assert space.reserve(600) is None
+    second = space.reserve(400)
+    assert second is not None
+    assert space.usage()['reserved_bytes'] == 1000
+    assert space.usage()['spills'] == 1
+    
+    first.close()
+    first.close()
+    assert space.usage()['reserved_bytes'] == 400
+
+def test_jobs_spill_when_the_disk_is_nearly_full(tmp_path):
+    space = ScratchSpace(str(tmp_path), budget_bytes=1000, min_free_bytes=10 ** 15)
+    assert space.reserve(1) is None
+
+def test_lease_folder_is_removed_however_the_job_ends(tmp_path):
+    space = ScratchSpace(str(tmp_path / 'scratch'), budget_bytes=10000)
+    upload = tmp_path / 'AIG_100424.wav'
+    upload.write_bytes(b'audio' * 100)
+    
+    with pytest.raises(RuntimeError):
+        with space.reserve(1000) as lease:
+            staged = lease.stage_input(str(upload))
+            assert os.path.basename(staged) == 'AIG_100424.wav'
+            assert open(staged, 'rb').read() == upload.read_bytes()
+            raise RuntimeError('render failed')
+    
+    assert os.listdir(tmp_path / 'scratch') == []
+    assert space.usage()['reserved_bytes'] == 0
+
+def test_outputs_are_moved_into_place(tmp_path):
+    space = ScratchSpace(str(tmp_path / 'scratch'), budget_bytes=10000)
+    final_path = tmp_path / 'processed' / 'show.mp3'
+    final_path.parent.mkdir()
+    
+    with space.reserve(1000) as lease:
+        output = lease.path('show.mp3')
+        with open(output, 'wb') as f:
+            f.write(b'encoded')
+        move_to_storage(output, str(final_path))
+        assert not os.path.exists(output)
+    
+    assert final_path.read_bytes() == b'encoded'
+    assert os.listdir(final_path.parent) == ['show.mp3']
+
+def test_folders_of_dead_processes_are_cleaned_up(tmp_path):
+    for name in (f'{DEAD_PID}-abc', f'{os.getpid()}-def', 'notes'):
+        (tmp_path / name).mkdir()
+    
+    ScratchSpace(str(tmp_path), budget_bytes=1000)
+    assert sorted(os.listdir(tmp_path)) == [f'{os.getpid()}-def', 'notes']
+
+def test_estimate():
+    info = {'duration': 3600, 'size': 1000}
+    mp3 = {'format': 'mp3', 'bitrate': 128}
+    wav = {'format': 'wav', 'sample_rate': 48000, 'channels': 2, 'bit_depth': 24}
+    
+    assert estimate_scratch_bytes(info, [mp3]) == int((1000 + 3600 * 16000) * ESTIMATE_MARGIN)
+    assert estimate_scratch_bytes(info, [mp3], stage_input=False) == int(3600 * 16000 * ESTIMATE_MARGIN)
+    # A segmented PCM render holds its segments and the joined output
+    assert estimate_scratch_bytes(info, [wav], stage_input=False, segmented=True) == \
+        int(2 * 3600 * 288000 * ESTIMATE_MARGIN)
@@ -0,0 +1,88 @@
+"""
+Tests for silence detection (app/silence.py)
+
+Each test file is dead air, then a tone, then dead air again, so the
+trim points are known in advance. WAV files are read directly; the FLAC
+test decodes through FFmpeg and is skipped where it isn't installed.
+"""
+
+import shutil
+import subprocess
+import wave
+import numpy as np
+import pytest
+
+from app.silence import find_trim_points
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='FFmpeg is not installed')
+
+SAMPLE_RATE = 44100
+
+def make_wav(path, lead, tone, tail, sample_width=2, channels=2):
+    """Write lead seconds of silence, tone seconds of 440Hz and tail seconds of silence"""
+    t = np.arange(int(tone * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = np.concatenate((np.zeros(int(lead * SAMPLE_RATE)),
+                             0.5 * np.sin(2 * np.pi * 440 * t),
+                             np.zeros(int(tail * SAMPLE_RATE))))
+    frames = np.repeat(signal[:, None], channels, axis=1)
+    
+    scaled = np.round(frames * (2 ** (8 * sample_width - 1) - 1)).astype('<i4')
+    # Keep the low sample_width bytes of each little-endian int32
+    raw = scaled.view(np.uint8).reshape(-1, 4)[:, :sample_width].tobytes()
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(sample_width)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(raw)
+    return str(path)
+
+@pytest.mark.parametrize('sample_width', [2, 3, 4])
+def test_trims_both_ends_of_a_wav(tmp_path, sample_width):
+    path = make_wav(tmp_path / 'show.wav', 2.0, 5.0, 3.0, sample_width)
+    
+    result = find_trim_points(path, pad_ms=250)
+    
+    assert result['success']
+    assert result['method'] == 'memmap'
+    assert result['duration'] == pytest.approx(10.0)
+    assert result['start'] == pytest.approx(1.75, abs=0.05)
+    assert result['end'] == pytest.approx(7.25, abs=0.05)
+
+def test_mono_wav(tmp_path):
+    path = make_wav(tmp_path / 'mono.wav', 1.0, 2.0, 1.0, channels=1)
+    result = find_trim_points(path, pad_ms=0)
+    assert result['start'] == pytest.approx(1.0, abs=0.05)
+    assert result['end'] == pytest.approx(3.0, abs=0.05)
+
+def test_silent_file_is_left_alone(tmp_path):
+    path = make_wav(tmp_path / 'silent.wav', 4.0, 0.0, 0.0)
+    result = find_trim_points(path)
+    assert result['success']
+    assert (result['start'], result['end']) == (0.0, pytest.approx(4.0))
+
+def test_only_the_scanned_region_is_trimmed(tmp_path):
+    # More dead air than the scan covers - trimming stops at the scan limit
+    path = make_wav(tmp_path / 'long_lead.wav', 5.0, 2.0, 5.0)
+    result = find_trim_points(path, max_scan_seconds=3, pad_ms=0)
+    assert result['start'] == pytest.approx(3.0, abs=0.05)
+    assert result['end'] == pytest.approx(9.0, abs=0.05)
+
+def test_compressed_file_needs_a_duration(tmp_path):
+    path = tmp_path / 'show.mp3'
+    path.write_bytes(b'\xff\xfb\x90\x00' * 100)
+    result = find_trim_points(str(path))
+    assert not result['success']
+    assert 'Duration is required' in result['error']
+
+@requires_ffmpeg
+def test_flac_is_decoded_with_ffmpeg(tmp_path):
+    wav = make_wav(tmp_path / 'show.wav', 2.0, 5.0, 3.0)
+    flac = str(tmp_path / 'show.flac')
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-i', wav, flac], check=True)
+    
+    result = find_trim_points(flac, pad_ms=0, duration=10.0)
+    
+    assert result['success']
+    assert result['method'] == 'ffmpeg'
+    assert result['start'] == pytest.approx(2.0, abs=0.06)
+    assert result['end'] == pytest.approx(7.0, abs=0.06)
@@ -0,0 +1,91 @@
+"""
+Tests for output naming (app/storage.py)
+
+claim_output_name hands out name, name_1, name_2 ... from a counter in
+the database. Two workers must never get the same name, and claiming a
+name must not commit whatever the caller has pending in its session.
+These tests use a database file rather than the in-memory one, so that
+every connection (and every thread) is a real, separate connection.
+"""
+
+import threading
+import pytest
+
+from app import create_app, db
+from app.models import Show, OutputSequence
+from app.storage import claim_output_name, get_upload_path
+from config import TestingConfig
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / 'processed' / 'Show' / '2024' / '01'
+    path.mkdir(parents=True)
+    return str(path)
+
+def test_names_are_numbered_in_order(app, folder):
+    names = [claim_output_name(folder, 'Show_20240105') for _ in range(4)]
+    assert names == ['Show_20240105', 'Show_20240105_1', 'Show_20240105_2', 'Show_20240105_3']
+
+def test_each_folder_has_its_own_counter(app, folder, tmp_path):
+    other = str(tmp_path / 'processed' / 'Show' / '2024' / '02')
+    assert claim_output_name(folder, 'Show') == 'Show'
+    assert claim_output_name(other, 'Show') == 'Show'
+    assert claim_output_name(folder, 'Show') == 'Show_1'
+
+def test_files_from_before_the_counter_are_skipped(app, folder):
+    for name in ('Show.wav', 'Show_1.mp3.partial', 'Show_2_web.mp3'):
+        open(f"{folder}/{name}", 'wb').close()
+    
+    assert claim_output_name(folder, 'Show', suffixes=('web',)) == 'Show_3'
+    # Once the counter exists the disk isn't looked at again
+    open(f"{folder}/Show_4.wav", 'wb').close()
+    assert claim_output_name(folder, 'Show') == 'Show_4'
+
+def test_concurrent_claims_are_unique(app, folder):
+    names = []
+    errors = []
+    start = threading.Barrier(8)
+    
+    def worker():
+        with app.app_context():
+            try:
+                start.wait()
+                for _ in range(10):
+                    names.append(claim_output_name(folder, 'Show'))
+            except Exception as e:
+                errors.append(e)
+    
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    assert len(names) == 80
+    assert len(set(names)) == 80
+    assert OutputSequence.query.one().next_value == 80
+
+def test_claim_leaves_the_session_alone(app, folder):
+    db.session.add(Show(name='Not Saved Yet'))
+    
+    claim_output_name(folder, 'Show')
+    db.session.rollback()
+    
+    assert Show.query.filter_by(name='Not Saved Yet').first() is None
+    assert OutputSequence.query.count() == 1
+
+def test_upload_paths_never_collide(tmp_path):
+    first = get_upload_path(str(tmp_path), 'Show_20240105.wav')
+    second = get_upload_path(str(tmp_path), 'Show_20240105.wav')
+    assert first != second
+    assert first.endswith('_Show_20240105.wav')
@@ -0,0 +1,107 @@
+"""
+Tests for processing templates (app/template_engine.py and the
+/api/templates endpoints)
+"""
+
+import json
+import pytest
+
+from app import create_app, db
+from app.models import ProcessingTemplate, ProcessingJob, Show
+from app.template_engine import (TemplateError, compile_template, get_compiled_template,
+                                 clear_template_cache)
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    # Template ids start again at 1 in every test database
+    clear_template_cache()
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def make_template(**settings):
+    values = {'name': 'Web MP3', 'output_format': 'mp3', 'sample_rate': 44100, 'bit_depth': 16,
+              'channels': 2, 'normalize': True, 'normalize_level': -1.0,
+              'remove_dc_offset': True, 'fade_in_ms': 500, 'fade_out_ms': 2000}
+    values.update(settings)
+    template = ProcessingTemplate(**values)
+    db.session.add(template)
+    db.session.commit()
+    return template
+
+def test_compiled_template(app):
+    compiled = compile_template(make_template())
+    
+    target = compiled.to_target()
+    assert target['format'] == 'mp3'
+    assert target['codec_args'] == ['-acodec', 'libmp3lame', '-b:a', '320k']
+    assert compiled.filter_chain(duration=60.0, normalize_filter='loudnorm=I=-16') == [
+        'highpass=f=5:poles=1',
+        'loudnorm=I=-16',
+        'afade=t=in:st=0:d=0.500',
+        'afade=t=out:st=58.000:d=2.000'
+    ]
+
+def test_fade_out_is_skipped_without_a_duration_and_capped_by_it(app):
+    compiled = compile_template(make_template(remove_dc_offset=False, fade_in_ms=0))
+    assert compiled.filter_chain() == []
+    assert compiled.filter_chain(duration=1.0) == ['afade=t=out:st=0.000:d=1.000']
+
+@pytest.mark.parametrize('settings', [
+    {'fade_in_ms': -1},
+    {'fade_out_ms': 120000},
+    {'output_format': 'ogg'},
+    {'sample_rate': 12345}
+])
+def test_invalid_templates_are_rejected(app, settings):
+    with pytest.raises(TemplateError):
+        compile_template(make_template(**settings))
+
+def test_compiled_once_per_version(app):
+    template = make_template()
+    first = get_compiled_template(template)
+    assert get_compiled_template(template) is first
+    
+    template.fade_in_ms = 0
+    db.session.commit()
+    assert template.version == 2
+    second = get_compiled_template(template)
+    assert second is not first
+    assert second.fade_in_ms == 0
+
+def test_create_and_update_through_the_api(client):
+    response = client.post('/api/templates', json={'name': 'Archive', 'output_format': 'flac'})
+    assert response.status_code == 201
+    template = response.get_json()
+    assert template['version'] == 1
+    
+    response = client.put(f"/api/templates/{template['id']}", json={'fade_in_ms': 100})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
+    
+    response = client.put(f"/api/templates/{template['id']}", json={'fade_in_ms': -5})
+    assert response.status_code == 400
+
+def test_template_in_use_is_not_deleted(app, client):
+    template = make_template()
+    db.session.add(ProcessingJob(filename='show.wav', input_path='/uploads/show.wav',
+                                 processing_options=json.dumps({'template_id': template.id})))
+    db.session.commit()
+    
+    response = client.delete(f"/api/templates/{template.id}")
+    assert response.status_code == 400
+    assert 'queued jobs' in response.get_json()['error']
+    
+    ProcessingJob.query.update({'status': 'completed'})
+    show = Show.query.first()
+    show.template_id = template.id
+    db.session.commit()
+    assert 'shows' in client.delete(f"/api/templates/{template.id}").get_json()['error']
+    
+    show.template_id = None
+    db.session.commit()
+    assert client.delete(f"/api/templates/{template.id}").status_code == 200
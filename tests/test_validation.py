@@ -0,0 +1,133 @@
+"""
+Tests for the upload header sniff (app/validation.py)
+
+The sniff runs on every upload, so it has to reject files that aren't
+audio, pass good files cleanly and flag odd ones as suspicious for the
+full decode check. The files here are built by hand, byte by byte.
+"""
+
+import struct
+import wave
+import pytest
+
+from app.validation import sniff_audio_header, should_deep_check
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417 byte frames
+MP3_FRAME = b'\xff\xfb\x90\x00' + bytes(413)
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def make_wav(tmp_path, name='tone.wav', frames=4410):
+    path = tmp_path / name
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(44100)
+        f.writeframes(bytes(frames * 4))
+    return str(path)
+
+def id3_tag(size):
+    """An ID3v2.3 tag header followed by size bytes of padding"""
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b'ID3\x03\x00\x00' + syncsafe + bytes(size)
+
+def flac_header(sample_rate=44100, channels=2):
+    streaminfo = bytearray(34)
+    streaminfo[10] = (sample_rate >> 12) & 0xFF
+    streaminfo[11] = (sample_rate >> 4) & 0xFF
+    streaminfo[12] = ((sample_rate & 0x0F) << 4) | ((channels - 1) << 1)
+    return b'fLaC' + b'\x80' + (34).to_bytes(3, 'big') + bytes(streaminfo)
+
+def test_good_wav(tmp_path):
+    result = sniff_audio_header(make_wav(tmp_path))
+    assert result['valid']
+    assert result['format'] == 'wav'
+    assert not result['suspicious']
+
+def test_truncated_wav_is_suspicious(tmp_path):
+    path = make_wav(tmp_path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    result = sniff_audio_header(write(tmp_path, 'cut.wav', data[:len(data) // 2]))
+    assert result['valid']
+    assert result['suspicious']
+    assert any('truncated' in reason for reason in result['reasons'])
+
+def test_wav_with_bad_sample_rate_is_rejected(tmp_path):
+    path = make_wav(tmp_path)
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    # fmt chunk: sample rate follows format tag and channel count
+    data[24:28] = struct.pack('<I', 1)
+    result = sniff_audio_header(write(tmp_path, 'bad.wav', bytes(data)))
+    assert not result['valid']
+    assert 'sample rate' in result['error']
+
+def test_mp3_with_id3_tag(tmp_path):
+    result = sniff_audio_header(write(tmp_path, 'show.mp3', id3_tag(100) + MP3_FRAME * 4))
+    assert result['valid']
+    assert result['format'] == 'mp3'
+    assert not result['suspicious']
+
+def test_mp3_without_tag(tmp_path):
+    result = sniff_audio_header(write(tmp_path, 'show.mp3', MP3_FRAME * 4))
+    assert result['valid']
+    assert not result['suspicious']
+
+def test_untagged_mp3_with_leading_junk_is_suspicious(tmp_path):
+    result = sniff_audio_header(write(tmp_path, 'show.mp3', b'junk' * 10 + MP3_FRAME * 4))
+    assert result['valid']
+    assert result['format'] == 'mp3'
+    assert result['suspicious']
+    assert "Junk data before the first MPEG frame" in result['reasons']
+
+def test_mp3_with_broken_frame_chain_is_suspicious(tmp_path):
+    result = sniff_audio_header(write(tmp_path, 'show.mp3', MP3_FRAME + bytes(500)))
+    assert result['valid']
+    assert "Second MPEG frame is not where the first one says" in result['reasons']
+
+def test_id3_tag_with_no_audio_is_rejected(tmp_path):
+    result = sniff_audio_header(write(tmp_path, 'show.mp3', id3_tag(100) + bytes(2000)))
+    assert not result['valid']
+    assert result['error'] == "No MPEG audio frames found"
+
+def test_flac(tmp_path):
+    result = sniff_audio_header(write(tmp_path, 'show.flac', flac_header() + bytes(100)))
+    assert result['valid']
+    assert result['format'] == 'flac'
+    assert not result['suspicious']
+    
+    result = sniff_audio_header(write(tmp_path, 'bad.flac', flac_header(sample_rate=100) + bytes(100)))
+    assert not result['valid']
+
+def test_misleading_extension_is_suspicious(tmp_path):
+    result = sniff_audio_header(write(tmp_path, 'show.wav', flac_header() + bytes(100)))
+    assert result['valid']
+    assert result['format'] == 'flac'
+    assert result['suspicious']
+
+@pytest.mark.parametrize('data,error', [
+    (b'', "File is empty"),
+    (b'Not audio at all, just some text\n' * 20, "Not a recognised audio file")
+])
+def test_not_audio_is_rejected(tmp_path, data, error):
+    result = sniff_audio_header(write(tmp_path, 'upload.mp3', data))
+    assert not result['valid']
+    assert result['error'] == error
+
+def test_missing_file(tmp_path):
+    result = sniff_audio_header(str(tmp_path / 'gone.wav'))
+    assert not result['valid']
+    assert result['error'].startswith("Could not read file")
+
+@pytest.mark.parametrize('mode,suspicious,expected', [
+    ('always', False, True),
+    ('suspicious', True, True),
+    ('suspicious', False, False),
+    ('never', True, False)
+])
+def test_should_deep_check(mode, suspicious, expected):
+    assert should_deep_check({'suspicious': suspicious}, mode) is expected
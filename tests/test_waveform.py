@@ -0,0 +1,96 @@
+"""
+Tests for peak files (app/waveform.py)
+
+read_peaks_range must never hand the browser more than max_buckets pairs,
+must stay inside the file's duration, and must agree with the peaks the
+builder saw in the audio.
+"""
+
+import numpy as np
+import pytest
+
+from app.waveform import PeakBuilder, write_peaks_file, read_peaks_header, read_peaks_range
+
+SAMPLE_RATE = 8000
+SECONDS = 90
+
+@pytest.fixture
+def peaks_file(tmp_path):
+    """A 90 second ramp from -1 to 1, fed in odd sized chunks"""
+    samples = np.linspace(-1.0, 1.0, SAMPLE_RATE * SECONDS, dtype=np.float32)
+    data = samples.astype('<f4').tobytes()
+    
+    builder = PeakBuilder(sample_rate=SAMPLE_RATE)
+    for offset in range(0, len(data), 12347):
+        builder.feed(data[offset:offset + 12347])
+    
+    path = str(tmp_path / 'show.wav.peaks')
+    write_peaks_file(path, builder)
+    return path
+
+def test_header_describes_the_stream(peaks_file):
+    header = read_peaks_header(peaks_file)
+    assert header['total_samples'] == SAMPLE_RATE * SECONDS
+    assert header['duration'] == SECONDS
+    # 100 buckets a second at the finest level
+    assert header['levels'][0]['bucket_count'] == SECONDS * 100
+
+def test_whole_file_covers_the_ramp(peaks_file):
+    result = read_peaks_range(peaks_file, max_buckets=500)
+    peaks = result['peaks']
+    assert 0 < len(peaks) // 2 <= 500
+    assert peaks[0] == -32767
+    assert peaks[-1] == 32767
+    assert result['start'] == 0
+    assert result['end'] == SECONDS
+
+@pytest.mark.parametrize('start,end,max_buckets', [
+    (0, None, 1),
+    (0, None, 7),
+    (0.005, 0.015, 1),
+    (10.001, 10.029, 2),
+    (3.3, 77.7, 333),
+    (0, None, 1000)
+])
+def test_never_more_than_max_buckets(peaks_file, start, end, max_buckets):
+    result = read_peaks_range(peaks_file, start, end, max_buckets=max_buckets)
+    buckets = len(result['peaks']) // 2
+    assert 0 < buckets <= max_buckets
+    # The buckets cover the range (the last one may be cut short by the file)
+    assert buckets * result['seconds_per_bucket'] >= \
+        result['end'] - result['start'] - result['seconds_per_bucket']
+
+def test_range_is_clamped_to_the_file(peaks_file):
+    result = read_peaks_range(peaks_file, start=-5, end=SECONDS + 100)
+    assert result['start'] == 0
+    assert result['end'] == SECONDS
+    
+    past_the_end = read_peaks_range(peaks_file, start=SECONDS + 10)
+    assert past_the_end['end'] <= SECONDS
+    assert past_the_end['peaks'] == []
+
+def test_end_never_passes_duration_on_a_partial_bucket(tmp_path):
+    # 2.5 buckets at the finest level, so every level ends in a partial bucket
+    builder = PeakBuilder(sample_rate=SAMPLE_RATE)
+    builder.feed(np.full(200, 0.5, dtype='<f4').tobytes())
+    path = str(tmp_path / 'short.peaks')
+    write_peaks_file(path, builder)
+    
+    result = read_peaks_range(path, max_buckets=1)
+    assert result['end'] == 200 / SAMPLE_RATE
+    assert len(result['peaks']) == 2
+
+def test_slice_matches_the_audio(peaks_file):
+    # The ramp crosses zero at the midpoint
+    result = read_peaks_range(peaks_file, SECONDS / 2 - 0.01, SECONDS / 2 + 0.01, max_buckets=10)
+    pairs = np.array(result['peaks']).reshape(-1, 2)
+    assert result['seconds_per_bucket'] == 0.01
+    assert pairs[0, 0] < 0 < pairs[-1, 1]
+    assert np.abs(pairs).max() < 32767 * 0.001
+
+def test_empty_stream(tmp_path):
+    path = str(tmp_path / 'empty.peaks')
+    write_peaks_file(path, PeakBuilder(sample_rate=SAMPLE_RATE))
+    result = read_peaks_range(path)
+    assert result['peaks'] == []
+    assert result['seconds_per_bucket'] is None